@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # CardView benchmarks need no display
+
+import cardlib
+from cardlib import *
+
+BASELINE_VERSION = 1
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# Seven card example hands for each HandRank, written as value+suit ('T' is 10)
+CATEGORY_HANDS = {
+    HandRank.get_highest_card: ['AH JS 9C 7D 5H 3S 2C', 'KD QS 9H 8C 6D 4S 2H'],
+    HandRank.get_one_pairs: ['AH AS 9C 7D 5H 3S 2C', '8D 8S KH QC 6D 4S 2H'],
+    HandRank.get_two_pairs: ['AH AS 9C 9D 5H 3S 2C', '8D 8S KH KC 6D 6S 2H'],
+    HandRank.get_three_of_a_kind: ['AH AS AC 7D 5H 3S 2C', '8D 8S 8H QC 6D 4S 2H'],
+    HandRank.get_straight: ['AH KS QC JD TH 3S 2C', '5D 4S 3H 2C AD KS 9H'],
+    HandRank.get_flush: ['AH JH 9H 7H 5H 3S 2C', 'KD QD 9D 8D 6D 4S 2H'],
+    HandRank.get_full_house: ['AH AS AC 7D 7H 3S 2C', '8D 8S 8H QC QD 4S 2H'],
+    HandRank.get_four_of_a_kind: ['AH AS AC AD 5H 3S 2C', '8D 8S 8H 8C 6D 4S 2H'],
+    HandRank.get_straight_flush: ['AH KH QH JH TH 3S 2C', '5D 4D 3D 2D AD KS 9H'],
+}
+
+
+def parse_cards(text):
+    """turns 'AH KS TD' into cards"""
+    values = {'T': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14}
+    suits = {'H': Suit.Hearts, 'S': Suit.Spades, 'C': Suit.Clubs, 'D': Suit.Diamonds}
+    return [card_from_code(card_code(values.get(word[:-1]) or int(word[:-1]), suits[word[-1]]))
+            for word in text.split()]
+
+
+def bench_poker_hand(rank):
+    """PokerHand construction for hands of one category"""
+    hands = [parse_cards(text) for text in CATEGORY_HANDS[rank]]
+    assert all(PokerHand(hand).rank == rank for hand in hands)
+
+    def run():
+        for hand in hands:
+            PokerHand(hand)
+        return len(hands)
+    return run
+
+
+def bench_poker_hand_cached():
+    """PokerHand construction through a warm strength cache"""
+    hands = [parse_cards(text) for texts in CATEGORY_HANDS.values() for text in texts]
+
+    def run():
+        saved = cardlib.strength_cache
+        cardlib.strength_cache = cache
+        try:
+            for hand in hands:
+                PokerHand(hand)
+        finally:
+            cardlib.strength_cache = saved
+        return len(hands)
+    cache = StrengthCache()
+    run()
+    return run
+
+
+def bench_make_deck():
+    deck = StandardDeck(1)
+
+    def run():
+        for _ in range(100):
+            deck.make_deck()
+        return 100
+    return run
+
+
+def bench_shuffle():
+    deck = StandardDeck(1)
+
+    def run():
+        for _ in range(100):
+            deck.make_deck()
+            deck.shuffle()
+        return 100
+    return run
+
+
+def bench_draw():
+    deck = StandardDeck(1)
+
+    def run():
+        deck.make_deck()
+        for _ in range(52):
+            deck.draw()
+        return 52
+    return run
+
+
+def bench_game_hand():
+    """one full hand of GameModel, from the blinds to the showdown, every action a call"""
+    from pokermodel import GameModel, PlayerModel, TableModel
+    players = [PlayerModel("P1", 10 ** 9), PlayerModel("P2", 10 ** 9)]
+    game = GameModel(players, TableModel(), rng=1)
+
+    def run():
+        for _ in range(20):
+            while game.pot_money:
+                game.call_bet()
+            game.restart_game()
+        return 20
+    return run
+
+
+def bench_card_view(cards):
+    """redrawing a CardView holding a number of cards"""
+    import pokerview
+    from pokermodel import HandModel
+    app = pokerview.application()
+    hand = HandModel()
+    for card in DECK_ORDER[:cards]:
+        hand.add_card(card)
+    view = pokerview.CardView(hand)
+    view.resize(400, 200)
+    view.show()
+
+    def run():
+        for _ in range(10):
+            hand.flip()
+            app.processEvents()  # paint
+        return 10
+    run.view = view  # keep the view alive
+    return run
+
+
+def bench_table(visible):
+    """one hand of a table shown in a GameWindow, every action a call; hidden tables skip redrawing the cards"""
+    import pokerview
+    from pokermodel import GameModel, PlayerModel, TableModel
+    app = pokerview.application()
+    players = [PlayerModel("P1", 10 ** 9), PlayerModel("P2", 10 ** 9)]
+    game = GameModel(players, TableModel(), rng=1, batching=True)
+    window = pokerview.GameWindow(game)
+    game.state_changed.disconnect(window.show_messages)  # no end of hand dialog
+    window.resize(800, 400)
+    window.setVisible(visible)
+
+    def run():
+        for _ in range(5):
+            while game.pot_money:
+                game.call_bet()
+                app.processEvents()  # paint
+            game.restart_game()
+        return 5
+    run.window = window
+    return run
+
+
+def make_benchmarks():
+    """returns {name: factory}; a factory sets up and returns a function running some operations"""
+    benchmarks = {}
+    for rank in HandRank:
+        benchmarks['cardlib.PokerHand.{}'.format(rank.name)] = lambda rank=rank: bench_poker_hand(rank)
+    benchmarks['cardlib.PokerHand.cached'] = bench_poker_hand_cached
+    benchmarks['cardlib.StandardDeck.make_deck'] = bench_make_deck
+    benchmarks['cardlib.StandardDeck.shuffle'] = bench_shuffle
+    benchmarks['cardlib.StandardDeck.draw'] = bench_draw
+    benchmarks['pokermodel.GameModel.hand'] = bench_game_hand
+    benchmarks['pokerview.CardView.hand_redraw'] = lambda: bench_card_view(2)
+    benchmarks['pokerview.CardView.table_redraw'] = lambda: bench_card_view(5)
+    benchmarks['pokerview.GameWindow.hand'] = lambda: bench_table(True)
+    benchmarks['pokerview.GameWindow.hidden_hand'] = lambda: bench_table(False)
+    return benchmarks
+
+
+def measure(run, min_time=0.2, repeat=5):
+    """returns the best time per operation in seconds over a few repeats of at least min_time each"""
+    best = None
+    for _ in range(repeat):
+        ops = 0
+        start = time.perf_counter()
+        while True:
+            ops += run()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_op = elapsed / ops
+        best = per_op if best is None else min(best, per_op)
+    return best
+
+
+def run_benchmarks(selected=None, min_time=0.2, repeat=5):
+    """runs the benchmarks whose name contains `selected` and returns {name: seconds per operation}"""
+    results = {}
+    for name, factory in make_benchmarks().items():
+        if selected and selected not in name:
+            continue
+        results[name] = measure(factory(), min_time, repeat)
+        print("{:45s} {:12.3f} us".format(name, results[name] * 1e6), flush=True)
+    return results
+
+
+def save_baseline(results, path):
+    data = {'version': BASELINE_VERSION, 'python': platform.python_version(), 'machine': platform.machine(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def compare(results, path, threshold):
+    """
+    compares results with a stored baseline
+
+    :param threshold: allowed slowdown, 0.1 for 10%
+    :return: the names of the benchmarks that regressed
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError("{} is not a version {} benchmark baseline".format(path, BASELINE_VERSION))
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print("{:45s} new".format(name))
+            continue
+        ratio = seconds / base
+        flag = ratio > 1 + threshold
+        if flag:
+            regressions.append(name)
+        print("{:45s} {:8.2f}x {}".format(name, ratio, "REGRESSION" if flag else "ok"))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for cardlib, GameModel and CardView")
+    parser.add_argument('-k', '--select', help="only run benchmarks whose name contains this text")
+    parser.add_argument('--save', metavar='FILE', nargs='?', const=DEFAULT_BASELINE, help="store a baseline")
+    parser.add_argument('--compare', metavar='FILE', nargs='?', const=DEFAULT_BASELINE,
+                        help="compare with a baseline and exit with status 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed slowdown when comparing (0.1 = 10%%)")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per repeat")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.select, args.min_time, args.repeat)
+    if args.save:
+        save_baseline(results, args.save)
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
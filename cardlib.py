@@ -1,7 +1,16 @@
 import abc
 import enum
-from random import shuffle
-from collections import Counter  
+import os
+import pickle
+import random
+import time
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by the batch evaluator
+    np = None
 
 
 class Suit(enum.Enum):
@@ -34,46 +43,50 @@ class Suit(enum.Enum):
             return "\u2666"
 
 
+# A card is coded as one small integer: the value (2-14) minus two in the high bits and the suit in the
+# two low bits, so code >> RANK_SHIFT is the rank index and code & SUIT_MASK the suit index. A set of
+# cards fits in a 52 bit mask with bit `code` set for each card.
+RANK_SHIFT = 2
+SUIT_MASK = 0b11
+
+
+def card_code(value, suit: Suit):
+    """returns the integer code (0-51) of the card with the given value(2-14) and suit"""
+    return ((value - 2) << RANK_SHIFT) | (suit.value - 1)
+
+
 class PlayingCard(metaclass=abc.ABCMeta):
-    """Superclass for all cards in the deck"""
+    """Superclass for all cards in the deck.
 
-    def __init__(self, suit: Suit):
-        self.suit = suit
+    There is only one instance of each of the 52 cards: calling a card class returns the shared instance."""
+    __slots__ = ('value', 'suit', 'code', 'mask')
 
-    def __str__(self):
-        """this method is called when print() is executed"""
+    def __init__(self, *args):
+        """cards are set up once by _make_card, nothing to do here"""
 
-    @abc.abstractmethod
     def get_value(self):
-        """ returns value from 2 to 10 for card value"""
+        """ returns value from 2 to 14 for card value"""
+        return self.value
 
-    @abc.abstractmethod
-    def suit(self):
-        """returns suit of card"""
+    def __reduce__(self):
+        """pickles the card as its code, so unpickling returns the shared instance"""
+        return card_from_code, (self.code,)
 
     def __eq__(self, other):
         """ checks whether card(s) in self are comparable to other card(s)"""
-        return self.get_value() == other.get_value()
+        return self.value == other.value
 
     def __lt__(self, other):  # We only check the magnitude:
         """ checks whether card(s) in self are less than other card(s)"""
-        return self.get_value() < other.get_value()
+        return self.value < other.value
 
 
 class NumberedCard(PlayingCard):
     """Creates a Numbered card. Takes a number(2-10) and suit as input"""
+    __slots__ = ()
 
-    def __init__(self, value: int, suit: Suit):
-        super().__init__(suit)
-        self.value = value
-
-    def get_value(self):
-        """ returns from 2 to 10 for card value"""
-        return self.value
-
-    def suit(self):
-        """returns suit of card"""
-        return self.suit
+    def __new__(cls, value: int, suit: Suit):
+        return CARDS[card_code(value, suit)]
 
     def __str__(self):
         return "{} of {}".format(self.value, self.suit)
@@ -84,17 +97,10 @@ class NumberedCard(PlayingCard):
 
 class JackCard(PlayingCard):
     """Creates a Jack card. Takes a suit as input"""
+    __slots__ = ()
 
-    def __init__(self, suit: Suit):
-        super().__init__(suit)
-
-    def get_value(self):
-        """ returns from 2 to 10 for card value"""
-        return 11
-
-    def suit(self):
-        """returns suit of card"""
-        return self.suit
+    def __new__(cls, suit: Suit):
+        return CARDS[card_code(11, suit)]
 
     def __str__(self):
         return "Jack of {}".format(self.suit)
@@ -105,18 +111,10 @@ class JackCard(PlayingCard):
 
 class KingCard(PlayingCard):
     """Creates a King card. Takes a suit as input"""
+    __slots__ = ()
 
-    def __init__(self, suit: Suit):
-        super().__init__(suit)
-
-    def get_value(self):
-        """ returns from 2 to 10 for card value"""
-        # This is called them you do:   a = x[i]
-        return 13
-
-    def suit(self):
-        """returns suit of card"""
-        return self.suit
+    def __new__(cls, suit: Suit):
+        return CARDS[card_code(13, suit)]
 
     def __str__(self):
         return "King of {}".format(self.suit)
@@ -127,18 +125,10 @@ class KingCard(PlayingCard):
 
 class QueenCard(PlayingCard):
     """Creates a Queen card. Takes a suit as input"""
+    __slots__ = ()
 
-    def __init__(self, suit: Suit):
-        super().__init__(suit)
-
-    def get_value(self):
-        """ returns from 2 to 10 for card value"""
-        # This is called them you do:   a = x[i]
-        return 12
-
-    def suit(self):
-        """returns suit of card"""
-        return self.suit
+    def __new__(cls, suit: Suit):
+        return CARDS[card_code(12, suit)]
 
     def __str__(self):
         return "Queen of {}".format(self.suit)
@@ -149,17 +139,10 @@ class QueenCard(PlayingCard):
 
 class AceCard(PlayingCard):
     """Creates an Ace card. Takes a suit as input"""
+    __slots__ = ()
 
-    def __init__(self, suit: Suit):
-        super().__init__(suit)
-
-    def get_value(self):
-        """ returns from 2 to 10 for card value"""
-        return 14
-
-    def suit(self):
-        """returns suit of card"""
-        return self.suit
+    def __new__(cls, suit: Suit):
+        return CARDS[card_code(14, suit)]
 
     def __str__(self):
         return "Ace of {}".format(self.suit)
@@ -168,35 +151,119 @@ class AceCard(PlayingCard):
         return "Ace of {}".format(self.suit)
 
 
+def _make_card(value, suit):
+    """creates the single shared instance of a card"""
+    card_class = {11: JackCard, 12: QueenCard, 13: KingCard, 14: AceCard}.get(value, NumberedCard)
+    card = object.__new__(card_class)
+    card.value = value
+    card.suit = suit
+    card.code = card_code(value, suit)
+    card.mask = 1 << card.code
+    return card
+
+
+#: the 52 cards, indexed by their code
+CARDS = tuple(sorted((_make_card(value, suit) for suit in Suit for value in range(2, 15)),
+                     key=lambda c: c.code))
+#: the cards in fresh deck order: Hearts, Spades, Clubs and Diamonds, each from 2 to Ace
+DECK_ORDER = tuple(CARDS[card_code(value, suit)] for suit in Suit for value in range(2, 15))
+_DECK_CODES = [card.code for card in DECK_ORDER]
+
+
+def card_from_code(code):
+    """returns the card with the given code (0-51)"""
+    return CARDS[code]
+
+
+def cards_to_mask(cards):
+    """returns the 52 bit mask of a collection of cards"""
+    mask = 0
+    for card in cards:
+        mask |= card.mask
+    return mask
+
+
+def mask_to_cards(mask):
+    """returns the cards of a 52 bit mask, in code order"""
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(CARDS[low.bit_length() - 1])
+        mask ^= low
+    return cards
+
+
 class StandardDeck:
-    """Creates a deck of 52 cards, in order of Hearts,Spades, Clubs and Diamonds"""
+    """Creates a deck of 52 cards, in order of Hearts,Spades, Clubs and Diamonds.
 
-    def __init__(self):
-        self.cards = []
+    The deck is an array of card codes with a cursor at the next card to draw. Every deck shuffles with its own
+    random generator, so a seeded deck always deals the same cards"""
+
+    def __init__(self, rng=None):
+        """
+        :param rng: a random.Random to shuffle with, or a seed for a new one (None seeds from the system)
+        """
+        self.rng = rng if isinstance(rng, random.Random) else random.Random(rng)
+        self.codes = array('B')
+        self.position = 0
         self.make_deck()
 
+    @property
+    def cards(self):
+        """the cards left in the deck, top card first"""
+        return [CARDS[code] for code in self.codes[self.position:]]
+
+    @cards.setter
+    def cards(self, cards):
+        self.codes = array('B', [card.code for card in cards])
+        self.position = 0
+
+    def __len__(self):
+        return len(self.codes) - self.position
+
     def make_deck(self):
-        """generates a list of 52 cards"""
-        for x in Suit:
-            for t in range(2, 11, 1):
-                self.cards.append(NumberedCard(t, x))
-            self.cards.append(JackCard(x))
-            self.cards.append(QueenCard(x))
-            self.cards.append(KingCard(x))
-            self.cards.append(AceCard(x))
-
-    def shuffle(self):
-        """ Shuffles the deck in random order"""
-        # assigning an index for each card
-        # random.seed(123)
-        range_of_numbers = [m for m in range(len(self.cards))]
-        shuffle(range_of_numbers)
-        self.cards = [self.cards[x] for x in range_of_numbers]
+        """puts all 52 cards back in the deck, in order"""
+        self.codes = array('B', _DECK_CODES)
+        self.position = 0
+
+    def remove_cards(self, cards):
+        """takes known cards (e.g. dead cards or cards dealt elsewhere) out of the deck"""
+        mask = cards_to_mask(cards)
+        self.codes = array('B', [code for code in self.codes[self.position:] if not (mask >> code) & 1])
+        self.position = 0
+
+    def reset(self):
+        """returns every drawn card to the deck, keeping the current order"""
+        self.position = 0
+
+    def shuffle(self, count=None):
+        """
+        Shuffles the deck in random order
+
+        :param count: only randomise the top count cards (a partial Fisher-Yates shuffle), enough when no more
+                      than count cards will be drawn. None shuffles the whole deck
+        """
+        codes = self.codes
+        size = len(codes)
+        stop = size - 1 if count is None else min(self.position + count, size - 1)
+        rand = self.rng.random
+        for i in range(self.position, stop):
+            j = i + int(rand() * (size - i))
+            codes[i], codes[j] = codes[j], codes[i]
 
     def draw(self):
         """ picks a card from the deck"""
-        # pop out top card
-        return self.cards.pop(0)
+        code = self.codes[self.position]
+        self.position += 1
+        return CARDS[code]
+
+    def draw_codes(self, count):
+        """picks count cards from the deck and returns their codes"""
+        start = self.position
+        if start + count > len(self.codes):
+            raise IndexError("not enough cards left in the deck")
+        self.position = start + count
+        return self.codes[start:start + count].tolist()
 
 
 class Hand:
@@ -253,167 +320,455 @@ class HandRank(enum.IntEnum):
     get_straight_flush = 9
 
 
+# ---------------------------------------------------------------------------
+# Table evaluator
+#
+# A hand strength is a single integer: the HandRank category in the high bits and up to five
+# deciding card values (4 bits each, most significant first) below it, so stronger hands always
+# compare greater. Hands are looked up in two tables instead of being checked one category at a time:
+#   * a flush table indexed by the 13 bit rank mask of a suit holding five or more cards
+#   * a rank table keyed by the sum of 5 ** (value - 2) over all cards, which is unique for every
+#     multiset of card values (no value can appear more than four times).
+# Both tables are generated once and pickled next to this module.
+# ---------------------------------------------------------------------------
+
+STRENGTH_SHIFT = 20
+TABLES_VERSION = 1
+TABLES_PATH = os.environ.get('POKERGUI_TABLES',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'handranks.pickle'))
+
+_RANK_KEYS = [5 ** (code >> RANK_SHIFT) for code in range(52)]
+_RANK_BITS = [1 << (code >> RANK_SHIFT) for code in range(52)]
+
+
+def _straight_high(mask):
+    """returns the value of the top card of the best straight in a 13 bit rank mask, or 0"""
+    for high in range(14, 5, -1):
+        run = 0b11111 << (high - 6)
+        if mask & run == run:
+            return high
+    wheel = (1 << 12) | 0b1111  # A, 2, 3, 4, 5
+    if mask & wheel == wheel:
+        return 5
+    return 0
+
+
+def _make_strength(rank, values):
+    """packs a HandRank and up to five deciding card values into one integer"""
+    strength = int(rank)
+    for k in range(5):
+        strength = (strength << 4) | (values[k] if k < len(values) else 0)
+    return strength
+
+
+def strength_cards(strength):
+    """returns the deciding card values packed into a hand strength, most significant first"""
+    values = [(strength >> shift) & 0xF for shift in range(16, -1, -4)]
+    return [v for v in values if v]
+
+
+def _flush_strength(mask):
+    """strength of the best flush or straight flush made from a rank mask of five or more suited cards"""
+    high = _straight_high(mask)
+    if high:
+        return _make_strength(HandRank.get_straight_flush, [high])
+    values = [v for v in range(14, 1, -1) if mask & (1 << (v - 2))]
+    return _make_strength(HandRank.get_flush, values[:5])
+
+
+def _rank_strength(counts):
+    """
+    strength of the best hand (ignoring flushes) for a list of 13 value counts, counts[0] being the twos
+
+    :param counts: how many cards of each value are held
+    :return: the hand strength
+    """
+    by_count = {1: [], 2: [], 3: [], 4: []}
+    mask = 0
+    for value in range(14, 1, -1):
+        n = counts[value - 2]
+        if n:
+            by_count[n].append(value)
+            mask |= 1 << (value - 2)
+    quads, trips, pairs, singles = by_count[4], by_count[3], by_count[2], by_count[1]
+    present = [v for v in range(14, 1, -1) if counts[v - 2]]
+
+    if quads:
+        kickers = [v for v in present if v != quads[0]]
+        return _make_strength(HandRank.get_four_of_a_kind, [quads[0]] + kickers[:1])
+    if trips and (len(trips) > 1 or pairs):
+        pair = max(trips[1:] + pairs)
+        return _make_strength(HandRank.get_full_house, [trips[0], pair])
+    high = _straight_high(mask)
+    if high:
+        return _make_strength(HandRank.get_straight, [high])
+    if trips:
+        kickers = [v for v in present if v != trips[0]]
+        return _make_strength(HandRank.get_three_of_a_kind, [trips[0]] + kickers[:2])
+    if len(pairs) > 1:
+        kickers = [v for v in present if v not in pairs[:2]]
+        return _make_strength(HandRank.get_two_pairs, pairs[:2] + kickers[:1])
+    if pairs:
+        return _make_strength(HandRank.get_one_pairs, pairs[:1] + singles[:3])
+    return _make_strength(HandRank.get_highest_card, singles[:5])
+
+
+def _count_vectors(index, remaining, counts):
+    """yields every list of 13 value counts (each at most 4) adding up to at most `remaining` more cards"""
+    if index == 13:
+        yield counts
+        return
+    for n in range(min(4, remaining) + 1):
+        counts[index] = n
+        yield from _count_vectors(index + 1, remaining - n, counts)
+    counts[index] = 0
+
+
+def _generate_tables():
+    """builds the flush and rank tables for every set of 1 to 7 cards"""
+    flush_table = [0] * (1 << 13)
+    for mask in range(1 << 13):
+        if bin(mask).count('1') >= 5:
+            flush_table[mask] = _flush_strength(mask)
+    rank_table = {}
+    for counts in _count_vectors(0, 7, [0] * 13):
+        key = sum(n * 5 ** i for i, n in enumerate(counts))
+        if key:
+            rank_table[key] = _rank_strength(counts)
+    return flush_table, rank_table
+
+
+def _load_tables(path=TABLES_PATH):
+    """loads the evaluator tables from the disk cache, generating (and caching) them on first use"""
+    try:
+        with open(path, 'rb') as f:
+            version, flush_table, rank_table = pickle.load(f)
+        if version == TABLES_VERSION:
+            return flush_table, rank_table
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    flush_table, rank_table = _generate_tables()
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump((TABLES_VERSION, flush_table, rank_table), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass  # read-only install, the tables just get rebuilt next time
+    return flush_table, rank_table
+
+
+_FLUSH_TABLE, _RANK_TABLE = _load_tables()
+_POPCOUNT = [bin(m).count('1') for m in range(1 << 13)]
+
+
+def hand_strength(cards):
+    """
+    returns the strength of the best poker hand in a set of cards (usually 5 to 7); greater is better
+
+    :param cards: list of playing cards
+    :return: an integer, HandRank(strength >> STRENGTH_SHIFT) is the hand category
+    """
+    return code_strength([card.code for card in cards])
+
+
+def code_strength(codes):
+    """returns the strength of the best poker hand in a sequence of card codes, see hand_strength"""
+    key = 0
+    suit_masks = [0, 0, 0, 0]
+    for code in codes:
+        key += _RANK_KEYS[code]
+        suit_masks[code & SUIT_MASK] |= _RANK_BITS[code]
+    for mask in suit_masks:
+        if _POPCOUNT[mask] >= 5:
+            return _FLUSH_TABLE[mask]
+    strength = _RANK_TABLE.get(key)
+    if strength is None:  # more than seven cards
+        strength = _rank_strength([(key // 5 ** i) % 5 for i in range(13)])
+    return strength
+
+
+_batch_tables = None
+
+
+def _get_batch_tables():
+    """returns the evaluator tables as numpy arrays, built on first use"""
+    global _batch_tables
+    if _batch_tables is None:
+        if np is None:
+            raise ImportError("numpy is required for batch evaluation")
+        keys = np.array(sorted(_RANK_TABLE), dtype=np.int64)
+        _batch_tables = (np.array(_RANK_KEYS, dtype=np.int64),
+                         np.array(_RANK_BITS, dtype=np.int64),
+                         keys,
+                         np.array([_RANK_TABLE[k] for k in keys.tolist()], dtype=np.int64),
+                         np.array(_FLUSH_TABLE, dtype=np.int64),
+                         np.array(_POPCOUNT, dtype=np.int8))
+    return _batch_tables
+
+
+def batch_strength(cards, board=None):
+    """
+    scores many hands at once with numpy, without a python loop per hand
+
+    :param cards: int array of card codes with the cards of one hand along the last axis, e.g. (N, 7);
+                  or the hole cards, e.g. (N, 2), when a board is given
+    :param board: optional int array of board card codes, e.g. (5,), (N, 5) or (1, M, 5), broadcast against
+                  the leading axes of cards
+    :return: (strengths, ranks): int64 hand strengths as returned by hand_strength, and the HandRank values,
+             both shaped like the broadcast leading axes, e.g. (N,)
+    """
+    rank_keys, rank_bits, keys, values, flush_table, popcount = _get_batch_tables()
+    codes = np.asarray(cards, dtype=np.intp)
+    if board is not None:
+        board = np.asarray(board, dtype=np.intp)
+        shape = np.broadcast_shapes(codes.shape[:-1], board.shape[:-1])
+        codes = np.concatenate([np.broadcast_to(codes, shape + codes.shape[-1:]),
+                                np.broadcast_to(board, shape + board.shape[-1:])], axis=-1)
+    if not 1 <= codes.shape[-1] <= 7:
+        raise ValueError("batch evaluation takes 1 to 7 cards per hand, got {}".format(codes.shape[-1]))
+
+    strengths = values[np.searchsorted(keys, rank_keys[codes].sum(axis=-1))]
+    bits = rank_bits[codes]
+    suits = codes & SUIT_MASK
+    for suit in range(4):
+        suit_mask = np.where(suits == suit, bits, 0).sum(axis=-1)
+        flush = popcount[suit_mask] >= 5
+        strengths = np.where(flush, flush_table[suit_mask], strengths)
+    return strengths, strengths >> STRENGTH_SHIFT
+
+
+class HandEvaluator:
+    """Evaluates a growing set of cards incrementally: the value histogram, suit counts, suit rank masks and the
+    straight mask are updated as each card arrives, so the best hand is known in O(1) after every street"""
+    __slots__ = ('rank_counts', 'rank_mask', 'suit_counts', 'suit_masks', 'key', 'flush_suit', 'strength')
+
+    def __init__(self, cards=()):
+        self.clear()
+        for card in cards:
+            self.add(card)
+
+    def clear(self):
+        """forgets all cards"""
+        self.rank_counts = [0] * 13
+        self.rank_mask = 0  # one bit per value held, the straight mask
+        self.suit_counts = [0, 0, 0, 0]
+        self.suit_masks = [0, 0, 0, 0]
+        self.key = 0  # the rank table key
+        self.flush_suit = None
+        self.strength = 0
+
+    def add(self, card):
+        """adds a card and updates the strength of the best hand"""
+        code = card.code
+        rank = code >> RANK_SHIFT
+        suit = code & SUIT_MASK
+        self.rank_counts[rank] += 1
+        self.rank_mask |= 1 << rank
+        self.suit_counts[suit] += 1
+        self.suit_masks[suit] |= 1 << rank
+        self.key += _RANK_KEYS[code]
+        if self.suit_counts[suit] >= 5:
+            self.flush_suit = suit
+        if self.flush_suit is not None:
+            self.strength = _FLUSH_TABLE[self.suit_masks[self.flush_suit]]
+        else:
+            strength = _RANK_TABLE.get(self.key)
+            self.strength = strength if strength is not None else _rank_strength(self.rank_counts)
+
+    def strength_with(self, cards):
+        """
+        returns the strength of the evaluator's cards plus some more, leaving the evaluator unchanged. With the
+        board in the evaluator, this scores a player's hole cards against it without rescanning the board
+
+        :param cards: the extra cards, e.g. two hole cards
+        """
+        key = self.key
+        flush_suit = self.flush_suit
+        for card in cards:
+            code = card.code
+            key += _RANK_KEYS[code]
+            suit = code & SUIT_MASK
+            if flush_suit is None and self.suit_counts[suit] + sum(
+                    1 for other in cards if other.code & SUIT_MASK == suit) >= 5:
+                flush_suit = suit
+        if flush_suit is not None:
+            mask = self.suit_masks[flush_suit]
+            for card in cards:
+                if card.code & SUIT_MASK == flush_suit:
+                    mask |= _RANK_BITS[card.code]
+            return _FLUSH_TABLE[mask]
+        strength = _RANK_TABLE.get(key)
+        if strength is None:
+            counts = self.rank_counts[:]
+            for card in cards:
+                counts[card.code >> RANK_SHIFT] += 1
+            strength = _rank_strength(counts)
+        return strength
+
+    def copy(self):
+        """returns an independent evaluator holding the same cards"""
+        other = HandEvaluator.__new__(HandEvaluator)
+        other.rank_counts = self.rank_counts[:]
+        other.rank_mask = self.rank_mask
+        other.suit_counts = self.suit_counts[:]
+        other.suit_masks = self.suit_masks[:]
+        other.key = self.key
+        other.flush_suit = self.flush_suit
+        other.strength = self.strength
+        return other
+
+
+# ---------------------------------------------------------------------------
+# Suit isomorphism
+#
+# Relabelling the suits of a set of cards never changes its poker value, so sets that only differ by a suit
+# permutation share one canonical form: the suits are renamed in order of their rank masks.
+# ---------------------------------------------------------------------------
+
+def _suit_masks(cards):
+    """returns the 13 bit rank mask of each suit in a collection of cards"""
+    masks = [0, 0, 0, 0]
+    for card in cards:
+        code = card.code
+        masks[code & SUIT_MASK] |= _RANK_BITS[code]
+    return masks
+
+
+def _suit_order(hole, board):
+    """returns the suit indices sorted by (board mask, hole mask), largest first, and the per-suit masks"""
+    hole_masks = _suit_masks(hole)
+    board_masks = _suit_masks(board)
+    pairs = [(board_masks[s] << 13) | hole_masks[s] for s in range(4)]
+    return sorted(range(4), key=lambda s: pairs[s], reverse=True), pairs
+
+
+def canonical_key(hole, board=()):
+    """
+    returns an integer identifying hole and board cards up to a permutation of the suits
+
+    :param hole: the player's cards
+    :param board: the table cards, kept apart from the hole cards in the key
+    :return: the four per-suit (board, hole) rank masks, sorted and packed into one integer
+    """
+    order, pairs = _suit_order(hole, board)
+    key = 0
+    for s in order:
+        key = (key << 26) | pairs[s]
+    return key
+
+
+def canonicalize(hole, board=()):
+    """
+    maps hole and board cards to their suit-isomorphic canonical form, with the suits renamed in the order
+    Hearts, Spades, Clubs, Diamonds by decreasing (board, hole) rank masks
+
+    :return: (canonical hole cards, canonical board cards)
+    """
+    order, _ = _suit_order(hole, board)
+    rename = [0] * 4
+    for new, old in enumerate(order):
+        rename[old] = new
+    return ([CARDS[(card.code & ~SUIT_MASK) | rename[card.code & SUIT_MASK]] for card in hole],
+            [CARDS[(card.code & ~SUIT_MASK) | rename[card.code & SUIT_MASK]] for card in board])
+
+
+def set_key(cards):
+    """
+    returns canonical_key(cards) for a set of cards evaluated as a whole, computed in one pass
+
+    :return: the four suit rank masks, sorted and packed into 52 bits
+    """
+    masks = [0, 0, 0, 0]
+    for card in cards:
+        code = card.code
+        masks[code & SUIT_MASK] |= _RANK_BITS[code]
+    masks.sort()
+    return (masks[3] << 39) | (masks[2] << 26) | (masks[1] << 13) | masks[0]
+
+
+class StrengthCache:
+    """A bounded least-recently-used cache of hand strengths keyed by the canonical form of the cards, so every
+    suit permutation of an evaluated set is a hit. Entries can also expire after ttl seconds"""
+
+    def __init__(self, maxsize=65536, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> strength, or (strength, expiry time) with a ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def strength(self, cards):
+        """returns hand_strength(cards), from the cache when possible"""
+        key = set_key(cards)
+        entries = self.entries
+        entry = entries.get(key)
+        if entry is not None:
+            if self.ttl is None:
+                self.hits += 1
+                entries.move_to_end(key)
+                return entry
+            if entry[1] > time.monotonic():
+                self.hits += 1
+                entries.move_to_end(key)
+                return entry[0]
+        self.misses += 1
+        strength = hand_strength(cards)
+        entries[key] = strength if self.ttl is None else (strength, time.monotonic() + self.ttl)
+        entries.move_to_end(key)
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return strength
+
+    def hit_rate(self):
+        """returns the share of lookups answered from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """returns the cache counters as a dictionary"""
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hit_rate()}
+
+    def clear(self):
+        """empties the cache and resets the counters"""
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+#: the cache used by PokerHand (and so Hand.best_poker_hand), None to always evaluate
+strength_cache = None
+
+
 class PokerHand:
-    """This class checks different poker hand possibilities given a set of cards"""
+    """Thin wrapper around the table evaluator, kept so older code can still compare poker hands"""
 
-    def __init__(self, cards=None):
+    def __init__(self, cards=None, strength=None):
+        """
+        :param cards: the cards to find the best poker hand in
+        :param strength: the strength of the cards when it is already known (e.g. from a HandEvaluator)
+        """
         if cards is None:
             self.cards = []
         else:
             self.cards = cards
-        self.rank = HandRank.get_highest_card
-        self.hand_cards = []
-        poker_hand_list = [self.get_straight_flush, self.get_four_of_a_kind, self.get_full_house, self.get_flush,
-                           self.get_straight, self.get_three_of_a_kind, self.get_pairs, self.get_highest_card]
-        for best_hand in poker_hand_list:
-            if best_hand() is not None:
-                best_hand()
-                break
+        if strength is not None:
+            self.strength = strength
+        elif strength_cache is None:
+            self.strength = hand_strength(self.cards)
+        else:
+            self.strength = strength_cache.strength(self.cards)
+        self.rank = HandRank(self.strength >> STRENGTH_SHIFT)
+        self.hand_cards = strength_cards(self.strength)
 
     def __str__(self):
         return "The best poker hand is {} with card values {}".format(self.rank.name, self.hand_cards)
 
-    def get_highest_card(self):
-        """ Finds the highest value card in a set of cards """
-        self.cards.sort(reverse=True)
-        self.rank = HandRank.get_highest_card
-        self.hand_cards = self.cards
-        return self.cards[0]
-
-    def get_pairs(self):
-        """checks for pairs(1 or 2) in a set of cards.
-
-         Returns the value of paired card if found, otherwise returns None"""
-        self.cards.sort(reverse=True)
-        value_count = Counter()
-        for c in self.cards:
-            value_count[c.get_value()] += 1
-        pairs = [v[0] for v in value_count.items() if v[1] >= 2]
-        remaining_cards = [v[0] for v in value_count.items() if v[1] == 1]
-        pairs.sort()
-        self.rank = HandRank.get_highest_card
-        if pairs:
-            if len(pairs) == 1:
-                self.rank = HandRank.get_one_pairs
-                self.hand_cards = pairs + remaining_cards[0:3]
-            if len(pairs) == 2:
-                self.rank = HandRank.get_two_pairs
-                self.hand_cards = pairs + remaining_cards[0:1]
-            return pairs
-
-    def get_three_of_a_kind(self):
-        """checks for triplets in a set of cards.
-
-        Returns the value of triplet card if found, otherwise returns None"""
-        self.cards.sort(reverse=True)
-        value_count = Counter()
-        for c in self.cards:
-            value_count[c.get_value()] += 1
-        three_kind = [v[0] for v in value_count.items() if v[1] >= 3]
-        remaining_cards = [v[0] for v in value_count.items() if v[1] == 1]
-        self.rank = HandRank.get_one_pairs
-        if three_kind:
-            self.rank = HandRank.get_three_of_a_kind
-            self.hand_cards = three_kind + remaining_cards[0:2]
-            return three_kind
-
-    def get_straight(self):
-        """checks for straight in a set of cards.
-
-        Returns the value of the highest card in the straight set if found, otherwise returns None"""
-        self.cards.sort(reverse=True)
-        self.rank = HandRank.get_three_of_a_kind
-        vals = [c.get_value() for c in self.cards] + [1 for c in self.cards if c.get_value() == 14]
-        for c in reversed(self.cards):
-            found_straight = True
-            for k in range(1, 5):
-                if (c.get_value() - k) not in vals:
-                    found_straight = False
-                    self.hand_cards = c.get_value()
-                    break
-
-            if found_straight:
-                self.rank = HandRank.get_straight
-                return c.get_value()
-
-    def get_flush(self):
-        """Checks whether the set of cards contain a flush(5 cards of same suit).
-
-        Returns the value of flush suit if found, otherwise returns None"""
-        self.cards.sort(reverse=True)
-        suit_count = Counter()
-        for c in self.cards:
-            suit_count[c.suit] += 1
-        flush_suit = [v[0] for v in suit_count.items() if v[1] >= 5]
-        self.rank = HandRank.get_straight
-        if flush_suit:
-            self.rank = HandRank.get_flush
-            return flush_suit
-
-    def get_full_house(self):
-        """Checks for full house in a set of cards.
-
-        Returns the set of triplets and pairs if found, otherwise returns None"""
-        self.cards.sort(reverse=True)
-        value_count = Counter()
-        self.rank = HandRank.get_flush
-        for c in self.cards:
-            value_count[c.get_value()] += 1
-        threes = [v[0] for v in value_count.items() if v[1] >= 3]
-        threes.sort()
-        twos = [v[0] for v in value_count.items() if v[1] >= 2]
-        twos.sort()
-        self.hand_cards = threes + twos
-        for three in reversed(threes):
-            for two in reversed(twos):
-                if two != three:
-                    self.rank = HandRank.get_full_house
-                    return three, two
-
-    def get_four_of_a_kind(self):
-        """checks for quadruplet of cards having same value from a set of cards
-
-        Returns the value of the quadruplet if found, otherwise returns None"""
-        self.cards.sort(reverse=True)
-        value_count = Counter()
-        self.rank = HandRank.get_full_house
-        for c in self.cards:
-            value_count[c.get_value()] += 1
-        four_kind = [v[0] for v in value_count.items() if v[1] >= 4]
-        remaining_cards = [v[0] for v in value_count.items() if v[1] == 1]
-        # self.hand_cards =
-        if four_kind:
-            self.rank = HandRank.get_four_of_a_kind
-            self.hand_cards = four_kind + remaining_cards[0:1]
-            return four_kind
-
-    def get_straight_flush(self):
-        """
-        Checks for the best straight flush in a list of cards (maybe more than just 5)
-
-         :return: None if no straight flush is found, else the value of the top card.
-        """
-        self.cards.sort(reverse=True)
-        self.rank = HandRank.get_four_of_a_kind
-        vals = [(c.get_value(), c.suit) for c in self.cards] \
-               + [(1, c.suit) for c in self.cards if c.get_value() == 14]  # Add the aces!
-        for c in reversed(self.cards):  # Starting point (high card)
-            found_straight = True
-            for k in range(1, 5):
-                if (c.get_value() - k, c.suit) not in vals:
-                    found_straight = False
-                    break
-            if found_straight:
-                self.rank = HandRank.get_straight_flush
-                self.hand_cards = c.get_value()
-                return c.get_value()
-
     def __eq__(self, other):
-        """checks whether two poker hands are comparable"""
-        self.cards.sort(reverse=True)
-        other.cards.sort(reverse=True)
-        return other.rank == self.rank
+        """checks whether two poker hands are equally strong"""
+        return self.strength == other.strength
 
     def __lt__(self, other):
         """checks whether first poker hand(self) is less than the second(other)"""
-        return (self.rank, self.hand_cards) < (other.rank, other.hand_cards)
\ No newline at end of file
+        return self.strength < other.strength
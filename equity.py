@@ -0,0 +1,249 @@
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cardlib import *
+
+
+class EquityResult:
+    """Win/tie/lose counts for a set of hole hands. Results of several simulations are merged by summing counts"""
+
+    def __init__(self, players: int, exact=False):
+        self.exact = exact  # True when every board was enumerated, so there is no sampling error
+        self.samples = 0
+        self.wins = [0] * players
+        self.ties = [0] * players
+        self.losses = [0] * players
+        # sum and sum of squares of each player's share of the pot per board, for the confidence intervals
+        self.share_sum = [0.0] * players
+        self.share_sq_sum = [0.0] * players
+
+    def add(self, strengths):
+        """counts one board given the hand strength of every player"""
+        best = max(strengths)
+        winners = strengths.count(best)
+        share = 1.0 / winners
+        self.samples += 1
+        for i, strength in enumerate(strengths):
+            if strength != best:
+                self.losses[i] += 1
+            elif winners == 1:
+                self.wins[i] += 1
+                self.share_sum[i] += 1.0
+                self.share_sq_sum[i] += 1.0
+            else:
+                self.ties[i] += 1
+                self.share_sum[i] += share
+                self.share_sq_sum[i] += share * share
+
+    def merge(self, other):
+        """adds the counts of another result to this one"""
+        self.samples += other.samples
+        for i in range(len(self.wins)):
+            self.wins[i] += other.wins[i]
+            self.ties[i] += other.ties[i]
+            self.losses[i] += other.losses[i]
+            self.share_sum[i] += other.share_sum[i]
+            self.share_sq_sum[i] += other.share_sq_sum[i]
+        return self
+
+    def equity(self, player):
+        """returns the expected share of the pot for a player (ties split the pot)"""
+        return self.share_sum[player] / self.samples if self.samples else 0.0
+
+    def confidence_interval(self, player, z=1.96):
+        """
+        returns a normal approximation confidence interval for the equity of a player
+
+        :param player: index of the hole hand
+        :param z: number of standard errors, 1.96 for 95%
+        :return: (low, high)
+        """
+        if not self.samples:
+            return 0.0, 1.0
+        mean = self.equity(player)
+        if self.exact:
+            return mean, mean
+        variance = max(self.share_sq_sum[player] / self.samples - mean * mean, 0.0)
+        margin = z * math.sqrt(variance / self.samples)
+        return max(mean - margin, 0.0), min(mean + margin, 1.0)
+
+    def __str__(self):
+        lines = ["{} boards{}".format(self.samples, " (exact)" if self.exact else "")]
+        for i in range(len(self.wins)):
+            low, high = self.confidence_interval(i)
+            lines.append("player {}: equity {:.4f} ({:.4f}-{:.4f}), win {} tie {} lose {}".format(
+                i, self.equity(i), low, high, self.wins[i], self.ties[i], self.losses[i]))
+        return "\n".join(lines)
+
+
+def _known_codes(hands, board, dead):
+    """checks the known cards and returns (hole codes per hand, board codes, codes left in the deck)"""
+    hand_codes = [[card.code for card in hand] for hand in hands]
+    board_codes = [card.code for card in board]
+    known = [code for codes in hand_codes for code in codes] + board_codes + [card.code for card in dead]
+    if len(set(known)) != len(known):
+        raise ValueError("the same card is used twice in the hands, board or dead cards")
+    if len(board_codes) > 5:
+        raise ValueError("a board has at most five cards")
+    known = set(known)
+    stock = [card.code for card in StandardDeck().cards if card.code not in known]
+    return hand_codes, board_codes, stock
+
+
+def _simulate(hand_codes, board_codes, stock, samples, deadline, seed):
+    """
+    worker: deals random runouts of the board and counts the results
+
+    :param samples: number of boards to deal, or None to run until the deadline
+    :param deadline: time.time() at which to stop, or None
+    :param seed: seed of this worker's own deck
+    :return: an EquityResult
+    """
+    deck = StandardDeck(seed)
+    deck.cards = [card_from_code(code) for code in stock]
+    missing = 5 - len(board_codes)
+    result = EquityResult(len(hand_codes))
+    done = 0
+    while samples is None or done < samples:
+        batch = 1000 if samples is None else min(1000, samples - done)
+        for _ in range(batch):
+            deck.reset()
+            deck.shuffle(missing)
+            board = board_codes + deck.draw_codes(missing)
+            result.add([code_strength(codes + board) for codes in hand_codes])
+        done += batch
+        if deadline is not None and time.time() >= deadline:
+            break
+    return result
+
+
+def monte_carlo_equity(hands, board=(), dead=(), samples=100000, seconds=None, workers=None, seed=None):
+    """
+    estimates the win/tie/lose equity of hole hands by dealing random runouts of the board
+
+    :param hands: list of hole hands, each a list of two cards
+    :param board: cards already on the table (0 to 5)
+    :param dead: cards known to be out of the deck, e.g. folded or burnt cards
+    :param samples: number of boards to deal in total, or None to only use the time budget
+    :param seconds: time budget; the simulation stops at whichever of samples and seconds comes first
+    :param workers: number of processes, defaults to the number of cores. 1 runs in this process
+    :param seed: seed for reproducible results (with a sample budget)
+    :return: an EquityResult
+    """
+    if samples is None and seconds is None:
+        raise ValueError("give a sample budget, a time budget or both")
+    hand_codes, board_codes, stock = _known_codes(hands, board, dead)
+    workers = workers or os.cpu_count() or 1
+    deadline = None if seconds is None else time.time() + seconds
+    seeder = random.Random(seed)
+    seeds = [seeder.getrandbits(64) for _ in range(workers)]
+    if samples is None:
+        budgets = [None] * workers
+    else:
+        budgets = [samples // workers + (1 if i < samples % workers else 0) for i in range(workers)]
+
+    if workers == 1:
+        return _simulate(hand_codes, board_codes, stock, budgets[0], deadline, seeds[0])
+    result = EquityResult(len(hands))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_simulate, hand_codes, board_codes, stock, budgets[i], deadline, seeds[i])
+                   for i in range(workers)]
+        for future in futures:
+            result.merge(future.result())
+    return result
+
+
+def unrank_combination(index, n, k):
+    """
+    returns the combination of k out of n items at a given position in lexicographic order
+
+    :param index: position of the combination, 0 to comb(n, k) - 1
+    :return: sorted list of k item indices
+    """
+    combo = []
+    x = 0
+    for remaining in range(k, 0, -1):
+        count = math.comb(n - x - 1, remaining - 1)
+        while index >= count:
+            index -= count
+            x += 1
+            count = math.comb(n - x - 1, remaining - 1)
+        combo.append(x)
+        x += 1
+    return combo
+
+
+def _next_combination(combo, n):
+    """steps a sorted combination to the next one in lexicographic order, returns False after the last"""
+    k = len(combo)
+    i = k - 1
+    while i >= 0 and combo[i] == n - k + i:
+        i -= 1
+    if i < 0:
+        return False
+    combo[i] += 1
+    for j in range(i + 1, k):
+        combo[j] = combo[j - 1] + 1
+    return True
+
+
+def _enumerate(hand_codes, board_codes, stock, start, stop):
+    """worker: scores every runout of the board with a lexicographic index in [start, stop)"""
+    missing = 5 - len(board_codes)
+    result = EquityResult(len(hand_codes), exact=True)
+    combo = unrank_combination(start, len(stock), missing)
+    for _ in range(start, stop):
+        board = board_codes + [stock[j] for j in combo]
+        result.add([code_strength(codes + board) for codes in hand_codes])
+        _next_combination(combo, len(stock))
+    return result
+
+
+#: fewest runouts worth starting a process pool for when the number of workers is not given; smaller enumerations
+#: finish before the pool has started
+POOL_RUNOUTS = 50000
+
+
+def exact_equity(hands, board=(), dead=(), workers=1):
+    """
+    computes the exact equity of hole hands by scoring every possible runout of the board once
+
+    :param hands: list of hole hands, each a list of two cards
+    :param board: cards already on the table (0 to 5)
+    :param dead: cards known to be out of the deck
+    :param workers: number of processes; the runouts are split into contiguous ranges of combination indices.
+                    None uses every core when there are at least POOL_RUNOUTS runouts, this process otherwise
+    :return: an EquityResult with exact set
+    """
+    hand_codes, board_codes, stock = _known_codes(hands, board, dead)
+    total = math.comb(len(stock), 5 - len(board_codes))
+    if workers is None:
+        workers = (os.cpu_count() or 1) if total >= POOL_RUNOUTS else 1
+    workers = max(1, min(workers, total))
+    bounds = [total * i // workers for i in range(workers + 1)]
+
+    if workers == 1:
+        return _enumerate(hand_codes, board_codes, stock, 0, total)
+    result = EquityResult(len(hands), exact=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_enumerate, hand_codes, board_codes, stock, bounds[i], bounds[i + 1])
+                   for i in range(workers)]
+        for future in futures:
+            result.merge(future.result())
+    return result
+
+
+def equity(hands, board=(), dead=(), max_exact=200000, samples=100000, seconds=None, workers=None, seed=None):
+    """
+    computes equity exactly when there are at most max_exact runouts left, otherwise by Monte Carlo
+
+    :param max_exact: largest number of board runouts that is enumerated exactly
+    :return: an EquityResult, see exact_equity and monte_carlo_equity for the other parameters
+    """
+    known = sum(len(hand) for hand in hands) + len(board) + len(dead)
+    if math.comb(52 - known, 5 - len(board)) <= max_exact:
+        return exact_equity(hands, board, dead, workers=workers)
+    return monte_carlo_equity(hands, board, dead, samples=samples, seconds=seconds, workers=workers, seed=seed)
@@ -0,0 +1,360 @@
+import mmap
+import os
+import struct
+import time
+from array import array
+
+from cardlib import *
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+DEFAULT_BUFFER = 64 * 1024
+
+
+class HandHistoryLog:
+    """Streams the game log to a text file through a buffered writer. When the file grows past max_bytes it is
+    rotated like a log file: path becomes path.1, path.1 becomes path.2 and so on, keeping `backups` old files.
+    Only the write buffer is held in memory, however long the session runs"""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS, buffer_size=DEFAULT_BUFFER):
+        """
+        :param path: the history file, appended to if it exists
+        :param max_bytes: size at which the file is rotated, 0 to never rotate
+        :param backups: number of rotated files kept
+        :param buffer_size: bytes buffered before they are written out
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer_size = buffer_size
+        self.file = None
+        self.size = 0
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, 'ab', buffering=self.buffer_size)
+        self.size = self.file.tell()
+
+    def write(self, text):
+        """appends a log entry (one or more lines)"""
+        data = (text + '\n').encode('utf-8')
+        if self.max_bytes and self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.size += len(data)
+
+    def rotate(self):
+        """closes the current file and moves it to path.1, shifting the older files up"""
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = '{}.{}'.format(self.path, i)
+            if os.path.exists(older):
+                os.replace(older, '{}.{}'.format(self.path, i + 1))
+        if self.backups:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def follow(self, gamemodel):
+        """
+        writes the log of a GameModel from now on, flushing at the end of every hand
+
+        :param gamemodel: a pokermodel.GameModel, batching or not
+        """
+        self.write("================\nSession started {}".format(time.strftime('%Y-%m-%d %H:%M:%S')))
+        if gamemodel.batching:
+            gamemodel.state_changed.connect(self.write_state)
+        else:
+            gamemodel.text_changed.connect(self.write)
+            gamemodel.game_message.connect(self.write_message)
+
+    def write_state(self, diff):
+        """writes the log lines and messages of a StateDiff"""
+        if diff.texts:
+            self.write('\n'.join(diff.texts))
+        for message in diff.messages:
+            self.write_message(message)
+
+    def write_message(self, message):
+        """writes an end of hand message and flushes the file"""
+        self.write(message)
+        self.flush()
+
+
+# ---------------------------------------------------------------------------------------------- binary records
+# A record file has a header followed by fixed-width records, one per hand, so hand n starts at
+# RECORD_OFFSET + n * record size. A record holds the stacks at the start of the hand, the blinds and the seat of
+# the small blind, the dealt cards (hole cards seat by seat, then the board in the order dealt, NO_CARD when not
+# dealt), the actions with their amounts and the result. The header gives the number of seats and of action slots
+# per record, ACTIONS_PER_SEAT per seat unless the writer was told otherwise.
+
+MAGIC = b'PKHH'
+RECORD_VERSION = 2
+RECORD_HEADER = struct.Struct('<4sIIII')  # magic, version, seats, actions per record, record size
+RECORD_OFFSET = 64
+ACTIONS_PER_SEAT = 16  # action slots per seat: four streets of a call each and room for raises
+NO_CARD = 0xFF
+NO_WINNER = 0xFF  # the pot was shared
+ACTION_CODES = {'call': 1, 'raise': 2, 'fold': 3}
+ACTION_NAMES = {code: name for name, code in ACTION_CODES.items()}
+TRUNCATED = 1  # flag: the hand had more actions than the record has slots, it cannot be replayed
+
+
+def _record_struct(seats, max_actions):
+    # stacks, small and big blind, seat of the small blind, cards, action count, flags, winner, HandRank (0 after
+    # a fold), pot, then the action codes and amounts
+    return struct.Struct('<{}qIIB{}sHBBBQ{}s{}I'.format(seats, 2 * seats + 5, max_actions, max_actions))
+
+
+class HandRecord:
+    """One hand of a record file"""
+    __slots__ = ('stacks', 'small_blind', 'big_blind', 'first_seat', 'cards', 'actions', 'flags', 'winner', 'rank',
+                 'pot')
+
+    def __init__(self, stacks, small_blind, big_blind, cards, actions, flags=0, winner=None, rank=None, pot=0,
+                 first_seat=0):
+        self.stacks = stacks  # total money of each player before the blinds
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.first_seat = first_seat  # the engine's first_seat, where the small blind is posted from
+        self.cards = cards  # card codes: two per seat, then the board, NO_CARD where not dealt
+        self.actions = actions  # [('call'/'raise'/'fold', amount)]
+        self.flags = flags
+        self.winner = winner  # seat index, None when several players were paid
+        self.rank = rank  # HandRank at the showdown, None when the hand was folded
+        self.pot = pot
+
+    def hole_cards(self, seat):
+        return [CARDS[code] for code in self.cards[2 * seat:2 * seat + 2] if code != NO_CARD]
+
+    @property
+    def board(self):
+        return [CARDS[code] for code in self.cards[2 * len(self.stacks):] if code != NO_CARD]
+
+    def __str__(self):
+        hands = ' / '.join(str(self.hole_cards(seat)) for seat in range(len(self.stacks)))
+        actions = ', '.join(name if name != 'raise' else 'raise {}'.format(amount) for name, amount in self.actions)
+        result = 'shared pot' if self.winner is None else 'seat {} wins'.format(self.winner)
+        return "{} board {}: {} -> {} {} (${})".format(
+            hands, self.board, actions, result, self.rank.name if self.rank else 'by fold', self.pot)
+
+
+class HandRecordWriter:
+    """Appends a binary record for every hand played by a GameEngine (or the engine of a GameModel). The writer
+    listens to the engine's events in front of the engine's own listener"""
+
+    def __init__(self, path, seats=2, max_actions=None, buffer_size=DEFAULT_BUFFER):
+        """
+        :param path: the record file, appended to if it exists
+        :param seats: number of players per hand
+        :param max_actions: action slots per record, ACTIONS_PER_SEAT * seats by default; an existing file keeps
+                            its own
+        """
+        self.seats = seats
+        if os.path.exists(path) and os.path.getsize(path):
+            file_seats, self.max_actions = _check_header(path)
+            if file_seats != seats:
+                raise ValueError("{} holds hands of {} seats".format(path, file_seats))
+            self.record = _record_struct(seats, self.max_actions)
+            self.file = open(path, 'ab', buffering=buffer_size)
+        else:
+            self.max_actions = max_actions or ACTIONS_PER_SEAT * seats
+            self.record = _record_struct(seats, self.max_actions)
+            self.file = open(path, 'wb', buffering=buffer_size)
+            self.file.write(RECORD_HEADER.pack(MAGIC, RECORD_VERSION, seats, self.max_actions, self.record.size))
+            self.file.write(bytes(RECORD_OFFSET - RECORD_HEADER.size))
+        self.engine = None
+        self.listener = None
+        self.stacks = None  # the hand being recorded
+        self.first_seat = 0
+        self.actions = []
+        self.hands = 0
+
+    def attach(self, engine):
+        """
+        starts recording the hands of an engine, beginning with the hand it is dealing now
+
+        :param engine: a GameEngine, or a GameModel
+        """
+        engine = getattr(engine, 'engine', engine)
+        if len(engine.players) != self.seats:
+            raise ValueError("the records have {} seats, the game {}".format(self.seats, len(engine.players)))
+        self.engine = engine
+        self.listener = engine.listener
+        engine.listener = self.on_event
+        self._start()
+
+    def detach(self):
+        if self.engine is not None:
+            self.engine.listener = self.listener
+            self.engine = None
+
+    def _start(self):
+        self.stacks = [player.total_money + player.total_bet_money for player in self.engine.players]
+        self.first_seat = self.engine.first_seat
+        self.actions = []
+
+    def on_event(self, event, *args):
+        if event == 'player_action':
+            self.actions.append(args[1:])
+        elif event == 'hand_result':
+            self.write_hand(*args)
+        elif event == 'hand_changed' and self.stacks is None:  # a new hand is dealt
+            self._start()
+        if self.listener is not None:
+            self.listener(event, *args)
+
+    def write_hand(self, winners, rank):
+        engine = self.engine
+        cards = bytearray([NO_CARD] * (2 * self.seats + 5))
+        for seat, player in enumerate(engine.players):
+            for i, card in enumerate(player.cards):
+                cards[2 * seat + i] = card.code
+        for i, card in enumerate(engine.board):
+            cards[2 * self.seats + i] = card.code
+        max_actions = self.max_actions
+        flags = TRUNCATED if len(self.actions) > max_actions else 0
+        actions = self.actions[:max_actions]
+        codes = bytes(ACTION_CODES[name] for name, _ in actions).ljust(max_actions, b'\0')
+        amounts = [int(amount) if name == 'raise' else 0 for name, amount in actions]
+        amounts += [0] * (max_actions - len(amounts))
+        self.file.write(self.record.pack(
+            *self.stacks, engine.small_blind, engine.big_blind, self.first_seat, bytes(cards), len(actions), flags,
+            winners[0] if len(winners) == 1 else NO_WINNER, 0 if rank is None else int(rank), engine.pot_money,
+            codes, *amounts))
+        self.hands += 1
+        self.stacks = None
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.detach()
+        if not self.file.closed:
+            self.file.close()
+
+
+def _check_header(path):
+    """returns (seats, action slots per record) of a record file"""
+    with open(path, 'rb') as f:
+        magic, version, seats, max_actions, size = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+    if (magic, version) != (MAGIC, RECORD_VERSION) or size != _record_struct(seats, max_actions).size:
+        raise ValueError("{} is not a version {} hand record file".format(path, RECORD_VERSION))
+    return seats, max_actions
+
+
+class HandRecordReader:
+    """Memory mapped, random access reader of a record file: len() hands, reader[n] is hand n"""
+
+    def __init__(self, path):
+        self.seats, self.max_actions = _check_header(path)
+        self.record = _record_struct(self.seats, self.max_actions)
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return (len(self.map) - RECORD_OFFSET) // self.record.size
+
+    def offset(self, n):
+        """returns the file offset of hand n"""
+        if not 0 <= n < len(self):
+            raise IndexError("hand {} is not in the file".format(n))
+        return RECORD_OFFSET + n * self.record.size
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        values = self.record.unpack_from(self.map, self.offset(n))
+        seats = self.seats
+        stacks = list(values[:seats])
+        small_blind, big_blind, first_seat, cards, count, flags, winner, rank, pot, codes = values[seats:seats + 10]
+        amounts = values[seats + 10:]
+        actions = [(ACTION_NAMES[codes[i]], amounts[i]) for i in range(count)]
+        return HandRecord(stacks, small_blind, big_blind, cards, actions, flags,
+                          None if winner == NO_WINNER else winner, HandRank(rank) if rank else None, pot, first_seat)
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class StackedDeck(StandardDeck):
+    """A deck dealing a fixed order of cards: the recorded ones first, then the rest of the deck. Shuffling does
+    nothing"""
+
+    def __init__(self, codes):
+        self.stack = [code for code in codes if code != NO_CARD]
+        stacked = set(self.stack)
+        self.rest = [card.code for card in DECK_ORDER if card.code not in stacked]
+        super().__init__()
+
+    def make_deck(self):
+        self.codes = array('B', self.stack + self.rest)
+        self.position = 0
+
+    def shuffle(self, count=None):
+        pass
+
+
+class HandReplay:
+    """Plays recorded hands again through a GameEngine, or a GameModel (e.g. one shown by a GameWindow), dealing
+    the recorded cards and repeating the recorded actions"""
+
+    def __init__(self, reader, game):
+        """
+        :param reader: a HandRecordReader
+        :param game: a GameEngine or GameModel with the same number of seats
+        """
+        self.reader = reader
+        self.game = game
+        self.engine = getattr(game, 'engine', game)
+
+    def steps(self, n):
+        """plays hand n, yielding once it is dealt and after every action, so a timer can pace a visual replay"""
+        record = self.reader[n]
+        if record.flags & TRUNCATED:
+            raise ValueError("hand {} has too many actions to be replayed".format(n))
+        engine = self.engine
+        engine.deck = StackedDeck(record.cards)
+        for player, stack in zip(engine.players, record.stacks):
+            player.total_money = stack
+            player.bet_money = 0
+            player.total_bet_money = 0
+        engine.small_blind, engine.big_blind = record.small_blind, record.big_blind
+        engine.first_seat = record.first_seat
+        self.game.restart_game()
+        yield record
+        for name, amount in record.actions:
+            if name == 'raise':
+                self.game.raise_bet(amount)
+            elif name == 'call':
+                self.game.call_bet()
+            else:
+                self.game.fold_bet()
+            yield record
+
+    def play(self, n):
+        """plays hand n at once and returns its record"""
+        record = None
+        for record in self.steps(n):
+            pass
+        return record
+
+    def run(self, start=0, stop=None):
+        """plays hands start to stop (default: the end of the file) and returns the number played"""
+        stop = len(self.reader) if stop is None else min(stop, len(self.reader))
+        for n in range(start, stop):
+            self.play(n)
+        return max(stop - start, 0)
@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+
+from cardlib import HandEvaluator
+
+#: the GameModel signals whose emissions are counted, besides the new_cards signal of its card models
+SIGNALS = ('money_changed', 'pot_money_changed', 'text_changed', 'game_message', 'flop_signal', 'turn_signal',
+           'river_signal', 'reveal_all_cards', 'find_best_poker_hand', 'reset_deck', 'player_action', 'hand_result',
+           'state_changed')
+#: the engine steps timed as spans nested in the action that runs them
+ENGINE_STEPS = ('progress_game', 'poker_best_hand')
+#: upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float('inf'))
+
+
+class ActionHistogram:
+    """Wall time histogram of one action"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def snapshot(self):
+        cumulative = []
+        total = 0
+        for n in self.counts:
+            total += n
+            cumulative.append(total)
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'buckets': {_bound_label(b): n for b, n in zip(self.buckets, cumulative)}}
+
+
+def _bound_label(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class GameInstrumentation:
+    """Opt-in latency and counter instrumentation for a GameModel.
+
+    Records a wall time histogram of every action run by GameModel.run_action, from the engine call to the last
+    slot of the signals it emitted, and of the ENGINE_STEPS as spans nested in those actions; how many times each
+    signal was emitted during each action, and how often the board evaluator was updated or read. While enabled,
+    the game, its engine and its board evaluator are switched to instrumented subclasses and a counting slot is
+    connected to every signal; disable() undoes both, so a game that was never instrumented runs exactly the
+    uninstrumented code. Snapshots can be written as JSON lines or a Prometheus text file, also periodically from a
+    background thread."""
+
+    def __init__(self, gamemodel, buckets=DEFAULT_BUCKETS):
+        self.gamemodel = gamemodel
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.histograms = {}  # action -> ActionHistogram
+        self.signals = {}  # action -> {signal: count}, an emit counts for every action running at the time
+        self.evaluator_calls = 0
+        self._running = []  # the stack of actions being timed
+        self._game_class = None
+        self._engine_class = None
+        self._evaluator_class = None
+        self._connections = []  # (signal, counting slot)
+        self._exporter = None
+
+    # ------------------------------------------------------------------ enabling
+
+    def enable(self):
+        """starts recording"""
+        if self._game_class is not None:
+            return
+        game = self.gamemodel
+        self._game_class = type(game)
+        game.__class__ = self._timed_game_class(self._game_class)
+        self._engine_class = type(game.engine)
+        game.engine.__class__ = self._timed_engine_class(self._engine_class)
+        self._evaluator_class = self._counting_evaluator_class()
+        game.engine.evaluator.__class__ = self._evaluator_class
+        signals = [(name, getattr(game, name)) for name in SIGNALS]
+        card_models = [player.hand for player in game.playermodels] + [game.tablemodel.hand, game.tablemodel]
+        signals += [('new_cards', model.new_cards) for model in card_models]
+        for name, signal in signals:
+            slot = self._counting_slot(name)
+            signal.connect(slot)
+            self._connections.append((signal, slot))
+
+    def disable(self):
+        """stops recording, restores the uninstrumented classes and disconnects the counting slots"""
+        if self._game_class is None:
+            return
+        game = self.gamemodel
+        game.__class__ = self._game_class
+        game.engine.__class__ = self._engine_class
+        if type(game.engine.evaluator) is self._evaluator_class:
+            game.engine.evaluator.__class__ = HandEvaluator
+        for signal, slot in self._connections:
+            signal.disconnect(slot)
+        self._connections = []
+        self._game_class = None
+        self._engine_class = None
+        self._evaluator_class = None
+
+    @property
+    def enabled(self):
+        return self._game_class is not None
+
+    def _timed_game_class(self, base):
+        instrumentation = self
+
+        def run_action(game, action, *args):
+            return instrumentation._time_action(action, base.run_action, game, (action,) + args)
+
+        return type('Instrumented' + base.__name__, (base,), {'run_action': run_action})
+
+    def _timed_engine_class(self, base):
+        instrumentation = self
+        namespace = {'__slots__': ()}
+
+        def timed(name):
+            original = getattr(base, name)
+
+            def step(engine, *args):
+                running = instrumentation._running
+                if running and running[-1] == name:  # GameModel.progress_game runs the step itself
+                    return original(engine, *args)
+                return instrumentation._time_action(name, original, engine, args)
+            step.__name__ = name
+            return step
+
+        for name in ENGINE_STEPS:
+            namespace[name] = timed(name)
+        return type('Instrumented' + base.__name__, (base,), namespace)
+
+    def _counting_slot(self, signal):
+        def count(*args):
+            self._count_signal(signal)
+        return count
+
+    def _counting_evaluator_class(self):
+        instrumentation = self
+
+        def add(evaluator, card):
+            instrumentation.evaluator_calls += 1
+            HandEvaluator.add(evaluator, card)
+
+        def strength_with(evaluator, cards):
+            instrumentation.evaluator_calls += 1
+            return HandEvaluator.strength_with(evaluator, cards)
+
+        return type('CountingHandEvaluator', (HandEvaluator,),
+                    {'__slots__': (), 'add': add, 'strength_with': strength_with})
+
+    # ------------------------------------------------------------------ recording
+
+    def _time_action(self, name, original, target, args):
+        self._running.append(name)
+        start = time.perf_counter()
+        try:
+            return original(target, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._running.pop()
+            with self.lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = ActionHistogram(self.buckets)
+                histogram.observe(elapsed)
+
+    def _count_signal(self, signal):
+        with self.lock:
+            for name in set(self._running):
+                counts = self.signals.setdefault(name, {})
+                counts[signal] = counts.get(signal, 0) + 1
+
+    def reset(self):
+        """forgets everything recorded so far"""
+        with self.lock:
+            self.histograms.clear()
+            self.signals.clear()
+            self.evaluator_calls = 0
+
+    # ------------------------------------------------------------------ exporting
+
+    def snapshot(self):
+        """returns the recorded data as a dictionary"""
+        with self.lock:
+            return {'time': time.time(),
+                    'actions': {name: h.snapshot() for name, h in self.histograms.items()},
+                    'signals': {name: dict(counts) for name, counts in self.signals.items()},
+                    'evaluator_calls': self.evaluator_calls}
+
+    def write_json_line(self, path):
+        """appends a snapshot to a JSON lines file"""
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot(), sort_keys=True) + '\n')
+
+    def prometheus_text(self):
+        """returns a snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = ['# HELP pokergui_action_seconds Wall time of GameModel actions.',
+                 '# TYPE pokergui_action_seconds histogram']
+        for name, data in sorted(snapshot['actions'].items()):
+            for bound, count in data['buckets'].items():
+                lines.append('pokergui_action_seconds_bucket{{action="{}",le="{}"}} {}'.format(name, bound, count))
+            lines.append('pokergui_action_seconds_sum{{action="{}"}} {}'.format(name, data['sum']))
+            lines.append('pokergui_action_seconds_count{{action="{}"}} {}'.format(name, data['count']))
+        lines += ['# HELP pokergui_signal_emissions_total Signals emitted while an action ran.',
+                  '# TYPE pokergui_signal_emissions_total counter']
+        for name, counts in sorted(snapshot['signals'].items()):
+            for signal, count in sorted(counts.items()):
+                lines.append('pokergui_signal_emissions_total{{action="{}",signal="{}"}} {}'.format(
+                    name, signal, count))
+        lines += ['# HELP pokergui_evaluator_calls_total Hand evaluator updates and reads.',
+                  '# TYPE pokergui_evaluator_calls_total counter',
+                  'pokergui_evaluator_calls_total {}'.format(snapshot['evaluator_calls'])]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """writes a snapshot to a Prometheus text file, replacing it atomically"""
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(path + '.tmp', path)
+
+    def start_export(self, path, interval=10.0, fmt='jsonl'):
+        """
+        writes a snapshot every interval seconds from a background thread
+
+        :param fmt: 'jsonl' to append JSON lines, 'prometheus' to rewrite a Prometheus text file
+        """
+        self.stop_export()
+        write = self.write_json_line if fmt == 'jsonl' else self.write_prometheus
+        stop = threading.Event()
+
+        def export():
+            while not stop.wait(interval):
+                write(path)
+            write(path)  # a last snapshot when stopping
+
+        thread = threading.Thread(target=export, name='pokergui-metrics', daemon=True)
+        thread.start()
+        self._exporter = (thread, stop)
+
+    def stop_export(self):
+        """stops the periodic export, writing a final snapshot"""
+        if self._exporter is not None:
+            thread, stop = self._exporter
+            stop.set()
+            thread.join()
+            self._exporter = None
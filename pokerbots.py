@@ -0,0 +1,115 @@
+import abc
+import random
+
+from pokerengine import *
+
+
+class Bot(abc.ABC):
+    """A betting policy for one seat; subclasses implement act()"""
+
+    def __init__(self, rng=None):
+        self.rng = rng if isinstance(rng, random.Random) else random.Random(rng)
+
+    @abc.abstractmethod
+    def act(self, engine, index):
+        """
+        picks the action of the player to act
+
+        :param engine: the GameEngine of the hand
+        :param index: the seat of the player to act
+        :return: ('call', 0), ('fold', 0) or ('raise', amount); a call with nothing to call is a check
+        """
+
+    @staticmethod
+    def to_call(engine, index):
+        """returns the money a player needs to call"""
+        return engine.high_bet - engine.players[index].bet_money
+
+
+class CallBot(Bot):
+    """Calls or checks every time"""
+
+    def act(self, engine, index):
+        return 'call', 0
+
+
+class RandomBot(Bot):
+    """Folds to some bets, raises one to four big blinds now and then and calls otherwise"""
+
+    def act(self, engine, index):
+        x = self.rng.random()
+        if x < 0.15 and self.to_call(engine, index):
+            return 'fold', 0
+        if x < 0.3:
+            return 'raise', engine.big_blind * self.rng.randint(1, 4)
+        return 'call', 0
+
+
+class TightBot(Bot):
+    """Plays good starting hands and made hands: raises pairs and two high cards before the flop, calls with one
+    high card or suited connectors, and after the flop calls with a hand better than the board alone and raises
+    with two pairs or better"""
+
+    def act(self, engine, index):
+        player = engine.players[index]
+        to_call = self.to_call(engine, index)
+        if not engine.board:
+            high, low = sorted(card.value for card in player.cards)[::-1]
+            suited = player.cards[0].suit == player.cards[1].suit
+            if high == low or low >= 10:
+                return 'raise', 3 * engine.big_blind
+            if (high >= 12 or suited and high - low == 1) and to_call <= 2 * engine.big_blind:
+                return 'call', 0
+        else:
+            rank = engine.evaluator.strength_with(player.cards) >> STRENGTH_SHIFT
+            if rank > engine.evaluator.strength >> STRENGTH_SHIFT:
+                if rank >= HandRank.get_two_pairs:
+                    return 'raise', max(engine.pot_money // 2, engine.big_blind)
+                return 'call', 0
+        return ('fold', 0) if to_call else ('call', 0)
+
+
+class AggressiveBot(Bot):
+    """Never folds and raises the size of the pot often"""
+
+    def act(self, engine, index):
+        if self.rng.random() < 0.4:
+            return 'raise', max(engine.pot_money, engine.big_blind)
+        return 'call', 0
+
+
+BOTS = {'call': CallBot, 'random': RandomBot, 'tight': TightBot, 'aggressive': AggressiveBot}
+
+
+def make_bots(policies, seed=None):
+    """
+    returns one bot per seat
+
+    :param policies: list of policy names from BOTS
+    :param seed: seed of the bots' random generators
+    """
+    for name in policies:
+        if name not in BOTS:
+            raise ValueError("unknown bot policy {!r}, use one of {}".format(name, ", ".join(BOTS)))
+    seeder = random.Random(seed)
+    return [BOTS[name](seeder.getrandbits(64)) for name in policies]
+
+
+def play_hand(engine, bots):
+    """
+    plays the current hand to its end with one bot per player
+
+    :return: the number of actions taken
+    """
+    actions = 0
+    while engine.pot_money:
+        index, _ = engine.active_player()
+        action, amount = bots[index].act(engine, index)
+        if action == 'fold':
+            engine.fold_bet()
+        elif action == 'raise':
+            engine.raise_bet(amount)
+        else:
+            engine.call_bet()
+        actions += 1
+    return actions
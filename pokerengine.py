@@ -0,0 +1,559 @@
+import random
+from array import array
+
+from cardlib import *
+
+
+MAX_SEATS = 10
+
+
+class PlayerState:
+    """The state of a player: name, cards, total money, the money bet this street and this hand, whether it is
+    the player's turn, whether the player is out of the hand and has acted since the last raise"""
+    __slots__ = ('name', 'cards', 'total_money', 'bet_money', 'total_bet_money', 'active', 'turns', 'folded', 'acted')
+
+    def __init__(self, name, total_money):
+        self.name = name
+        self.cards = []
+        self.total_money = total_money
+        self.bet_money = 0
+        self.total_bet_money = 0
+        self.active = None
+        self.turns = 0
+        self.folded = False  # folded, or sitting the hand out without money
+        self.acted = False
+
+    def can_act(self):
+        """True while the player is in the hand and not all-in"""
+        return not self.folded and self.total_money > 0
+
+
+class StateDiff:
+    """The state changes of one engine action, collected from its events (by GameModel in batching mode and by the
+    table server). Fields that did not change are None (or empty); the others hold the state after the action"""
+    __slots__ = ('players', 'pot_money', 'hands', 'board', 'streets', 'revealed', 'shown', 'actions', 'result',
+                 'texts', 'messages')
+
+    def __init__(self):
+        self.players = None  # [(total_money, bet_money, total_bet_money, active)] per player
+        self.pot_money = None
+        self.hands = {}  # player index -> hole cards
+        self.board = None  # table cards
+        self.streets = []  # 'flop_signal', 'turn_signal' and/or 'river_signal', in the order dealt
+        self.revealed = False  # the showdown revealed all cards
+        self.shown = None  # player index -> card codes of the hands shown, see reveal()
+        self.actions = []  # (player index, 'call'/'raise'/'fold', amount)
+        self.result = None  # (indices of the players paid, HandRank or None after a fold)
+        self.texts = []  # status log lines
+        self.messages = []  # end of hand messages
+
+    def add(self, event, *args):
+        """records an engine event; the values are filled in by finish()"""
+        if event == 'money_changed':
+            self.players = True
+        elif event == 'pot_money_changed':
+            self.pot_money = True
+        elif event == 'hand_changed':
+            self.hands[args[0]] = None
+        elif event == 'board_changed':
+            self.board = True
+        elif event == 'reveal_all_cards':
+            self.revealed = True
+        elif event == 'player_action':
+            self.actions.append(args)
+        elif event == 'hand_result':
+            self.result = args
+        elif event == 'text_changed':
+            self.texts.append(args[0])
+        elif event == 'game_message':
+            self.messages.append(args[0])
+        else:
+            self.streets.append(event)
+
+    def reveal(self, players):
+        """records the reveal_all_cards event together with the hands still in at that moment, for listeners that
+        may only read the cards after later actions dealt new ones"""
+        self.revealed = True
+        self.shown = {i: [card.code for card in player.cards] for i, player in enumerate(players) if not player.folded}
+
+    def finish(self, engine):
+        """fills in the values of the changed fields from the engine"""
+        if self.players is not None:
+            self.players = [(p.total_money, p.bet_money, p.total_bet_money, p.active) for p in engine.players]
+        if self.pot_money is not None:
+            self.pot_money = engine.pot_money
+        for i in self.hands:
+            self.hands[i] = tuple(engine.players[i].cards)
+        if self.board is not None:
+            self.board = tuple(engine.board)
+
+    def __bool__(self):
+        return bool(self.players is not None or self.pot_money is not None or self.hands or self.board is not None
+                    or self.streets or self.revealed or self.actions or self.result is not None or self.texts
+                    or self.messages)
+
+
+class GameState:
+    """An immutable snapshot of the state of a hand: the players, the board, the deck and the betting. Snapshots
+    are never changed, so sharing one is a clone, and apply() returns a new snapshot sharing the unchanged players
+    with its parent, which undo() returns. The engine's random generator is not part of a snapshot, so a restored
+    engine shuffles the next hands differently"""
+    __slots__ = ('players', 'seats', 'first_seat', 'board', 'deck', 'position', 'counter', 'pot_money', 'high_bet',
+                 'big_blind', 'small_blind', 'parent', 'action')
+
+    def __init__(self, engine, parent=None, action=None):
+        """
+        :param engine: the GameEngine to take the snapshot of
+        :param parent: the snapshot the engine was in before action, if any
+        :param action: (name, amount) of the action leading here from parent
+        """
+        players = tuple((tuple(p.cards), p.total_money, p.bet_money, p.total_bet_money, p.active, p.turns, p.folded,
+                         p.acted) for p in engine.players)
+        if parent is not None:  # share the players the action did not change
+            players = tuple(old if old == new else new for old, new in zip(parent.players, players))
+        self.players = players  # per player (cards, total_money, bet_money, total_bet_money, active, turns,
+        # folded, acted)
+        self.seats = tuple(engine.seats)
+        self.first_seat = engine.first_seat
+        self.board = tuple(engine.board)
+        self.deck = parent.deck if parent is not None else engine.deck.codes.tobytes()  # fixed during a hand
+        self.position = engine.deck.position
+        self.counter = engine.counter
+        self.pot_money = engine.pot_money
+        self.high_bet = engine.high_bet
+        self.big_blind = engine.big_blind
+        self.small_blind = engine.small_blind
+        self.parent = parent
+        self.action = action
+
+    @property
+    def hand_over(self):
+        """True once the pot has been paid out"""
+        return not self.pot_money
+
+    def to_act(self):
+        """returns the index of the player to act"""
+        for i, values in enumerate(self.players):
+            if values[4]:
+                return i
+        return self.seats[0]
+
+    def apply(self, action, amount=0):
+        """
+        returns the snapshot after an action of the player to act
+
+        :param action: 'call', 'raise' (by amount) or 'fold'
+        """
+        if self.hand_over:
+            raise ValueError("the hand is over")
+        engine = _scratch_engine(len(self.players))
+        engine.restore(self)
+        if action == 'call':
+            engine.call_bet()
+        elif action == 'raise':
+            engine.raise_bet(amount)
+        elif action == 'fold':
+            engine.fold_bet()
+        else:
+            raise ValueError("unknown action {!r}".format(action))
+        return GameState(engine, self, (action, amount))
+
+    def undo(self):
+        """returns the snapshot before the action leading here, or None for a snapshot taken from an engine"""
+        return self.parent
+
+
+_scratch_engines = {}  # seat count -> engine used by GameState.apply
+
+
+def _scratch_engine(seats):
+    engine = _scratch_engines.get(seats)
+    if engine is None:
+        engine = GameEngine.__new__(GameEngine)
+        engine.players = [PlayerState("Seat {}".format(i + 1), 0) for i in range(seats)]
+        engine.board = []
+        engine.evaluator = HandEvaluator()
+        engine.rng = random.Random(0)
+        engine.deck = StandardDeck(engine.rng)
+        engine.listener = None
+        _scratch_engines[seats] = engine
+    return engine
+
+
+class GameEngine:
+    """Texas hold'em for 2 to 10 seats without any Qt: blinds, calling (or checking), raising, folding, dealing the
+    streets and the showdown with side pots.
+
+    The first seat (from first_seat on, 0 unless a caller moves it between hands) posts the small blind and the
+    second the big blind; players without money sit the hand out.
+    Before the flop the seat after the big blind acts first (the small blind when heads-up), after it the first
+    seat still in the hand (the big blind when heads-up). The board is evaluated once per street and every seat at
+    the showdown is scored against it.
+
+    The engine shuffles with its own random generator, so a seeded engine always deals the same hands.
+    State changes are reported to an optional listener, called as listener(event, *args) with one of the events
+    'money_changed', 'pot_money_changed', 'text_changed' (log), 'game_message' (message), 'hand_changed' (player
+    index), 'board_changed', 'flop_signal', 'turn_signal', 'river_signal', 'reveal_all_cards', 'player_action'
+    (player index, 'call'/'raise'/'fold', amount) and 'hand_result' (tuple of the indices of the players paid,
+    HandRank of the best hand or None when the hand was folded), sent just before the pot is emptied.
+    Log and message strings are only built when there is a listener."""
+    __slots__ = ('players', 'seats', 'first_seat', 'board', 'evaluator', 'deck', 'rng', 'counter', 'pot_money',
+                 'high_bet', 'big_blind', 'small_blind', 'listener')
+
+    def __init__(self, players, listener=None, rng=None, big_blind=None, first_seat=0):
+        """
+        :param players: list of 2 to MAX_SEATS PlayerState objects
+        :param listener: optional callable receiving the state changes
+        :param rng: a random.Random to shuffle with, or a seed for a new one
+        :param big_blind: the big blind, a hundredth of the second player's money by default
+        :param first_seat: the seat posting the small blind in the first hand
+        """
+        if not 2 <= len(players) <= MAX_SEATS:
+            raise ValueError("a table has 2 to {} players, not {}".format(MAX_SEATS, len(players)))
+        self.players = players
+        self.listener = listener
+        self.rng = rng if isinstance(rng, random.Random) else random.Random(rng)
+        self.board = []
+        self.evaluator = HandEvaluator()  # the board cards
+        self.deck = StandardDeck(self.rng)
+        self.shuffle_deck()
+        self.big_blind = self.players[1].total_money // 100 if big_blind is None else big_blind
+        self.small_blind = self.big_blind // 2
+        self.first_seat = first_seat  # the index of the player posting the small blind, if that player has money
+        self._start_hand()
+        small, big = self.players[self.seats[0]], self.players[self.seats[1]]
+        self._log("Start\n{} is the small blind and bets ${}\n{} is the big blind and bets ${}",
+                  small.name, small.bet_money, big.name, big.bet_money)
+
+    def _notify(self, event, *args):
+        if self.listener is not None:
+            self.listener(event, *args)
+
+    def _log(self, template, *args):
+        if self.listener is not None:
+            self.listener('text_changed', template.format(*args))
+
+    def _start_hand(self):
+        """seats the players with money, clears the table, deals and posts the blinds"""
+        seated = [i for i, player in enumerate(self.players) if player.total_money > 0]
+        self.seats = [i for i in seated if i >= self.first_seat] + [i for i in seated if i < self.first_seat]
+        if len(self.seats) < 2:
+            raise ValueError("a hand needs two players with money")
+        for player in self.players:
+            player.cards.clear()
+            player.folded = player.total_money <= 0
+            player.acted = False
+            player.active = False
+            player.bet_money = 0
+            player.total_bet_money = 0
+        self.board.clear()
+        self.evaluator.clear()
+        self.counter = 0  # this tracks the game progress
+        self.pot_money = 0
+        self.high_bet = 0  # the largest bet of this street
+        self.deal_hands()
+        self.post_blinds()
+
+    def _bet(self, player, amount):
+        """moves money from a player to the pot, all-in when the player has less; returns the amount bet"""
+        amount = min(amount, player.total_money)
+        player.total_money -= amount
+        player.bet_money += amount
+        player.total_bet_money += amount
+        self.pot_money += amount
+        self.high_bet = max(self.high_bet, player.bet_money)
+        return amount
+
+    def _activate(self, start):
+        """passes the turn to the first player from seat position start on who can act, if any"""
+        seats = self.seats
+        for k in range(len(seats)):
+            player = self.players[seats[(start + k) % len(seats)]]
+            if player.can_act():
+                for other in self.players:
+                    other.active = False
+                player.active = True
+                return
+
+    def _pass_turn(self, index):
+        self._activate(self.seats.index(index) + 1)
+        self._notify('money_changed')
+
+    def _end_hand(self, message):
+        """empties the pot after it has been paid out and reports the end of the hand"""
+        self.pot_money = 0
+        for player in self.players:
+            player.total_bet_money = 0
+        self._notify('pot_money_changed')
+        self._notify('game_message', message)
+
+    def shuffle_deck(self):
+        """shuffles the deck just deep enough for the hole cards and the board"""
+        self.deck.shuffle(2 * len(self.players) + 5)
+
+    def deal_hands(self):
+        """deals two cards to every player in the hand"""
+        for i, player in enumerate(self.players):
+            if not player.folded:
+                player.cards.append(self.deck.draw())
+                player.cards.append(self.deck.draw())
+            self._notify('hand_changed', i)
+
+    def post_blinds(self):
+        """the first seat bets the small blind, the second the big blind"""
+        self._bet(self.players[self.seats[0]], self.small_blind)
+        self._bet(self.players[self.seats[1]], self.big_blind)
+        self._activate(2)  # the seat after the big blind, the small blind when heads-up
+        self._notify('pot_money_changed')
+        self._notify('money_changed')
+
+    def active_player(self):
+        """returns (index, player) of the player to act"""
+        for i, player in enumerate(self.players):
+            if player.active:
+                return i, player
+        return self.seats[0], self.players[self.seats[0]]
+
+    def call_bet(self):
+        """matches the largest bet of the street (a check when there is nothing to call)"""
+        index, player = self.active_player()
+        call_amount = min(self.high_bet - player.bet_money, player.total_money)
+        self._notify('player_action', index, 'call', call_amount)
+        if call_amount:
+            self._log("{} called ${}", player.name, call_amount)
+        else:
+            self._log("{} checked", player.name)
+        self._bet(player, call_amount)
+        self._notify('pot_money_changed')
+        player.acted = True
+        self._pass_turn(index)
+        self.progress_game()
+
+    def fold_bet(self):
+        index, player = self.active_player()
+        self._notify('player_action', index, 'fold', 0)
+        player.folded = True
+        player.acted = True
+        live = [i for i in self.seats if not self.players[i].folded]
+        if len(live) > 1:
+            self._log("{} folded", player.name)
+            self._pass_turn(index)
+            self.progress_game()
+            return
+        # the last player in the hand takes the pot
+        winner = self.players[live[0]]
+        winner.total_money += self.pot_money
+        player.active = False
+        winner.active = True
+        self._notify('money_changed')
+        self._log("{} folded. The pot money of {} goes to {}", player.name, self.pot_money, winner.name)
+        message = "{} won the game!".format(winner.name) if self.listener is not None else None
+        self._notify('hand_result', (live[0],), None)
+        self._end_hand(message)
+
+    def raise_bet(self, raise_amount):
+        """calls the largest bet of the street and raises it by raise_amount"""
+        index, player = self.active_player()
+        self._notify('player_action', index, 'raise', raise_amount)
+        call_amount = self.high_bet - player.bet_money
+        high_bet = self.high_bet
+        total = self._bet(player, call_amount + raise_amount)
+        self._notify('pot_money_changed')
+        player.turns += 1
+        if self.high_bet > high_bet:  # everyone else acts again
+            for other in self.players:
+                other.acted = False
+        player.acted = True
+        self._pass_turn(index)
+        self._log("{} raised the bet by ${} over the called bet of ${}. A total of ${}!",
+                  player.name, raise_amount, call_amount, total)
+        self.progress_game()
+
+    def restart_game(self):
+        # fresh deck
+        self.deck.make_deck()
+        self.shuffle_deck()
+        # reinitialise players and table
+        self._start_hand()
+        self._notify('board_changed')
+        small, big = self.players[self.seats[0]], self.players[self.seats[1]]
+        self._log("================\nGame Restarted!================\n{} is the small blind and bets ${}\n"
+                  "{} is the big blind and bets ${}", small.name, small.bet_money, big.name, big.bet_money)
+
+    def players_with_money(self):
+        """returns how many players can still play a hand"""
+        return sum(1 for player in self.players if player.total_money > 0)
+
+    def new_game(self, stacks):
+        """
+        starts a new game once the old one is over: every player gets a fresh stack, then a hand is dealt
+
+        :param stacks: the money of each player
+        """
+        for player, money in zip(self.players, stacks):
+            player.total_money = money
+        self._log("================\nNew game! Every player gets a fresh stack\n================")
+        self.restart_game()
+
+    def deal_board(self, count, signal):
+        """deals count cards to the table"""
+        for _ in range(count):
+            card = self.deck.draw()
+            self.board.append(card)
+            self.evaluator.add(card)
+        self._notify('board_changed')
+        self._notify(signal)
+
+    def betting_done(self):
+        """True when every player who can still act has acted and matched the largest bet"""
+        able = [player for player in self.players if player.can_act()]
+        if len(able) <= 1 and all(player.bet_money >= self.high_bet for player in able):
+            return True  # nobody left to bet against
+        return all(player.acted and player.bet_money == self.high_bet for player in able)
+
+    def progress_game(self):
+        """moves on to the next street once the betting is done; when at most one player can still bet, the
+        remaining streets are dealt at once"""
+        while self.betting_done():
+            self._return_uncalled()
+            if self.counter == 3:
+                self._log("\n================\nFinal round of betting completed! \n================\n The players"
+                          " can now reveal their cards\n")
+                self._notify('reveal_all_cards')
+                self.poker_best_hand()
+                return
+            for player in self.players:
+                player.bet_money = 0
+                player.acted = False
+            self.high_bet = 0
+            if self.counter == 0:
+                self._log("\n================\nFirst round of betting completed\n================\n"
+                          " Dealing the flop\n")
+                self.deal_board(3, 'flop_signal')
+            elif self.counter == 1:
+                self._log("\n================\nSecond round of betting completed \n================\n"
+                          " Dealing the Turn\n")
+                self.deal_board(1, 'turn_signal')
+            else:
+                self._log("\n================\nThird round of betting completed \n================\n The final card,"
+                          " the river, is now shown\n")
+                self.deal_board(1, 'river_signal')
+            self.counter += 1
+            # after the flop the first seat in the hand acts first (the big blind when heads-up)
+            self._activate(1 if len(self.seats) == 2 else 0)
+            self._notify('money_changed')  # the views follow the turn on this signal
+
+    def _return_uncalled(self):
+        """gives the part of the largest bet of the hand that nobody else matched back to its bettor, so it is never
+        paid out as a pot"""
+        bets = sorted(((player.total_bet_money, i) for i, player in enumerate(self.players)), reverse=True)
+        (top, index), (second, _) = bets[0], bets[1]
+        player = self.players[index]
+        if top <= second or player.folded:
+            return
+        excess = top - second
+        player.total_money += excess
+        player.bet_money -= excess
+        player.total_bet_money -= excess
+        self.pot_money -= excess
+        self._log("The uncalled ${} goes back to {}", excess, player.name)
+        self._notify('money_changed')
+        self._notify('pot_money_changed')
+
+    def side_pots(self):
+        """
+        splits the money bet this hand into the main pot and the side pots
+
+        :return: list of (amount, indices of the players in the hand who can win it), main pot first
+        """
+        contributions = [player.total_bet_money for player in self.players]
+        live = [i for i in self.seats if not self.players[i].folded]
+        pots = []
+        previous = 0
+        for level in sorted(set(contributions[i] for i in live)):
+            amount = sum(min(c, level) - min(c, previous) for c in contributions)
+            pots.append((amount, [i for i in live if contributions[i] >= level]))
+            previous = level
+        rest = self.pot_money - sum(amount for amount, _ in pots)  # bets of folded players above every live bet
+        if rest:
+            pots[-1] = (pots[-1][0] + rest, pots[-1][1])
+        return pots
+
+    def poker_best_hand(self):
+        """pays every pot to the best poker hand among the players who can win it, splitting it on a tie"""
+        live = [i for i in self.seats if not self.players[i].folded]
+        # one pass over the players still in the hand, each scored against the board evaluator
+        strength_with = self.evaluator.strength_with
+        strengths = {i: strength_with(self.players[i].cards) for i in live}
+        paid = {}
+        pots = self.side_pots()
+        results = []
+        for amount, eligible in pots:
+            best = max(strengths[i] for i in eligible)
+            winners = [i for i in eligible if strengths[i] == best]
+            share, odd = divmod(amount, len(winners))
+            for k, i in enumerate(winners):
+                paid[i] = paid.get(i, 0) + share + (1 if k < odd else 0)  # odd chips to the first seats
+            results.append((amount, winners, best))
+        for i, amount in paid.items():
+            self.players[i].total_money += amount
+        self._notify('money_changed')
+        main_rank = HandRank(results[0][2] >> STRENGTH_SHIFT)
+        message = None
+        if self.listener is not None:
+            message = self._showdown_message(live, strengths, results)
+        self._notify('hand_result', tuple(sorted(paid)), main_rank)
+        self._end_hand(message)
+
+    def _showdown_message(self, live, strengths, results):
+        players = self.players
+        if len(live) == 2 and len(results) == 1:
+            # heads-up with one pot
+            first, second = (PokerHand(players[i].cards + self.board, strengths[i]) for i in live)
+            if first == second:
+                return "It's a tie! Both players have '{}'".format(first.rank.name)
+            if second < first:
+                winner, loser, best, other = players[live[0]], players[live[1]], first, second
+            else:
+                winner, loser, best, other = players[live[1]], players[live[0]], second, first
+            if best.rank == other.rank:
+                return "Both players had same hand {}, but {}'s cards:{} win over {}'s cards:{}".format(
+                    best.rank.name, winner.name, best.hand_cards, loser.name, other.hand_cards)
+            return "{} wins!\n {} had '{}' against {}'s '{}'".format(
+                winner.name, winner.name, best.rank.name, loser.name, other.rank.name)
+        lines = []
+        for n, (amount, winners, best) in enumerate(results):
+            pot = "the main pot" if n == 0 else "side pot {}".format(n)
+            rank = HandRank(best >> STRENGTH_SHIFT).name
+            if len(winners) == 1:
+                lines.append("{} wins {} of ${} with '{}'".format(players[winners[0]].name, pot, amount, rank))
+            else:
+                lines.append("{} split {} of ${} with '{}'".format(
+                    " and ".join(players[i].name for i in winners), pot, amount, rank))
+        return "\n".join(lines)
+
+    def snapshot(self):
+        """returns a GameState of the hand"""
+        return GameState(self)
+
+    def restore(self, state):
+        """puts the engine back into a snapshot; the card lists are refilled in place, so models sharing them
+        stay in sync"""
+        if len(state.players) != len(self.players):
+            raise ValueError("the snapshot has {} players, the game {}".format(len(state.players), len(self.players)))
+        for player, (cards, player.total_money, player.bet_money, player.total_bet_money, player.active,
+                     player.turns, player.folded, player.acted) in zip(self.players, state.players):
+            player.cards[:] = cards
+        self.seats = list(state.seats)
+        self.first_seat = state.first_seat
+        self.board[:] = state.board
+        self.evaluator.clear()
+        for card in self.board:
+            self.evaluator.add(card)
+        self.deck.codes = array('B', state.deck)
+        self.deck.position = state.position
+        self.counter = state.counter
+        self.pot_money = state.pot_money
+        self.high_bet = state.high_bet
+        self.big_blind = state.big_blind
+        self.small_blind = state.small_blind
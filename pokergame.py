@@ -1,16 +1,211 @@
-from pokerview import *
+import argparse
+import atexit
+import json
+import os
+import random
+import sys
+import time
+start_time = time.perf_counter()  # for the time to first frame
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pokerengine import *
+from pokerbots import BOTS, make_bots, play_hand
 
 # User can enter inputs here
 starting_money = 50000
-Player_1_name = "P1"
-Player_2_name = "P2"
-
-game_players = [PlayerModel(Player_1_name, starting_money),
-                PlayerModel(Player_2_name, starting_money)]
-game_table = TableModel()
-poker_game = GameModel(game_players, game_table)
-
-qt_app = QApplication(sys.argv)
-win = GameWindow(poker_game)
-win.show()
-qt_app.exec_()
+player_names = ["P1", "P2"]  # 2 to 10 seats
+tables = 1  # number of tables played at once, each in its own window
+hand_history_file = "hand_history.log"  # the full game log, rotated at 10 MB
+use_card_atlas = os.environ.get('POKERGUI_CARD_ATLAS') == '1'  # load the cards from a cached sprite atlas
+
+BATCH_CHUNK = 1000  # hands per batch task, each with its own seed
+POT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, float('inf'))  # upper bounds of the pot histogram, in big blinds
+
+
+def run_gui(card_atlas=use_card_atlas):
+    """opens a window per table and runs the Qt event loop"""
+    from pokerview import application, CardView, FirstFrameTimer, GameWindow
+    from pokermodel import GameModel, PlayerModel, TableModel
+    from handhistory import HandHistoryLog
+
+    qt_app = application()
+    if card_atlas:
+        CardView.card_images.load_atlas()
+
+    windows = []
+    for table in range(tables):
+        game_players = [PlayerModel(name, starting_money) for name in player_names]
+        game_table = TableModel()
+        poker_game = GameModel(game_players, game_table, batching=True)  # one view update per action
+        # one log per table: hand_history.log, hand_history_2.log, ...
+        root, ext = os.path.splitext(hand_history_file)
+        hand_history = HandHistoryLog(hand_history_file if table == 0 else "{}_{}{}".format(root, table + 1, ext))
+        hand_history.follow(poker_game)
+        atexit.register(hand_history.close)
+
+        win = GameWindow(poker_game)
+        win.move(win.x() + 40 * table, win.y() + 40 * table)
+        windows.append(win)
+
+    # report the time to the first frame, then parse the remaining cards in the background
+    first_frame = FirstFrameTimer(windows[0], start_time, CardView.card_images.preload)
+    for win in windows:
+        win.show()
+    return qt_app.exec_()
+
+
+class BatchStats:
+    """Totals of a headless run: hands won and money won per seat, the HandRank of the winning hand at each
+    showdown, and a histogram of the pot sizes in big blinds. Stats of several chunks are merged by summing"""
+
+    def __init__(self, seats):
+        self.hands = 0
+        self.actions = 0
+        self.wins = [0.0] * seats  # split pots count a share
+        self.money = [0] * seats  # net money won
+        self.ranks = {}  # HandRank name or 'fold' -> hands
+        self.pot_sum = 0
+        self.pot_max = 0
+        self.pot_counts = [0] * len(POT_BUCKETS)
+
+    def add_hand(self, winners, rank, pot, big_blind, net):
+        self.hands += 1
+        for i in winners:
+            self.wins[i] += 1.0 / len(winners)
+        for i, money in enumerate(net):
+            self.money[i] += money
+        name = 'fold' if rank is None else HandRank(rank).name
+        self.ranks[name] = self.ranks.get(name, 0) + 1
+        self.pot_sum += pot
+        self.pot_max = max(self.pot_max, pot)
+        for i, bound in enumerate(POT_BUCKETS):
+            if pot <= bound * big_blind:
+                self.pot_counts[i] += 1
+                break
+
+    def merge(self, other):
+        self.hands += other.hands
+        self.actions += other.actions
+        self.wins = [a + b for a, b in zip(self.wins, other.wins)]
+        self.money = [a + b for a, b in zip(self.money, other.money)]
+        for name, count in other.ranks.items():
+            self.ranks[name] = self.ranks.get(name, 0) + count
+        self.pot_sum += other.pot_sum
+        self.pot_max = max(self.pot_max, other.pot_max)
+        self.pot_counts = [a + b for a, b in zip(self.pot_counts, other.pot_counts)]
+        return self
+
+    def summary(self, seconds, policies, big_blind):
+        hands = self.hands or 1
+        return {'hands': self.hands, 'actions': self.actions, 'seconds': seconds,
+                'hands_per_second': self.hands / seconds if seconds else 0.0,
+                'seats': [{'policy': policy, 'win_rate': self.wins[i] / hands,
+                           'big_blinds_per_100': 100.0 * self.money[i] / big_blind / hands}
+                          for i, policy in enumerate(policies)],
+                'hand_ranks': {name: count / hands for name, count in sorted(self.ranks.items())},
+                'pot': {'mean': self.pot_sum / hands, 'max': self.pot_max,
+                        'big_blinds': {('+Inf' if bound == float('inf') else str(bound)): count / hands
+                                       for bound, count in zip(POT_BUCKETS, self.pot_counts)}}}
+
+
+def play_chunk(chunk, count, seed, policies, stack):
+    """
+    worker: plays hands with full stacks, the small blind moving round the table every hand
+
+    :param chunk: the chunk's number, which together with the run's seed makes its seed
+    :return: a BatchStats
+    """
+    rng = random.Random("{}:{}".format(seed, chunk))
+    bots = make_bots(policies, rng.getrandbits(64))
+    players = [PlayerState(name, stack) for name in ("Seat {}".format(i + 1) for i in range(len(policies)))]
+    stats = BatchStats(len(players))
+    result = []
+
+    def listener(event, *args):
+        if event == 'hand_result':
+            result[:] = args[0], args[1], engine.pot_money
+
+    engine = GameEngine(players, rng=rng.getrandbits(64), first_seat=chunk % len(players))
+    for hand in range(count):
+        if hand:
+            for player in players:
+                player.total_money = stack
+            engine.first_seat = (engine.seats[0] + 1) % len(players)
+            engine.restart_game()
+        engine.listener = listener
+        stats.actions += play_hand(engine, bots)
+        engine.listener = None  # no log text between hands
+        winners, rank, pot = result
+        stats.add_hand(winners, rank, pot, engine.big_blind, [player.total_money - stack for player in players])
+    return stats
+
+
+def run_batch(hands, policies, seed=0, workers=None, stack=starting_money, progress=None):
+    """
+    plays a number of hands between bots without Qt, split into chunks of BATCH_CHUNK hands over a process pool.
+    Every chunk has its own seed, so the results do not depend on the number of workers
+
+    :param policies: bot policy name per seat
+    :param workers: number of processes, defaults to the number of cores. 1 plays in this process
+    :param progress: optional callable(hands done, hands) called as the chunks complete
+    :return: a BatchStats
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = [(chunk, min(BATCH_CHUNK, hands - start)) for chunk, start in enumerate(range(0, hands, BATCH_CHUNK))]
+    stats = BatchStats(len(policies))
+    if workers == 1:
+        for chunk, count in chunks:
+            stats.merge(play_chunk(chunk, count, seed, policies, stack))
+            if progress is not None:
+                progress(stats.hands, hands)
+        return stats
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_chunk, chunk, count, seed, policies, stack) for chunk, count in chunks]
+        for future in as_completed(futures):
+            stats.merge(future.result())
+            if progress is not None:
+                progress(stats.hands, hands)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Texas hold'em: the desktop game, or a headless run between bots")
+    parser.add_argument('--card-atlas', action='store_true', default=use_card_atlas,
+                        help="load the cards from a cached sprite atlas (also POKERGUI_CARD_ATLAS=1)")
+    parser.add_argument('--batch', action='store_true', help="play bots against each other without a window")
+    parser.add_argument('--hands', type=int, default=10000, help="batch: number of hands")
+    parser.add_argument('--seed', type=int, default=0, help="batch: seed of the run")
+    parser.add_argument('--bots', nargs='+', default=['random', 'random'], choices=sorted(BOTS),
+                        help="batch: bot policy per seat, 2 to 10 seats")
+    parser.add_argument('--workers', type=int, default=None, help="batch: number of processes")
+    parser.add_argument('--output', metavar='FILE', help="batch: write the summary as JSON to a file")
+    parser.add_argument('--quiet', action='store_true', help="batch: no progress")
+    args = parser.parse_args(argv)
+    if not args.batch:
+        return run_gui(args.card_atlas)
+    if not 2 <= len(args.bots) <= MAX_SEATS:
+        parser.error("a table has 2 to {} seats".format(MAX_SEATS))
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        elapsed = time.perf_counter() - start
+        print("\r{}/{} hands, {:.0f} hands/s".format(done, total, done / elapsed if elapsed else 0.0),
+              end='', file=sys.stderr, flush=True)
+
+    stats = run_batch(args.hands, args.bots, args.seed, args.workers, starting_money,
+                      None if args.quiet else progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+    summary = stats.summary(time.perf_counter() - start, args.bots, starting_money // 100)
+    text = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
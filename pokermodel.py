@@ -1,5 +1,6 @@
 from PyQt5.QtCore import *
 from cardlib import *
+from pokerengine import *
 
 
 class CardModel(QObject):
@@ -48,21 +49,28 @@ class HandModel(Hand, CardModel):
         self.new_cards.emit()
 
 
+def _state_property(name):
+    """a property reading and writing an attribute of the PlayerState behind a PlayerModel"""
+    return property(lambda self: getattr(self.state, name), lambda self, value: setattr(self.state, name, value))
+
+
 class PlayerModel(QObject):
     """The model representing a player. It will have: the player name, the total money possessed by the player,
-    the money deposited in any bet and the active state"""
+    the money deposited in any bet and the active state. The values live in a pokerengine.PlayerState"""
+
+    name = _state_property('name')
+    total_money = _state_property('total_money')
+    bet_money = _state_property('bet_money')
+    total_bet_money = _state_property('total_bet_money')
+    active = _state_property('active')
+    turns = _state_property('turns')
+    folded = _state_property('folded')
 
-    # def __init__(self, name, total_money, deck_model):
     def __init__(self, name, total_money):
         super().__init__()
-        self.name = name
+        self.state = PlayerState(name, total_money)
         self.hand = HandModel()
-        self.total_money = total_money
-        self.bet_money = 0
-        self.total_bet_money = 0
-        self.active = None
-        self.turns = 0
-
+        self.hand.cards = self.state.cards  # the engine deals into the same list
 
     def toggle_active(self):
         self.active = not self.active
@@ -82,25 +90,16 @@ class TableModel(CardModel):
     def flipped(self):
         return self.flipped_cards
 
-    def flop(self, deck):
-        self.hand.add_card(deck.draw())
-        self.hand.add_card(deck.draw())
-        self.hand.add_card(deck.draw())
-        self.new_cards.emit()  # something changed, better emit the signal!
-
-    def turn(self, deck):
-        self.hand.add_card(deck.draw())
-        self.new_cards.emit()  # something changed, better emit the signal!
 
-    def river(self, deck):
-        # self.index = 4
-        self.hand.add_card(deck.draw())
-        self.new_cards.emit()  # something changed, better emit the signal!
+def _engine_property(name):
+    """a property reading and writing an attribute of the GameEngine behind a GameModel"""
+    return property(lambda self: getattr(self.engine, name), lambda self, value: setattr(self.engine, name, value))
 
 
 class GameModel(QObject):
     """The class simulating the poker game. It contains methods for initiating, folding, calling and raising a bet,
-     progressing the game and restarting it once the game is over """
+     progressing the game and restarting it once the game is over. The rules are played by a
+     pokerengine.GameEngine; this class forwards its state changes as Qt signals"""
     money_changed = pyqtSignal()  # signal to communicate whenever total money changes for a player
     pot_money_changed = pyqtSignal()  # signal to communicate whenever pot money changes
     text_changed = pyqtSignal(str)  # signal to communicate whenever the status need to be updated
@@ -111,239 +110,123 @@ class GameModel(QObject):
     reveal_all_cards = pyqtSignal()  # signal to reveal all cards
     find_best_poker_hand = pyqtSignal()  # signal to find best poker hand
     reset_deck = pyqtSignal()  # signal to create a fresh deck
+    player_action = pyqtSignal(int, str, object)  # player index, 'call'/'raise'/'fold' and the amount
+    hand_result = pyqtSignal(object, object)  # indices of the players paid and HandRank (None after a fold)
+    state_changed = pyqtSignal(object)  # batching mode: one StateDiff per action instead of the signals above
 
-    def __init__(self, playermodels, tablemodel):
+    deck = _engine_property('deck')
+    counter = _engine_property('counter')  # this tracks the game progress
+    pot_money = _engine_property('pot_money')
+    big_blind = _engine_property('big_blind')
+    small_blind = _engine_property('small_blind')
+
+    def __init__(self, playermodels, tablemodel, rng=None, batching=False):
         super().__init__()
         self.playermodels = playermodels  # a list of playermodel object
-
-        self.deck = StandardDeck()
-        self.deck.shuffle()
+        self.starting_money = [player.total_money for player in playermodels]  # the stacks of a new game
         self.tablemodel = tablemodel
-        self.counter = 0  # this tracks the game progress
-        self.playermodels[0].active = True
-        self.playermodels[1].active = False
+        # batching: collect the changes of each action into a single state_changed signal
+        self.batching = batching
+        self.diff = None  # the StateDiff of the running action
+        self.revealed = False  # the showdown of this hand revealed all cards
+        # rng: a random.Random or seed for shuffling, so a table can be replayed
+        self.engine = GameEngine([player.state for player in playermodels], self.forward_event, rng)
+        self.tablemodel.hand.cards = self.engine.board  # the engine deals the table into the same list
+
+    def forward_event(self, event, *args):
+        """re-emits a state change of the engine as the matching signal, or records it while batching"""
+        if event == 'reveal_all_cards':
+            self.revealed = True
+        if self.diff is not None:
+            self.diff.add(event, *args)
+        elif event == 'hand_changed':
+            self.playermodels[args[0]].hand.new_cards.emit()
+        elif event == 'board_changed':
+            self.tablemodel.hand.new_cards.emit()
+            self.tablemodel.new_cards.emit()
+        else:
+            getattr(self, event).emit(*args)
+
+    def run_action(self, action, *args):
+        """
+        runs an engine action. In batching mode its changes are emitted at the end: the card models that changed
+        emit new_cards once, then state_changed carries the StateDiff
+
+        :param action: name of the GameEngine method
+        """
+        if not self.batching or self.diff is not None:
+            return getattr(self.engine, action)(*args)
+        self.diff = StateDiff()
+        try:
+            getattr(self.engine, action)(*args)
+        finally:
+            diff, self.diff = self.diff, None
+        diff.finish(self.engine)
+        self.update_faces(diff)
+        if diff.board is not None:
+            self.tablemodel.hand.new_cards.emit()
+            self.tablemodel.new_cards.emit()
+        if diff:
+            self.state_changed.emit(diff)
+
+    def update_faces(self, diff):
+        """batching mode: the player to act sees the cards face up, and the showdown shows every hand still in"""
+        for i, player in enumerate(self.playermodels):
+            flipped = bool(player.active) or self.revealed and not player.folded
+            if i in diff.hands or flipped != player.hand.flipped_cards:
+                player.hand.flipped_cards = flipped
+                player.hand.new_cards.emit()
+
+    def snapshot(self):
+        """returns a GameState of the hand, see GameEngine.snapshot"""
+        return self.engine.snapshot()
+
+    def restore(self, state):
+        """puts the game back into a snapshot and redraws every view"""
+        self.engine.restore(state)
+        # a hand paid out with more than one player left ended at the showdown
+        self.revealed = state.hand_over and sum(1 for player in self.playermodels if not player.folded) > 1
+        if self.batching:
+            diff = StateDiff()
+            for event in ('money_changed', 'pot_money_changed', 'board_changed'):
+                diff.add(event)
+            for i in range(len(self.playermodels)):
+                diff.add('hand_changed', i)
+            diff.revealed = self.revealed
+            diff.finish(self.engine)
+            self.update_faces(diff)
+            self.tablemodel.hand.new_cards.emit()
+            self.tablemodel.new_cards.emit()
+            self.state_changed.emit(diff)
+            return
         for player in self.playermodels:
-            player.hand.add_card(self.deck.draw())
-            player.hand.add_card(self.deck.draw())
-        # first_player: Dealer/Small Blind
-        # second_player: Big Blind
-        self.pot_money = 0
-        self.big_blind = self.playermodels[1].total_money // 100
-        self.small_blind = self.big_blind // 2
-
-        self.playermodels[0].bet_money = self.small_blind
-        self.playermodels[0].total_bet_money += self.playermodels[0].bet_money
-        self.playermodels[0].total_money -= self.playermodels[0].bet_money
-
-        self.playermodels[1].bet_money = self.big_blind
-        self.playermodels[1].total_bet_money += self.playermodels[1].bet_money
-        self.playermodels[1].total_money -= self.playermodels[1].bet_money
+            player.hand.new_cards.emit()
+        self.tablemodel.hand.new_cards.emit()
+        self.tablemodel.new_cards.emit()
         self.money_changed.emit()
-
-        self.pot_money += self.small_blind + self.big_blind
         self.pot_money_changed.emit()
-        log = "Start\n{} is the small blind and bets ${}\n{} is the big blind and bets ${}".format(
-            self.playermodels[0].name, self.playermodels[0].bet_money, self.playermodels[1].name,
-            self.playermodels[1].bet_money)
-        self.text_changed.emit(log)
+        if self.revealed:
+            self.reveal_all_cards.emit()
 
     def call_bet(self):
-        call_amount = abs(self.playermodels[0].total_bet_money - self.playermodels[1].total_bet_money)
-        # if self.playermodels[0].total_money == self.playermodels[1].total_money:
-        if self.playermodels[0].total_bet_money == self.playermodels[1].total_bet_money:
-            call_amount = self.small_blind
-        if self.playermodels[0].active:
-            log = "{} called ${}".format(self.playermodels[0].name, call_amount)
-            self.text_changed.emit(log)
-            self.pot_money += call_amount
-            self.pot_money_changed.emit()
-            self.playermodels[0].total_money -= call_amount
-            self.playermodels[0].total_bet_money += call_amount
-            self.money_changed.emit()
-        else:
-            log = "{} called ${}".format(self.playermodels[1].name, call_amount)
-            self.text_changed.emit(log)
-            self.pot_money += call_amount
-            self.pot_money_changed.emit()
-            self.playermodels[1].total_money -= call_amount
-            self.playermodels[1].total_bet_money += call_amount
-            self.money_changed.emit()
-        self.progress_game()
+        self.run_action('call_bet')
 
     def fold_bet(self):
-        if self.playermodels[0].active:
-            self.playermodels[1].total_money += self.pot_money
-            self.money_changed.emit()
-
-            log = "{} folded. The pot money of {} goes to {}".format(self.playermodels[0].name, self.pot_money,
-                                                                     self.playermodels[1].name)
-            self.text_changed.emit(log)
-
-            self.pot_money = 0
-            self.playermodels[0].total_bet_money = 0
-            self.playermodels[1].total_bet_money = 0
-            self.pot_money_changed.emit()
-
-            message = "{} won the game!".format(self.playermodels[1].name)
-            self.game_message.emit(message)
-
-        else:
-
-            self.playermodels[0].total_money += self.pot_money
-            self.money_changed.emit()
-            log = "{} folded. The pot money of {} goes to {}".format(self.playermodels[1].name, self.pot_money,
-                                                                          self.playermodels[0].name)
-            self.text_changed.emit(log)
-            self.pot_money = 0
-            self.playermodels[0].total_bet_money = 0
-            self.playermodels[1].total_bet_money = 0
-            self.pot_money_changed.emit()
-
-            message = "{} won the game!".format(self.playermodels[0].name)
-            self.game_message.emit(message)
+        self.run_action('fold_bet')
 
     def restart_game(self):
-        # fresh deck
-        self.deck = StandardDeck()
-        self.deck.shuffle()
-        # reset game progress
-        self.counter = 0  # this tracks the game progress
-        # reinitialise player
-        for player in self.playermodels:
-            player.hand.clear()
-            for _ in range(2):
-                player.hand.add_card(self.deck.draw())
-        self.playermodels[0].hand.flipped_cards = False
-        self.playermodels[1].hand.flipped_cards = True
-
-        self.tablemodel.hand.clear()
-
-        self.playermodels[0].active = False
-        self.playermodels[1].active = True
-        self.pot_money = 0
-
-        self.playermodels[0].bet_money = self.small_blind
-        self.playermodels[0].total_bet_money += self.playermodels[0].bet_money
-        self.playermodels[0].total_money -= self.playermodels[0].bet_money
-
-        self.playermodels[1].bet_money = self.big_blind
-        self.playermodels[1].total_bet_money += self.playermodels[1].bet_money
-        self.pot_money += self.small_blind + self.big_blind
-        self.pot_money_changed.emit()
-        self.playermodels[1].total_money -= self.playermodels[1].bet_money
-
-        self.money_changed.emit()
-        log = "================\nGame Restarted!================\n{} is the small blind and bets ${}\n" \
-                   "{} is the big blind and bets ${}".format(self.playermodels[0].name, self.playermodels[0].bet_money,
-                                                             self.playermodels[1].name, self.playermodels[1].bet_money)
-        self.text_changed.emit(log)
-
-    def raise_bet(self, raise_amount):
-        call_amount = abs(self.playermodels[0].total_money - self.playermodels[1].total_money)
-        self.pot_money += (raise_amount + call_amount)
-        self.pot_money_changed.emit()
-        if self.playermodels[0].active:
-            self.playermodels[0].total_money -= (raise_amount + call_amount)
-            self.playermodels[0].bet_money = (raise_amount + call_amount)
-            self.playermodels[0].total_bet_money += self.playermodels[0].bet_money
-            self.playermodels[0].turns += 1
-            self.money_changed.emit()
-            log = "{} raised the bet by ${} over the called bet of ${}. A total of ${}!" \
-                .format(self.playermodels[0].name, raise_amount, call_amount, (raise_amount + call_amount))
-            self.text_changed.emit(log)
+        """deals the next hand, or starts a new game with the starting stacks once one player has all the money"""
+        self.revealed = False
+        if self.engine.players_with_money() < 2:
+            self.run_action('new_game', self.starting_money)
         else:
-            self.playermodels[1].total_money -= (raise_amount + call_amount)
-            self.playermodels[1].bet_money = (raise_amount + call_amount)
-            self.playermodels[1].total_bet_money += self.playermodels[1].bet_money
-            self.playermodels[0].turns += 1
-            self.money_changed.emit()
-            log = "{} raised the bet by ${} over the called bet of ${}. A total of ${}!" \
-                .format(self.playermodels[1].name, raise_amount, call_amount, (raise_amount + call_amount))
-            self.text_changed.emit(log)
+            self.run_action('restart_game')
 
-        self.progress_game()
+    def raise_bet(self, raise_amount):
+        self.run_action('raise_bet', raise_amount)
 
     def progress_game(self):
-        if self.playermodels[0].total_bet_money != 0:
-            if self.playermodels[0].total_bet_money == self.playermodels[1].total_bet_money:
-
-                if self.counter == 0:
-                    log = "\n================\nFirst round of betting completed\n================\n Dealing the flop\n"
-                    self.text_changed.emit(log)
-                    self.tablemodel.flop(self.deck)
-
-                if self.counter == 1:
-                    log = "\n================\nSecond round of betting completed \n================\n" \
-                               " Dealing the Turn\n"
-                    self.text_changed.emit(log)
-                    self.tablemodel.turn(self.deck)
-
-                if self.counter == 2:
-                    log = "\n================\nThird round of betting completed \n================\n The final card," \
-                               " the river, is now shown\n"
-                    self.text_changed.emit(log)
-                    self.tablemodel.river(self.deck)
-
-                if self.counter == 3:
-                    log = "\n================\nFinal round of betting completed! \n================\n The players" \
-                               " can now reveal their cards\n"
-                    self.text_changed.emit(log)
-                    self.reveal_all_cards.emit()
-                    self.poker_best_hand()
-                    self.counter -= 1
-                self.counter += 1
+        self.run_action('progress_game')
 
     def poker_best_hand(self):
-        p1hand = self.playermodels[0].hand
-        pokerhand1 = p1hand.best_poker_hand(self.tablemodel.hand.cards)
-        p2hand = self.playermodels[1].hand
-        pokerhand2 = p2hand.best_poker_hand(self.tablemodel.hand.cards)
-        if pokerhand1 < pokerhand2:
-            if pokerhand1.rank == pokerhand2.rank:
-                log = "Both players had same hand {}, but {}'s cards:{} win over {}'s cards:{}"\
-                    .format(pokerhand2.rank.name, self.playermodels[1].name, pokerhand2.hand_cards,
-                            self.playermodels[0].name, pokerhand1.hand_cards)
-            else:
-                log = "{} wins!\n {} had '{}' against {}'s '{}'".format(self.playermodels[1].name,
-                                                                        self.playermodels[1].name,
-                                                                        pokerhand2.rank.name,
-                                                                        self.playermodels[0].name,
-                                                                        pokerhand1.rank.name)
-            self.playermodels[1].total_money += self.pot_money
-            self.money_changed.emit()
-            self.pot_money = 0
-            self.playermodels[0].total_bet_money = 0
-            self.playermodels[1].total_bet_money = 0
-            self.pot_money_changed.emit()
-            self.game_message.emit(log)
-
-        if pokerhand2 < pokerhand1:
-            if pokerhand1.rank == pokerhand2.rank:
-                log = "Both players had same hand {}, but {}'s cards:{} win over {}'s cards:{}".\
-                    format(pokerhand1.rank.name,self.playermodels[0].name, pokerhand1.hand_cards,
-                           self.playermodels[1].name, pokerhand2.hand_cards)
-            else:
-                log = "{} wins!\n {} had '{}' against {}'s '{}'".format(self.playermodels[0].name,
-                                                                        self.playermodels[0].name,
-                                                                        pokerhand1.rank.name,
-                                                                        self.playermodels[1].name,
-                                                                        pokerhand2.rank.name)
-
-            self.playermodels[0].total_money += self.pot_money
-            self.money_changed.emit()
-            self.pot_money = 0
-            self.playermodels[0].total_bet_money = 0
-            self.playermodels[1].total_bet_money = 0
-            self.pot_money_changed.emit()
-            self.game_message.emit(log)
-
-        if pokerhand1 == pokerhand2:
-            self.playermodels[0].total_money += 0.5 * self.pot_money
-            self.playermodels[1].total_money += 0.5 * self.pot_money
-            self.money_changed.emit()
-            self.pot_money = 0
-            self.playermodels[0].total_bet_money = 0
-            self.playermodels[1].total_bet_money = 0
-            self.pot_money_changed.emit()
-            log = "It's a tie! Both players have '{}'".format(pokerhand1.rank.name)
-            self.game_message.emit(log)
+        self.run_action('poker_best_hand')
@@ -4,29 +4,53 @@ from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtSvg import *
 from pokermodel import *
+from concurrent.futures import ThreadPoolExecutor
+import os
 import sys
+import time
 
-qt_app = QApplication(sys.argv)
+qt_app = None
+
+
+def application():
+    """returns the QApplication, creating it on first use. All tables share it and its event loop"""
+    global qt_app
+    if qt_app is None:
+        qt_app = QApplication.instance() or QApplication(sys.argv)
+    return qt_app
 
 
 class TableScene(QGraphicsScene):
     """ A scene with a table cloth background """
+    tile = None  # the table cloth, loaded once for all scenes
 
     def __init__(self):
         super().__init__()
-        self.tile = QPixmap('cards/table.png')
+        if TableScene.tile is None:
+            TableScene.tile = QPixmap('cards/table.png')
         self.setBackgroundBrush(QBrush(self.tile))
 
 
-class CardItem(QGraphicsSvgItem):
-    """ A simple overloaded QGraphicsSvgItem that also stores the card position """
+class CardItem(QGraphicsPixmapItem):
+    """ A simple overloaded QGraphicsPixmapItem that also stores the card position and which image it shows """
 
-    def __init__(self, renderer, position):
+    def __init__(self, key, position):
         super().__init__()
-        self.setSharedRenderer(renderer)
+        self.key = key  # (value, suit) of the card face, or None for the back
         self.position = position
 
 
+CARD_VALUE_FILES = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+
+
+def card_file(key):
+    """returns the SVG file of a card face (value, suit), or of the card back for None"""
+    if key is None:
+        return 'cards/Red_Back_2.svg'
+    value, suit = key
+    return 'cards/' + CARD_VALUE_FILES[value - 2] + suit + '.svg'
+
+
 def read_cards():
     """
     Reads all the 52 cards from files.
@@ -34,17 +58,207 @@ def read_cards():
     """
     all_cards = dict()
     for suit in 'HDSC':
-        for value_file, value in zip(['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A'], range(2, 15)):
-            file = value_file + suit
+        for value in range(2, 15):
             key = (value, suit)
-            all_cards[key] = QSvgRenderer('cards/' + file + '.svg')
+            all_cards[key] = QSvgRenderer(card_file(key))
     return all_cards
 
 
+class FileReader(QObject):
+    """Reads files on a thread pool and hands each one to the thread that created the reader through a queued
+    signal, so the receiving slot runs in the event loop and never waits for the disk"""
+    file_read = pyqtSignal(object, object)  # the key and the bytes of a file
+
+    def __init__(self, workers=4):
+        super().__init__()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def read(self, files):
+        """
+        reads files in the background and returns at once; file_read is emitted for each one
+
+        :param files: (key, path) pairs
+        """
+        def read(key, path):
+            with open(path, 'rb') as f:
+                self.file_read.emit(key, f.read())
+
+        for key, path in files:
+            self.pool.submit(read, key, path)
+        self.pool.shutdown(wait=False)  # the threads exit once the files are read
+
+
+class CardImages:
+    """The card faces and back, loaded lazily: an SVG is only parsed the first time that card is drawn.
+
+    preload() warms the remaining cards in the background (files read by a thread pool and handed to the event
+    loop, parsed a few per tick), and load_atlas() switches to a sprite atlas: every card rasterised once into a
+    single PNG that is cached on disk, so later starts decode one image instead of parsing SVGs."""
+    keys = [(value, suit) for suit in 'HDSC' for value in range(2, 15)] + [None]
+    cell = QSize(224, 312)  # size of a card in the atlas, the size of the SVGs
+    atlas_columns = 13
+    atlas_version = 1
+
+    def __init__(self):
+        self.renderers = dict()  # key -> QSvgRenderer
+        self.file_data = dict()  # key -> SVG bytes read ahead by preload()
+        self.atlas = None  # QImage with every card, when loaded
+        self.reader = None  # the FileReader of preload()
+        self.per_tick = 4
+        self.parsing = False  # a parse_some() tick is scheduled
+
+    def renderer(self, key):
+        """returns the SVG renderer of a card face (value, suit) or the back (None), parsing it on first use"""
+        renderer = self.renderers.get(key)
+        if renderer is None:
+            data = self.file_data.pop(key, None)
+            renderer = QSvgRenderer(QByteArray(data)) if data is not None else QSvgRenderer(card_file(key))
+            self.renderers[key] = renderer
+        return renderer
+
+    def image(self, key, scale):
+        """returns a card face (value, suit) or the back (None) rasterised at a scale, with a transparent background"""
+        if self.atlas is not None:
+            index = self.keys.index(key)
+            source = QRect(QPoint((index % self.atlas_columns) * self.cell.width(),
+                                  (index // self.atlas_columns) * self.cell.height()), self.cell)
+            return self.atlas.copy(source).scaled(self.cell * scale, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        renderer = self.renderer(key)
+        image = QImage(renderer.defaultSize() * scale, QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        renderer.render(painter)
+        painter.end()
+        return image
+
+    def preload(self, per_tick=4, workers=4):
+        """
+        parses the cards not loaded yet in the background, without blocking the event loop
+
+        :param per_tick: number of SVGs parsed per event loop tick
+        :param workers: threads reading the files
+        """
+        missing = [key for key in self.keys if key not in self.renderers]
+        if self.atlas is not None or not missing or self.reader is not None:
+            return
+        self.per_tick = per_tick
+        self.reader = FileReader(workers)
+        self.reader.file_read.connect(self.file_read, Qt.QueuedConnection)
+        self.reader.read([(key, card_file(key)) for key in missing])
+
+    def file_read(self, key, data):
+        """keeps a card file read by preload() and makes sure it gets parsed"""
+        if key in self.renderers:  # drawn and so parsed in the meantime
+            return
+        self.file_data[key] = data
+        if not self.parsing:
+            self.parsing = True
+            QTimer.singleShot(0, self.parse_some)
+
+    def parse_some(self):
+        """parses per_tick of the files read ahead, and schedules itself again while some are left"""
+        for _ in range(self.per_tick):
+            if not self.file_data:
+                break
+            self.renderer(next(iter(self.file_data)))
+        self.parsing = bool(self.file_data)
+        if self.parsing:
+            QTimer.singleShot(0, self.parse_some)
+
+    def atlas_path(self, directory=None):
+        directory = directory or os.environ.get('POKERGUI_CACHE', 'cards')
+        return os.path.join(directory, 'atlas_v{}.png'.format(self.atlas_version))
+
+    def load_atlas(self, path=None):
+        """loads the sprite atlas from disk, building and saving it first when there is none"""
+        path = path or self.atlas_path()
+        atlas = QImage(path)
+        if atlas.isNull():
+            atlas = QImage(self.cell.width() * self.atlas_columns,
+                           self.cell.height() * ((len(self.keys) - 1) // self.atlas_columns + 1),
+                           QImage.Format_ARGB32_Premultiplied)
+            atlas.fill(Qt.transparent)
+            painter = QPainter(atlas)
+            for index, key in enumerate(self.keys):
+                target = QRectF((index % self.atlas_columns) * self.cell.width(),
+                                (index // self.atlas_columns) * self.cell.height(),
+                                self.cell.width(), self.cell.height())
+                self.renderer(key).render(painter, target)
+            painter.end()
+            atlas.save(path, 'PNG', 100)  # fastest to load, hardly compressed
+        self.atlas = atlas.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+
+
+class CardPixmapCache:
+    """Pre-rendered card images with the drop shadow baked in, shared by all card views.
+
+    Pixmaps are keyed by (card face or None for the back, device scale); the back is the same for every face down
+    card. A view takes a scale with acquire_scale and gives it back with release_scale when its size changes; the
+    pixmaps of a scale no view uses any more are dropped. The pixmaps carry a device pixel ratio of the scale, so
+    they keep the size of the SVG in scene units and are drawn 1:1 on screen."""
+    shadow_blur = 10.
+    shadow_offset = 5
+    shadow_color = QColor(0, 0, 0, 180)  # Semi-transparent black!
+
+    def __init__(self, images):
+        self.images = images
+        self.pixmaps = dict()  # (key, scale) -> (pixmap, offset)
+        self.scale_users = dict()  # scale -> number of views drawing at that scale
+
+    def acquire_scale(self, scale):
+        self.scale_users[scale] = self.scale_users.get(scale, 0) + 1
+
+    def release_scale(self, scale):
+        users = self.scale_users.get(scale, 0) - 1
+        if users > 0:
+            self.scale_users[scale] = users
+            return
+        self.scale_users.pop(scale, None)
+        for cache_key in [k for k in self.pixmaps if k[1] == scale]:
+            del self.pixmaps[cache_key]
+
+    def pixmap(self, key, scale):
+        """
+        returns the pixmap of a card face (or of the back when key is None) and its offset in scene units
+
+        :param key: (value, suit) of the card face, or None for the back
+        :param scale: device pixels per scene unit
+        """
+        cache_key = (key, scale)
+        entry = self.pixmaps.get(cache_key)
+        if entry is None:
+            entry = self.pixmaps[cache_key] = self.render(key, scale)
+        return entry
+
+    def render(self, key, scale):
+        """rasterises a card at a scale and draws its drop shadow into the same pixmap"""
+        card = QPixmap.fromImage(self.images.image(key, scale))
+        size = card.size()
+
+        # let a throwaway scene draw the shadow, the same way the effect did on every repaint
+        scene = QGraphicsScene()
+        item = scene.addPixmap(card)
+        shadow = QGraphicsDropShadowEffect()
+        shadow.setBlurRadius(self.shadow_blur)
+        shadow.setOffset(self.shadow_offset, self.shadow_offset)
+        shadow.setColor(self.shadow_color)
+        item.setGraphicsEffect(shadow)
+        margin = int(self.shadow_blur + self.shadow_offset)
+        source = QRectF(-margin, -margin, size.width() + 2 * margin, size.height() + 2 * margin)
+        pixmap = QPixmap(source.size().toSize())
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        scene.render(painter, QRectF(pixmap.rect()), source)
+        painter.end()
+        pixmap.setDevicePixelRatio(scale)
+        return pixmap, QPointF(-margin / scale, -margin / scale)
+
+
 class CardView(QGraphicsView):
     """This class generates the cards graphics on Tablescene background"""
-    back_card = QSvgRenderer('cards/Red_Back_2.svg')
-    all_cards = read_cards()
+    card_images = CardImages()
+    pixmap_cache = CardPixmapCache(card_images)
+    card_height = 313  # scene units, the height of a card plus some space
 
     def __init__(self, card_model: CardModel, card_spacing: int = 250, padding: int = 10):
         super().__init__()
@@ -53,42 +267,77 @@ class CardView(QGraphicsView):
         self.card_spacing = card_spacing
         self.padding = padding
         self.model = card_model
+        self.device_scale = None  # device pixels per scene unit the card pixmaps are drawn for
+        self.card_items = []  # the CardItem of each card in the model, in order
+        self.stale = False  # the model changed while the view was not on screen
         #  listening to the signal from __change_cards:
         # Add the cards the first time around to represent the initial state.
         self.__change_cards()
         card_model.new_cards.connect(self.__change_cards)
 
     def __change_cards(self):  # double underscore indicates that this is a private method
-        # Add the cards from scratch
-        self.scene.clear()
+        # A table that is not on screen (hidden or minimized) catches up when it is shown again
+        if not self.isVisible() or self.window().isMinimized():
+            self.stale = True
+            return
+        self.stale = False
+        # Bring the scene in line with the model, touching only the cards that changed:
+        # new cards get an item, dropped cards lose theirs and turned cards swap their pixmap in place.
+        count = 0
         for i, card in enumerate(self.model):
+            count += 1
             # The ID of the card in the dictionary of images is a tuple with (value, suit), both integers
-            graphics_key = (card.get_value(), repr(card.suit))
-            renderer = self.all_cards[graphics_key] if self.model.flipped() else self.back_card
-            c = CardItem(renderer, i)
-
-            # Shadow effects are cool!
-            shadow = QGraphicsDropShadowEffect(c)
-            shadow.setBlurRadius(10.)
-            shadow.setOffset(5, 5)
-            shadow.setColor(QColor(0, 0, 0, 180))  # Semi-transparent black!
-            c.setGraphicsEffect(shadow)
-
-            # Place the cards on the default positions
-            c.setPos(c.position * self.card_spacing, 0)
-            # We could also do cool things like marking card by making them transparent if we wanted to!
-            # c.setOpacity(0.5 if self.model.marked(i) else 1.0)
-            self.scene.addItem(c)
-
-        self.update_view()
+            key = (card.get_value(), repr(card.suit)) if self.model.flipped() else None
+            if i < len(self.card_items):
+                c = self.card_items[i]
+                if c.key == key:
+                    continue
+                c.key = key
+            else:
+                c = CardItem(key, i)
+                # Place the cards on the default positions
+                c.setPos(c.position * self.card_spacing, 0)
+                # We could also do cool things like marking card by making them transparent if we wanted to!
+                # c.setOpacity(0.5 if self.model.marked(i) else 1.0)
+                self.scene.addItem(c)
+                self.card_items.append(c)
+            if self.device_scale is not None:
+                self.__draw(c)
+
+        for c in self.card_items[count:]:
+            self.scene.removeItem(c)
+        del self.card_items[count:]
+
+        if self.device_scale is None:
+            self.update_view()
+
+    def __draw(self, item):
+        # Cards are blits of pre-rendered pixmaps, shadow included
+        pixmap, offset = self.pixmap_cache.pixmap(item.key, self.device_scale)
+        item.setPixmap(pixmap)
+        item.setOffset(offset)
 
     def update_view(self):
-        scale = (self.viewport().height() - 2 * self.padding) / 313
+        scale = (self.viewport().height() - 2 * self.padding) / self.card_height
         self.resetTransform()
         self.scale(scale, scale)
         # Put the scene bounding box
         self.setSceneRect(-self.padding // scale, -self.padding // scale,
                           self.viewport().width() // scale, self.viewport().height() // scale)
+        # Re-render the cards when the size on screen changed
+        device_scale = round(max(scale, 0.05) * self.devicePixelRatioF(), 3)
+        if device_scale != self.device_scale:
+            if self.device_scale is not None:
+                self.pixmap_cache.release_scale(self.device_scale)
+            self.pixmap_cache.acquire_scale(device_scale)
+            self.device_scale = device_scale
+            for item in self.card_items:
+                self.__draw(item)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale:
+            self.__change_cards()
 
     def resizeEvent(self, painter):
         # This method is called when the window is resized.
@@ -142,12 +391,12 @@ class PlayerWindow(QGroupBox):
         self.playermodel = playermodel
         self.gamemodel = gamemodel
         # receive all necessary signals
-        self.gamemodel.money_changed.connect(self.update_display)
-
-        def reveal_cards():
-            self.hand.flipped_cards = False
-
-        self.gamemodel.reveal_all_cards.connect(reveal_cards)
+        if self.gamemodel.batching:
+            # one update per action; the model turns the cards itself
+            self.gamemodel.state_changed.connect(self.update_state)
+        else:
+            self.gamemodel.money_changed.connect(self.update_display)
+            self.gamemodel.reveal_all_cards.connect(self.update_display)
 
         # in place functions
         self.buttons[0].clicked.connect(gamemodel.fold_bet)
@@ -162,12 +411,22 @@ class PlayerWindow(QGroupBox):
         self.buttons[2].clicked.connect(bet_raise)
 
     def update_display(self):
-        # change active status
-        self.playermodel.toggle_active()
+        # the model has already passed the turn, so only the display changes here
         for button in self.buttons:
             button.setEnabled(self.playermodel.active)
-        # flip cards as the move is shifted to the other player
-        self.hand.flip()
+        # the player to act sees the cards, the showdown shows them all
+        face_up = bool(self.playermodel.active) or self.gamemodel.revealed and not self.playermodel.folded
+        if self.hand.flipped_cards != face_up:
+            self.hand.flip()
+        self.update_labels()
+
+    def update_state(self, diff):
+        if diff.players is not None:
+            for button in self.buttons:
+                button.setEnabled(self.playermodel.active)
+            self.update_labels()
+
+    def update_labels(self):
         self.total_money.setText("Total Money: {}".format(self.playermodel.total_money))
         self.total_bet_money.setText("Betted Money this round: {}".format(self.playermodel.total_bet_money))
 
@@ -175,7 +434,9 @@ class PlayerWindow(QGroupBox):
 class TableWindow(QGroupBox):
     """This window creates the Table View with five cards and a status window to show the pot and bet progress"""
 
-    def __init__(self, tablemodel, gamemodel):
+    log_blocks = 1000  # lines kept in the status window, older lines are dropped
+
+    def __init__(self, tablemodel, gamemodel, log_blocks=None):
         super().__init__()
 
         # layout
@@ -193,19 +454,64 @@ class TableWindow(QGroupBox):
         self.status_window = QPlainTextEdit(self)
         # self.status_window.insertPlainText("Start")
         self.status_window.setFixedWidth(200)
+        self.status_window.setMaximumBlockCount(log_blocks or self.log_blocks)
+        self.pending_log = []  # lines waiting for the next event loop tick
         gamestate_vbox.addWidget(self.status_window)
         table_hbox.addLayout(gamestate_vbox)
         self.setLayout(table_hbox)
 
         # logic, control, signal
-        self.gamemodel.pot_money_changed.connect(self.update_pot)
-        self.gamemodel.text_changed.connect(self.update_table_display)
+        if self.gamemodel.batching:
+            self.gamemodel.state_changed.connect(self.update_state)
+        else:
+            self.gamemodel.pot_money_changed.connect(self.update_pot)
+            self.gamemodel.text_changed.connect(self.update_table_display)
 
     def update_pot(self):
         self.pot_label.setText("${} in the Pot".format(self.gamemodel.pot_money))
 
     def update_table_display(self, message):
-        self.status_window.appendPlainText(message)
+        # the lines of one event loop tick are appended together
+        if not self.pending_log:
+            QTimer.singleShot(0, self.flush_log)
+        self.pending_log.append(message)
+
+    def flush_log(self):
+        if self.pending_log:
+            self.status_window.appendPlainText("\n".join(self.pending_log))
+            self.pending_log.clear()
+
+    def update_state(self, diff):
+        if diff.pot_money is not None:
+            self.update_pot()
+        if diff.texts:
+            self.update_table_display("\n".join(diff.texts))
+
+
+class FirstFrameTimer(QObject):
+    """Measures the time from a start time (e.g. process start) until a widget has painted its first frame, then
+    reports it and calls on_first_frame, e.g. to warm the rest of the assets in the background"""
+
+    def __init__(self, widget, start, on_first_frame=None, report=print):
+        super().__init__(widget)
+        self.start = start
+        self.on_first_frame = on_first_frame
+        self.report = report
+        self.seconds = None
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and self.seconds is None:
+            obj.removeEventFilter(self)
+            QTimer.singleShot(0, self.__painted)  # after the paint event has been handled
+        return False
+
+    def __painted(self):
+        self.seconds = time.perf_counter() - self.start
+        if self.report is not None:
+            self.report("First frame after {:.0f} ms".format(self.seconds * 1000))
+        if self.on_first_frame is not None:
+            self.on_first_frame()
 
 
 class GameWindow(QGroupBox):
@@ -220,15 +526,19 @@ class GameWindow(QGroupBox):
 
         # layout
         game_vbox = QVBoxLayout()
-        players_hbox = QHBoxLayout()
-
-        self.p1_window = PlayerWindow(self.gamemodel.playermodels[0], self.gamemodel)
-        # flip p1 cards to begin with
-        self.p1_window.playermodel.hand.flip()
-        self.p2_window = PlayerWindow(self.gamemodel.playermodels[1], self.gamemodel)
-        players_hbox.addWidget(self.p1_window)
-        players_hbox.addWidget(self.p2_window)
-        game_vbox.addLayout(players_hbox)
+        players_grid = QGridLayout()
+
+        # up to five players per row
+        self.player_windows = []
+        for i, playermodel in enumerate(self.gamemodel.playermodels):
+            window = PlayerWindow(playermodel, self.gamemodel)
+            # the player to act sees the cards to begin with
+            if playermodel.active:
+                playermodel.hand.flip()
+            players_grid.addWidget(window, i // 5, i % 5)
+            self.player_windows.append(window)
+        self.p1_window, self.p2_window = self.player_windows[:2]
+        game_vbox.addLayout(players_grid)
 
         self.table_window = TableWindow(self.gamemodel.tablemodel, self.gamemodel)
         game_vbox.addWidget(self.table_window)
@@ -236,7 +546,14 @@ class GameWindow(QGroupBox):
         self.setGeometry(200, 200, 1600, 800)
 
         # logic
-        self.gamemodel.game_message.connect(self.terminate_window)
+        if self.gamemodel.batching:
+            self.gamemodel.state_changed.connect(self.show_messages)
+        else:
+            self.gamemodel.game_message.connect(self.terminate_window)
+
+    def show_messages(self, diff):
+        for message in diff.messages:
+            self.terminate_window(message)
 
     def terminate_window(self, text):
         # pop up message asking user to either quit or restart
@@ -252,6 +569,6 @@ class GameWindow(QGroupBox):
 
         box.exec_()
 
-    @staticmethod
-    def exit_game():
-        sys.exit(qt_app.exec())
+    def exit_game(self):
+        # closes this table; the application quits with its last window
+        self.close()
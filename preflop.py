@@ -0,0 +1,193 @@
+import argparse
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from cardlib import *
+
+# The 169 canonical starting hands sit on a 13 x 13 grid with the ranks from Ace down to 2: pairs on the
+# diagonal, suited hands above it (row = higher rank) and offsuit hands below it (row = lower rank).
+RANK_CHARS = 'AKQJT98765432'
+HANDS = 169
+
+# File layout: a header, one "row done" flag per hand (so an interrupted run can resume), then the float32
+# equity matrix, where matrix[i, j] is the all-in equity of hand i against hand j.
+MAGIC = b'PKEQ'
+FILE_VERSION = 1
+HEADER = struct.Struct('<4sIIIQ')  # magic, version, hands, samples per matchup, seed
+DONE_OFFSET = 64
+MATRIX_OFFSET = 256
+FILE_SIZE = MATRIX_OFFSET + HANDS * HANDS * 4
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preflop_equity.bin')
+
+
+def hand_index(name):
+    """returns the grid index of a starting hand name such as 'AA', 'AKs' or 'T9o'"""
+    high, low = RANK_CHARS.index(name[0].upper()), RANK_CHARS.index(name[1].upper())
+    if high > low:
+        high, low = low, high
+    if high == low:
+        return high * 13 + high
+    if name[2:].lower() == 's':
+        return high * 13 + low
+    if name[2:].lower() == 'o':
+        return low * 13 + high
+    raise ValueError("{} needs an 's' (suited) or 'o' (offsuit) suffix".format(name))
+
+
+def hand_name(index):
+    """returns the name of the starting hand at a grid index"""
+    row, col = divmod(index, 13)
+    if row == col:
+        return RANK_CHARS[row] * 2
+    if row < col:
+        return RANK_CHARS[row] + RANK_CHARS[col] + 's'
+    return RANK_CHARS[col] + RANK_CHARS[row] + 'o'
+
+
+def cards_index(card1, card2):
+    """returns the grid index of the starting hand made by two hole cards"""
+    row, col = 14 - card1.value, 14 - card2.value
+    if row > col:
+        row, col = col, row
+    if card1.suit == card2.suit:
+        return row * 13 + col
+    return col * 13 + row
+
+
+def hand_combos(index):
+    """returns every pair of card codes (6 for pairs, 4 suited, 12 offsuit) making the starting hand"""
+    row, col = divmod(index, 13)
+    high, low = min(row, col), max(row, col)
+    high_rank, low_rank = 12 - high, 12 - low  # rank index of the card code
+    combos = []
+    for s1 in range(4):
+        for s2 in range(4):
+            suited = s1 == s2
+            if high == low and s1 < s2 \
+                    or high < low and (row < col) == suited:
+                combos.append(((high_rank << RANK_SHIFT) | s1, (low_rank << RANK_SHIFT) | s2))
+    return combos
+
+
+def _matchup_equity(hero, villain, samples, rng):
+    """estimates the equity of one starting hand against another by sampling combos and boards with numpy"""
+    hero_combos = np.array(hand_combos(hero))
+    villain_combos = np.array(hand_combos(villain))
+    hands = np.empty((0, 4), dtype=np.intp)
+    while len(hands) < samples:  # draw combo pairs, dropping those sharing a card
+        draw = np.concatenate([hero_combos[rng.integers(len(hero_combos), size=samples)],
+                               villain_combos[rng.integers(len(villain_combos), size=samples)]], axis=1)
+        overlap = (draw[:, :2, None] == draw[:, None, 2:]).any(axis=(1, 2))
+        hands = np.concatenate([hands, draw[~overlap]])
+    hands = hands[:samples]
+    # a random board from the 48 other cards: the five smallest of random keys, the hole cards never chosen
+    keys = rng.random((samples, 52))
+    np.put_along_axis(keys, hands, 2.0, axis=1)
+    boards = np.argpartition(keys, 5, axis=1)[:, :5]
+    hero_strength, _ = batch_strength(hands[:, :2], boards)
+    villain_strength, _ = batch_strength(hands[:, 2:], boards)
+    wins = np.count_nonzero(hero_strength > villain_strength)
+    ties = np.count_nonzero(hero_strength == villain_strength)
+    return (wins + 0.5 * ties) / samples
+
+
+def _compute_row(row, samples, seed):
+    """worker: the equity of one starting hand against every hand after it on the grid"""
+    rng = np.random.default_rng([seed, row])
+    return row, [_matchup_equity(row, col, samples, rng) for col in range(row + 1, HANDS)]
+
+
+def _open_file(path, samples, seed):
+    """opens (or creates) an equity file for writing, checking that it belongs to the same run"""
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            magic, version, hands, file_samples, file_seed = HEADER.unpack(f.read(HEADER.size))
+        if (magic, version, hands) != (MAGIC, FILE_VERSION, HANDS):
+            raise ValueError("{} is not a version {} preflop equity file".format(path, FILE_VERSION))
+        if (file_samples, file_seed) != (samples, seed):
+            raise ValueError("{} was started with {} samples and seed {}".format(path, file_samples, file_seed))
+    else:
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FILE_VERSION, HANDS, samples, seed))
+            f.truncate(FILE_SIZE)
+    data = np.memmap(path, dtype=np.uint8, mode='r+')
+    done = data[DONE_OFFSET:DONE_OFFSET + HANDS]
+    matrix = data[MATRIX_OFFSET:].view(np.float32).reshape(HANDS, HANDS)
+    return data, done, matrix
+
+
+def generate(path=DEFAULT_PATH, samples=20000, workers=None, seed=0, progress=None):
+    """
+    computes the heads-up all-in equity of every starting hand against every other and stores it in a file.
+    Each finished row is flushed to disk, so running again with the same settings resumes an interrupted run
+
+    :param path: the equity file
+    :param samples: number of sampled boards per matchup
+    :param workers: number of processes, defaults to the number of cores
+    :param seed: seed of the random generators (each row has its own stream)
+    :param progress: optional callable receiving (rows done, total rows)
+    """
+    data, done, matrix = _open_file(path, samples, seed)
+    for i in range(HANDS):
+        matrix[i, i] = 0.5  # both players hold the same kind of hand
+    todo = [row for row in range(HANDS) if not done[row]]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_compute_row, row, samples, seed) for row in todo]
+        for future in as_completed(futures):
+            row, values = future.result()
+            matrix[row, row + 1:] = values
+            matrix[row + 1:, row] = 1.0 - np.array(values, dtype=np.float32)
+            data.flush()
+            done[row] = 1
+            data.flush()
+            if progress is not None:
+                progress(int(done.sum()), HANDS)
+    del data
+
+
+class PreflopEquity:
+    """Read-only view of a preflop equity file. The file is memory mapped, so lookups are O(1) and every process
+    shares the same pages"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, 'rb') as f:
+            magic, version, hands, self.samples, self.seed = HEADER.unpack(f.read(HEADER.size))
+        if (magic, version, hands) != (MAGIC, FILE_VERSION, HANDS):
+            raise ValueError("{} is not a version {} preflop equity file".format(path, FILE_VERSION))
+        self.done = np.memmap(path, dtype=np.uint8, mode='r', offset=DONE_OFFSET, shape=(HANDS,))
+        self.matrix = np.memmap(path, dtype=np.float32, mode='r', offset=MATRIX_OFFSET, shape=(HANDS, HANDS))
+
+    def complete(self):
+        """returns True when every row of the matrix has been computed"""
+        return bool(self.done.all())
+
+    def equity(self, hero, villain):
+        """
+        returns the all-in equity of one starting hand against another
+
+        :param hero: hand name ('AKs') or grid index
+        :param villain: hand name or grid index
+        """
+        if isinstance(hero, str):
+            hero = hand_index(hero)
+        if isinstance(villain, str):
+            villain = hand_index(villain)
+        return float(self.matrix[hero, villain])
+
+    def cards_equity(self, hero_cards, villain_cards):
+        """returns the all-in equity of two hole cards against two others"""
+        return self.equity(cards_index(*hero_cards), cards_index(*villain_cards))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the 169 x 169 preflop equity matrix")
+    parser.add_argument('--output', default=DEFAULT_PATH, help="equity file, resumed if it exists")
+    parser.add_argument('--samples', type=int, default=20000, help="sampled boards per matchup")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.output, args.samples, args.workers, args.seed,
+             progress=lambda done, total: print("{}/{} rows".format(done, total), flush=True))
@@ -0,0 +1,338 @@
+import argparse
+import itertools
+import math
+import re
+
+import numpy as np
+
+from cardlib import *
+from preflop import RANK_CHARS, hand_index, hand_name, hand_combos, cards_index
+
+# The 1326 two card combos have a fixed index: combo (high, low) with card codes high > low is number
+# high * (high - 1) / 2 + low. A range is a boolean numpy mask over these indices.
+COMBOS = 1326
+COMBO_CARDS = np.array([(high, low) for high in range(52) for low in range(high)], dtype=np.intp)
+# CARD_COMBOS[code] holds the indices of the 51 combos containing a card
+CARD_COMBOS = np.array([np.flatnonzero((COMBO_CARDS == code).any(axis=1)) for code in range(52)], dtype=np.intp)
+SUIT_CHARS = 'hscd'  # in the order of the Suit values
+_STRENGTH_LIMIT = 1 << 24  # above every hand strength, marks combos that are not in a range
+_CHUNK = 32  # boards scored together
+
+
+def combo_index(code1, code2):
+    """returns the combo index of two card codes, in either order"""
+    if code1 < code2:
+        code1, code2 = code2, code1
+    if code1 == code2:
+        raise ValueError("a combo needs two different cards")
+    return code1 * (code1 - 1) // 2 + code2
+
+
+def parse_cards(text):
+    """turns 'AhKd2c' (or 'Ah Kd 2c') into cards"""
+    text = text.replace(' ', '').replace(',', '')
+    if len(text) % 2:
+        raise ValueError("cannot read the cards {!r}".format(text))
+    cards = []
+    for i in range(0, len(text), 2):
+        rank, suit = text[i].upper(), text[i + 1].lower()
+        if rank not in RANK_CHARS or suit not in SUIT_CHARS:
+            raise ValueError("cannot read the card {!r}".format(text[i:i + 2]))
+        cards.append(card_from_code(card_code(14 - RANK_CHARS.index(rank), Suit(SUIT_CHARS.index(suit) + 1))))
+    return cards
+
+
+def blocked_combos(cards):
+    """returns the mask of the combos sharing a card with a collection of cards"""
+    blocked = np.zeros(COMBOS, dtype=bool)
+    for card in cards:
+        blocked[CARD_COMBOS[card.code]] = True
+    return blocked
+
+
+class Range:
+    """A set of two card combos, stored as a boolean mask over the 1326 combo indices"""
+    __slots__ = ('mask',)
+
+    def __init__(self, mask=None):
+        self.mask = np.zeros(COMBOS, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+    @classmethod
+    def parse(cls, text):
+        """returns the range written like 'QQ+, AKs, T9s-76s, AhKh', see parse_range"""
+        return parse_range(text)
+
+    @classmethod
+    def from_combos(cls, combos):
+        """returns the range of some (card, card) pairs"""
+        result = cls()
+        for card1, card2 in combos:
+            result.mask[combo_index(card1.code, card2.code)] = True
+        return result
+
+    def add_hand(self, name):
+        """adds every combo of a starting hand such as 'AA', 'AKs' or 'T9o'"""
+        for code1, code2 in hand_combos(hand_index(name)):
+            self.mask[combo_index(code1, code2)] = True
+
+    def without(self, cards):
+        """returns the range without the combos blocked by some cards, e.g. the board or dead cards"""
+        return Range(self.mask & ~blocked_combos(cards))
+
+    def combos(self):
+        """returns the combos as (high card, low card) pairs, in index order"""
+        return [(card_from_code(high), card_from_code(low)) for high, low in COMBO_CARDS[self.mask].tolist()]
+
+    def hands(self):
+        """returns {starting hand name: number of its combos in the range}"""
+        counts = {}
+        for high, low in COMBO_CARDS[self.mask].tolist():
+            name = hand_name(cards_index(card_from_code(high), card_from_code(low)))
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def __contains__(self, combo):
+        card1, card2 = combo
+        return bool(self.mask[combo_index(card1.code, card2.code)])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def __or__(self, other):
+        return Range(self.mask | other.mask)
+
+    def __and__(self, other):
+        return Range(self.mask & other.mask)
+
+    def __sub__(self, other):
+        return Range(self.mask & ~other.mask)
+
+    def __eq__(self, other):
+        return isinstance(other, Range) and bool((self.mask == other.mask).all())
+
+    def __repr__(self):
+        return "Range({} combos)".format(len(self))
+
+
+_HAND = re.compile(r'^([2-9TJQKA])([2-9TJQKA])([so]?)$', re.IGNORECASE)
+
+
+def _split_hand(text):
+    """returns (high rank index, low rank index, suffix) of a starting hand, rank index 0 being the Ace"""
+    match = _HAND.match(text)
+    if match is None:
+        raise ValueError("cannot read the hand {!r}".format(text))
+    high, low = RANK_CHARS.index(match.group(1).upper()), RANK_CHARS.index(match.group(2).upper())
+    if high > low:
+        high, low = low, high
+    suffix = match.group(3).lower()
+    if high == low and suffix:
+        raise ValueError("a pair is neither suited nor offsuit: {!r}".format(text))
+    return high, low, suffix
+
+
+def _hand_names(high, low, suffix):
+    """returns the names of a starting hand, both the suited and offsuit one when there is no suffix"""
+    base = RANK_CHARS[high] + RANK_CHARS[low]
+    if high == low:
+        return [base]
+    return [base + s for s in (suffix or 'so')]
+
+
+def _token_hands(token):
+    """returns the starting hand names of one range token such as 'QQ+', 'A5s-A2s' or 'KQ'"""
+    if '-' in token:
+        first, last = (_split_hand(part) for part in token.split('-'))
+        if first[2] != last[2] or (first[0] == first[1]) != (last[0] == last[1]):
+            raise ValueError("the ends of {!r} are different kinds of hands".format(token))
+        if first[0] == first[1]:  # pairs: 99-66
+            ranks = range(min(first[0], last[0]), max(first[0], last[0]) + 1)
+            return [RANK_CHARS[r] * 2 for r in ranks]
+        if first[0] == last[0]:  # fixed high card: A5s-A2s
+            kickers = range(min(first[1], last[1]), max(first[1], last[1]) + 1)
+            return [name for k in kickers for name in _hand_names(first[0], k, first[2])]
+        if first[1] - first[0] == last[1] - last[0]:  # same gap: T9s-76s
+            start, stop = min(first[0], last[0]), max(first[0], last[0])
+            gap = first[1] - first[0]
+            return [name for h in range(start, stop + 1) for name in _hand_names(h, h + gap, first[2])]
+        raise ValueError("cannot read the span {!r}".format(token))
+    if token.endswith('+'):
+        high, low, suffix = _split_hand(token[:-1])
+        if high == low:  # QQ+
+            return [RANK_CHARS[r] * 2 for r in range(0, high + 1)]
+        return [name for k in range(high + 1, low + 1) for name in _hand_names(high, k, suffix)]  # ATs+
+    high, low, suffix = _split_hand(token)
+    return _hand_names(high, low, suffix)
+
+
+def parse_range(text):
+    """
+    reads a range in the usual notation: comma separated pairs ('TT'), suited or offsuit hands ('AKs', 'KQo'),
+    both ('AK'), 'QQ+' (QQ and better pairs), 'ATs+' (ATs to AKs), spans ('99-66', 'A5s-A2s', 'T9s-76s') and
+    single combos ('AhKh')
+
+    :return: a Range
+    """
+    result = Range()
+    for token in re.split(r'[,\s]+', text.strip()):
+        if not token:
+            continue
+        if len(token) == 4 and token[1].lower() in SUIT_CHARS and token[3].lower() in SUIT_CHARS:
+            card1, card2 = parse_cards(token)
+            result.mask[combo_index(card1.code, card2.code)] = True
+            continue
+        for name in _token_hands(token):
+            result.add_hand(name)
+    return result
+
+
+class RangeEquity:
+    """Win and tie counts of every hero combo against a villain range, summed over the boards. Each count is a
+    number of (villain combo, board) matchups, so a combo's equity weighs every compatible villain combo equally"""
+
+    def __init__(self, exact):
+        self.exact = exact
+        self.boards = 0
+        self.wins = np.zeros(COMBOS, dtype=np.int64)
+        self.ties = np.zeros(COMBOS, dtype=np.int64)
+        self.matchups = np.zeros(COMBOS, dtype=np.int64)
+
+    def equity(self):
+        """returns the equity of the hero range against the villain range (ties split the pot)"""
+        total = self.matchups.sum()
+        return float((self.wins.sum() + 0.5 * self.ties.sum()) / total) if total else 0.0
+
+    def villain_equity(self):
+        return 1.0 - self.equity() if self.matchups.sum() else 0.0
+
+    def combo_equity(self, card1, card2):
+        """returns the equity of one hero combo against the villain range"""
+        i = combo_index(card1.code, card2.code)
+        return float((self.wins[i] + 0.5 * self.ties[i]) / self.matchups[i]) if self.matchups[i] else 0.0
+
+    def hand_equities(self):
+        """returns {starting hand name: equity} for the hands of the hero range"""
+        totals = {}
+        for i in np.flatnonzero(self.matchups).tolist():
+            high, low = COMBO_CARDS[i].tolist()
+            name = hand_name(cards_index(card_from_code(high), card_from_code(low)))
+            share, matchups = totals.get(name, (0.0, 0))
+            totals[name] = share + self.wins[i] + 0.5 * self.ties[i], matchups + self.matchups[i]
+        return {name: float(share / matchups) for name, (share, matchups) in totals.items()}
+
+    def __str__(self):
+        return "{} boards{}: hero {:.4f}, villain {:.4f}".format(
+            self.boards, " (exact)" if self.exact else "", self.equity(), self.villain_equity())
+
+
+def _score_boards(result, hero, villain, board_codes):
+    """
+    adds a chunk of boards to a result. Every board is scored once for all combos of both ranges with the batch
+    evaluator; the matchups of each hero combo are then counted from the sorted villain strengths, removing the
+    villain combos that share one of its cards by inclusion-exclusion over the two cards
+
+    :param board_codes: int array (boards, 5)
+    """
+    boards = len(board_codes)
+    used = np.flatnonzero(hero | villain)
+    card_on_board = np.zeros((boards, 52), dtype=bool)
+    np.put_along_axis(card_on_board, board_codes, True, axis=1)
+    live = ~card_on_board[:, COMBO_CARDS].any(axis=2)  # (boards, combos) not blocked by the board
+    strengths = np.zeros((boards, COMBOS), dtype=np.int64)
+    rows, columns = np.nonzero(live[:, used])  # the combos sharing a card with their board are not scored
+    strengths[rows, used[columns]], _ = batch_strength(COMBO_CARDS[used[columns]], board_codes[rows])
+
+    villain_live = villain & live
+    villain_strengths = np.where(villain_live, strengths, _STRENGTH_LIMIT)
+    offsets = np.arange(boards, dtype=np.int64)[:, None] * (_STRENGTH_LIMIT + 1)
+    ordered = np.sort(villain_strengths + offsets, axis=None)  # every board's villain strengths, board by board
+
+    heroes = np.flatnonzero(hero)
+    hero_strengths = strengths[:, heroes] + offsets
+    row_start = np.arange(boards)[:, None] * COMBOS
+    below = np.searchsorted(ordered, hero_strengths, 'left') - row_start
+    equal = np.searchsorted(ordered, hero_strengths, 'right') - row_start - below
+    count = villain_live.sum(axis=1)[:, None]
+    self_in = villain_live[:, heroes]  # the villain holding the same combo: counted with both cards below
+    for side in (0, 1):
+        card_combos = CARD_COMBOS[COMBO_CARDS[heroes, side]]  # (heroes, 51)
+        shared = villain_strengths[:, card_combos]  # (boards, heroes, 51)
+        own = strengths[:, heroes, None]
+        below -= np.count_nonzero(shared < own, axis=2)
+        equal -= np.count_nonzero(shared == own, axis=2)
+        count = count - np.count_nonzero(villain_live[:, card_combos], axis=2)
+    equal += self_in
+    count = count + self_in
+    hero_live = live[:, heroes]
+    result.wins[heroes] += np.where(hero_live, below, 0).sum(axis=0)
+    result.ties[heroes] += np.where(hero_live, equal, 0).sum(axis=0)
+    result.matchups[heroes] += np.where(hero_live, count, 0).sum(axis=0)
+    result.boards += boards
+
+
+def range_equity(hero, villain, board=(), dead=(), max_exact=20000, samples=20000, seed=None):
+    """
+    computes the equity of one range against another, exactly when at most max_exact runouts of the board are
+    left, otherwise over a number of random runouts
+
+    :param hero: a Range or range text
+    :param villain: a Range or range text
+    :param board: cards already on the table (0 to 5)
+    :param dead: cards known to be out of the deck
+    :param seed: seed of the random runouts
+    :return: a RangeEquity
+    """
+    hero = parse_range(hero) if isinstance(hero, str) else hero
+    villain = parse_range(villain) if isinstance(villain, str) else villain
+    known = list(board) + list(dead)
+    if len(set(card.code for card in known)) != len(known):
+        raise ValueError("the same card is on the board and dead")
+    if len(board) > 5:
+        raise ValueError("a board has at most five cards")
+    hero_mask, villain_mask = hero.without(known).mask, villain.without(known).mask
+    board_codes = [card.code for card in board]
+    known_codes = set(card.code for card in known)
+    stock = np.array([code for code in range(52) if code not in known_codes], dtype=np.intp)
+    missing = 5 - len(board_codes)
+    exact = math.comb(len(stock), missing) <= max_exact
+    result = RangeEquity(exact)
+    if not hero_mask.any() or not villain_mask.any():
+        return result
+
+    if exact:
+        runouts = itertools.combinations(stock.tolist(), missing)
+        while True:
+            chunk = list(itertools.islice(runouts, _CHUNK))
+            if not chunk:
+                break
+            codes = np.array([board_codes + list(runout) for runout in chunk], dtype=np.intp).reshape(-1, 5)
+            _score_boards(result, hero_mask, villain_mask, codes)
+    else:
+        rng = np.random.default_rng(seed)
+        for start in range(0, samples, _CHUNK):
+            size = min(_CHUNK, samples - start)
+            # the first cards of random keys pick a runout from the stock
+            runouts = stock[np.argpartition(rng.random((size, len(stock))), missing, axis=1)[:, :missing]]
+            codes = np.concatenate([np.broadcast_to(np.array(board_codes, dtype=np.intp), (size, len(board_codes))),
+                                    runouts], axis=1)
+            _score_boards(result, hero_mask, villain_mask, codes)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Equity of one range against another")
+    parser.add_argument('hero', help="range such as 'QQ+, AKs'")
+    parser.add_argument('villain', help="range such as 'T9s-76s, 22+'")
+    parser.add_argument('--board', default='', help="cards such as AhKd2c")
+    parser.add_argument('--dead', default='', help="cards out of the deck")
+    parser.add_argument('--samples', type=int, default=20000, help="random runouts when not enumerating")
+    parser.add_argument('--max-exact', type=int, default=20000, help="most runouts enumerated exactly")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    hero_range, villain_range = parse_range(args.hero), parse_range(args.villain)
+    result = range_equity(hero_range, villain_range, parse_cards(args.board), parse_cards(args.dead),
+                          args.max_exact, args.samples, args.seed)
+    print("hero {} vs villain {}".format(len(hero_range), len(villain_range)))
+    print(result)
+    for name, value in sorted(result.hand_equities().items(), key=lambda item: -item[1]):
+        print("{:4s} {:.4f}".format(name, value))
@@ -0,0 +1,444 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from pokerengine import *
+
+# Messages are compact JSON objects, each sent as a frame: a 4 byte big-endian length, then the UTF-8 text.
+#
+# client -> server
+#   {"t": "join", "table": 3, "seat": 0}      sit down (or "seat": null to watch)
+#   {"t": "act", "a": "call", "id": 17}       "call", "raise" (with "n": amount), "fold" or "restart"
+#   {"t": "stats"}
+# server -> client
+#   {"t": "snapshot", ...}                    the whole table, after joining or after falling behind
+#   {"t": "state", "table": 3, "diffs": [...]} the state diffs of a batch of actions, see diff_fields()
+#   {"t": "error", "msg": "...", "id": 17}
+#   {"t": "stats", "cpu": 1.5, "actions": 1000, "tables": 8}
+FRAME = struct.Struct('>I')
+MAX_FRAME = 1 << 20
+TABLE_QUEUE = 256  # actions waiting per table; a full queue stops reading from the clients sending them
+CLIENT_QUEUE = 64  # messages waiting per client; a client falling further behind gets a snapshot instead
+MAX_BATCH = 64  # actions applied before a broadcast
+
+
+def encode(message):
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return FRAME.pack(len(data)) + data
+
+
+async def read_message(reader):
+    """returns the next message of a stream, or None at its end"""
+    try:
+        header = await reader.readexactly(FRAME.size)
+        size, = FRAME.unpack(header)
+        if size > MAX_FRAME:
+            raise ValueError("frame of {} bytes".format(size))
+        return json.loads(await reader.readexactly(size))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def diff_fields(diff):
+    """returns the public fields of a StateDiff as a dictionary; the hole cards are added per client"""
+    fields = {}
+    if diff.players is not None:
+        fields['players'] = [[total, bet, total_bet, bool(active)] for total, bet, total_bet, active in diff.players]
+    if diff.pot_money is not None:
+        fields['pot'] = diff.pot_money
+    if diff.board is not None:
+        fields['board'] = [card.code for card in diff.board]
+    if diff.actions:
+        fields['actions'] = [list(action) for action in diff.actions]
+    if diff.result is not None:
+        winners, rank = diff.result
+        fields['result'] = [list(winners), None if rank is None else int(rank)]
+    if diff.messages:
+        fields['messages'] = diff.messages
+    return fields
+
+
+class Client:
+    """A connection to the server. Messages go through a bounded queue drained by a writer task"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.table = None
+        self.seat = None
+        self.queue = asyncio.Queue(CLIENT_QUEUE)
+        self.task = asyncio.ensure_future(self.write_loop())
+
+    def send(self, data):
+        """queues an encoded message; a client that fell behind gets a snapshot of its table instead"""
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)  # None: send a snapshot
+        else:
+            self.queue.put_nowait(data)
+
+    async def write_loop(self):
+        while True:
+            data = await self.queue.get()
+            while True:
+                self.writer.write(encode(self.table.snapshot(self.seat)) if data is None else data)
+                if self.queue.empty():
+                    break
+                data = self.queue.get_nowait()
+            await self.writer.drain()  # waits while the socket buffer is full
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+class Table:
+    """One game engine and its clients. A task applies the queued actions in batches and broadcasts their
+    diffs once per batch"""
+
+    def __init__(self, number, seats=2, stack=50000, seed=None):
+        self.number = number
+        self.stack = stack
+        self.players = [PlayerState("Seat {}".format(i + 1), stack) for i in range(seats)]
+        self.engine = GameEngine(self.players, rng=seed)
+        self.engine.listener = self.record
+        self.diff = None
+        self.clients = []
+        self.queue = asyncio.Queue(TABLE_QUEUE)
+        self.actions = 0
+        self.task = None
+
+    def record(self, event, *args):
+        if self.diff is None or event == 'text_changed':
+            return
+        if event == 'reveal_all_cards':
+            self.diff.reveal(self.players)  # a restart later in the batch deals new cards into the same lists
+        else:
+            self.diff.add(event, *args)
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < MAX_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            diffs = []
+            for client, request in batch:
+                diff = self.apply(client, request)
+                if diff is not None:
+                    diffs.append(diff)
+            if diffs:
+                self.broadcast(diffs)
+
+    def apply(self, client, request):
+        """runs one action; returns (diff fields, StateDiff) or None after sending an error"""
+        engine = self.engine
+        action = request.get('a')
+        error = None
+        if client.seat is None:
+            error = "watchers cannot act"
+        elif action == 'restart':
+            if engine.pot_money:
+                error = "the hand is not over"
+        elif not engine.pot_money:
+            error = "the hand is over"
+        elif engine.active_player()[0] != client.seat:
+            error = "it is not your turn"
+        elif action not in ('call', 'raise', 'fold'):
+            error = "unknown action {!r}".format(action)
+        elif action == 'raise' and not (isinstance(request.get('n'), int) and request['n'] >= 0):
+            error = "a raise needs an amount"
+        if error is not None:
+            client.send(encode({'t': 'error', 'msg': error, 'id': request.get('id')}))
+            return None
+
+        self.diff = StateDiff()
+        try:
+            if action == 'call':
+                engine.call_bet()
+            elif action == 'raise':
+                engine.raise_bet(request['n'])
+            elif action == 'fold':
+                engine.fold_bet()
+            elif engine.players_with_money() < 2:  # somebody won everything
+                engine.new_game([self.stack] * len(self.players))
+            else:
+                engine.restart_game()
+        finally:
+            diff, self.diff = self.diff, None
+        diff.finish(engine)
+        self.actions += 1
+        fields = diff_fields(diff)
+        fields['seat'] = client.seat
+        fields['id'] = request.get('id')
+        return fields, diff
+
+    def broadcast(self, diffs):
+        """sends the diffs of a batch to every client, with the hole cards each client may see"""
+        public = None  # the message of the clients seeing no hole cards, encoded once
+        for client in self.clients:
+            seen = [(fields, self.hole_cards(diff, client.seat)) for fields, diff in diffs]
+            if any(hands for _, hands in seen):
+                client.send(encode({'t': 'state', 'table': self.number,
+                                    'diffs': [dict(fields, hands=hands) if hands else fields
+                                              for fields, hands in seen]}))
+            else:
+                if public is None:
+                    public = encode({'t': 'state', 'table': self.number, 'diffs': [fields for fields, _ in diffs]})
+                client.send(public)
+
+    def hole_cards(self, diff, seat):
+        """returns {player index: card codes} of the changed hands a seat may see; the showdown shows every hand
+        still in, as it was when the cards were revealed"""
+        if diff.shown is not None:
+            return diff.shown
+        if seat in diff.hands:
+            return {seat: [card.code for card in diff.hands[seat]]}
+        return None
+
+    def snapshot(self, seat):
+        """returns the whole table as seen from a seat"""
+        engine = self.engine
+        hands = {i: [card.code for card in player.cards] for i, player in enumerate(self.players)
+                 if i == seat and player.cards}
+        return {'t': 'snapshot', 'table': self.number, 'seat': seat,
+                'players': [[p.total_money, p.bet_money, p.total_bet_money, bool(p.active)] for p in self.players],
+                'pot': engine.pot_money, 'board': [card.code for card in engine.board], 'hands': hands}
+
+
+class TableServer:
+    """Hosts many tables in one process: one task per table, one reader and one writer task per client"""
+
+    def __init__(self, tables=1, seats=2, stack=50000, seed=None):
+        seeder = random.Random(seed)
+        self.tables = [Table(i, seats, stack, seeder.getrandbits(64)) for i in range(tables)]
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """
+        starts listening on a TCP port or, with a path, on a Unix socket
+
+        :return: the asyncio server
+        """
+        for table in self.tables:
+            table.start()
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.serve_client, path)
+        else:
+            self.server = await asyncio.start_server(self.serve_client, host, port)
+        return self.server
+
+    async def serve_client(self, reader, writer):
+        client = Client(writer)
+        try:
+            while True:
+                request = await read_message(reader)
+                if request is None:
+                    break
+                kind = request.get('t')
+                if kind == 'act' and client.table is not None:
+                    await client.table.queue.put((client, request))  # waits while the table is busy
+                elif kind == 'join':
+                    self.join(client, request)
+                elif kind == 'stats':
+                    client.send(encode({'t': 'stats', 'cpu': time.process_time(), 'tables': len(self.tables),
+                                        'actions': sum(table.actions for table in self.tables)}))
+                else:
+                    client.send(encode({'t': 'error', 'msg': "unexpected message", 'id': request.get('id')}))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if client.table is not None:
+                client.table.clients.remove(client)
+            client.close()
+
+    def join(self, client, request):
+        number, seat = request.get('table'), request.get('seat')
+        if not (isinstance(number, int) and 0 <= number < len(self.tables)):
+            client.send(encode({'t': 'error', 'msg': "no table {}".format(number)}))
+            return
+        table = self.tables[number]
+        if seat is not None and not (isinstance(seat, int) and 0 <= seat < len(table.players)):
+            client.send(encode({'t': 'error', 'msg': "no seat {}".format(seat)}))
+            return
+        if client.table is not None:
+            client.table.clients.remove(client)
+        client.table, client.seat = table, seat
+        table.clients.append(client)
+        client.send(encode(table.snapshot(seat)))
+
+    async def serve_forever(self, **address):
+        server = await self.start(**address)
+        async with server:
+            await server.serve_forever()
+
+
+# ---------------------------------------------------------------------------------------------- load generator
+
+class SeatBot:
+    """A load generator client playing one seat with random actions, timing each action until its diff arrives"""
+
+    def __init__(self, table, seat, rng, latencies):
+        self.table = table
+        self.seat = seat
+        self.rng = rng
+        self.latencies = latencies
+        self.players = None
+        self.pot = 0
+        self.pending = None  # (id, send time) of the action waiting for its diff
+        self.next_id = 0
+        self.hands = 0
+
+    def update(self, fields):
+        if 'players' in fields:
+            self.players = fields['players']
+        if 'pot' in fields:
+            self.pot = fields['pot']
+        if 'result' in fields:
+            self.hands += 1
+
+    def choose(self):
+        """returns the next request, or None when it is not this seat's turn"""
+        if self.pending is not None or self.players is None:
+            return None
+        if not self.pot:
+            return {'t': 'act', 'a': 'restart'} if self.seat == 0 else None
+        if not self.players[self.seat][3]:
+            return None
+        x = self.rng.random()
+        if x < 0.1:
+            return {'t': 'act', 'a': 'fold'}
+        if x < 0.2:
+            return {'t': 'act', 'a': 'raise', 'n': self.rng.choice((100, 500, 1000))}
+        return {'t': 'act', 'a': 'call'}
+
+    async def run(self, connect, deadline):
+        reader, writer = await connect()
+        writer.write(encode({'t': 'join', 'table': self.table, 'seat': self.seat}))
+        try:
+            while time.perf_counter() < deadline:
+                request = self.choose()
+                if request is not None:
+                    self.next_id += 1
+                    request['id'] = self.next_id
+                    self.pending = (self.next_id, time.perf_counter())
+                    writer.write(encode(request))
+                    await writer.drain()
+                try:
+                    message = await asyncio.wait_for(read_message(reader), deadline - time.perf_counter())
+                except asyncio.TimeoutError:
+                    break
+                if message is None:
+                    break
+                kind = message['t']
+                if kind == 'snapshot':
+                    self.update(message)
+                    self.pending = None
+                elif kind == 'state':
+                    for fields in message['diffs']:
+                        self.update(fields)
+                        if self.pending is not None and fields['seat'] == self.seat \
+                                and fields['id'] == self.pending[0]:
+                            self.latencies.append(time.perf_counter() - self.pending[1])
+                            self.pending = None
+                elif kind == 'error' and self.pending is not None and message.get('id') == self.pending[0]:
+                    self.pending = None
+        finally:
+            writer.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] if ordered else float('nan')
+
+
+async def request_stats(connect):
+    reader, writer = await connect()
+    writer.write(encode({'t': 'stats'}))
+    message = await read_message(reader)
+    writer.close()
+    return message
+
+
+async def load(connect, tables, seats=2, seconds=10.0, seed=0):
+    """
+    plays every seat of the first `tables` tables with random actions for a number of seconds
+
+    :param connect: coroutine function returning a (reader, writer) connection to the server
+    :return: dictionary of results
+    """
+    rng = random.Random(seed)
+    latencies = []
+    bots = [SeatBot(table, seat, random.Random(rng.getrandbits(64)), latencies)
+            for table in range(tables) for seat in range(seats)]
+    before = await request_stats(connect)
+    start = time.perf_counter()
+    await asyncio.gather(*(bot.run(connect, start + seconds) for bot in bots))
+    wall = time.perf_counter() - start
+    after = await request_stats(connect)
+    cpu = after['cpu'] - before['cpu']
+    actions = after['actions'] - before['actions']
+    return {'tables': tables, 'seconds': wall, 'actions': actions, 'actions_per_second': actions / wall,
+            'hands_per_second': sum(bot.hands for bot in bots) / seats / wall,
+            'server_cpu': cpu / wall,  # cores busy
+            'tables_per_core': tables * wall / cpu if cpu else float('inf'),
+            'latency_ms': {name: percentile(latencies, q) * 1000
+                           for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poker table server and load generator")
+    parser.add_argument('mode', choices=('serve', 'load'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help="use a Unix socket instead of TCP")
+    parser.add_argument('--tables', type=int, default=16)
+    parser.add_argument('--seats', type=int, default=2)
+    parser.add_argument('--stack', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--seconds', type=float, default=10.0, help="load: duration")
+    parser.add_argument('--spawn', action='store_true', help="load: start a server process for the run")
+    args = parser.parse_args(argv)
+
+    if args.mode == 'serve':
+        server = TableServer(args.tables, args.seats, args.stack, args.seed)
+        address = {'path': args.unix} if args.unix else {'host': args.host, 'port': args.port}
+        asyncio.run(server.serve_forever(**address))
+        return 0
+
+    process = None
+    path = args.unix
+    if args.spawn:
+        path = path or os.path.join(tempfile.mkdtemp(), 'tables.sock')
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', '--unix', path,
+                                    '--tables', str(args.tables), '--seats', str(args.seats),
+                                    '--stack', str(args.stack)])
+        while not os.path.exists(path):
+            time.sleep(0.05)
+    if path:
+        def connect():
+            return asyncio.open_unix_connection(path)
+    else:
+        def connect():
+            return asyncio.open_connection(args.host, args.port)
+    try:
+        result = asyncio.run(load(connect, args.tables, args.seats, args.seconds, args.seed or 0))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
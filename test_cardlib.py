@@ -0,0 +1,179 @@
+import itertools
+import random
+import time
+
+import pytest
+
+import cardlib
+from cardlib import *
+
+SUITS = {'h': Suit.Hearts, 's': Suit.Spades, 'c': Suit.Clubs, 'd': Suit.Diamonds}
+VALUES = {'T': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14}
+
+
+def cards(text):
+    """turns 'Ah Ks 2c' into cards"""
+    return [card_from_code(card_code(VALUES.get(word[0]) or int(word[0]), SUITS[word[1]])) for word in text.split()]
+
+
+def reference_five(hand):
+    """scores exactly five cards the slow way: (HandRank, deciding values) in the evaluator's order"""
+    values = sorted((card.get_value() for card in hand), reverse=True)
+    counts = {value: values.count(value) for value in values}
+    # the values ordered by how often they appear, then by value
+    grouped = sorted(counts, key=lambda value: (counts[value], value), reverse=True)
+    shape = sorted(counts.values(), reverse=True)
+    flush = len({card.suit for card in hand}) == 1
+    straight = 0
+    if len(counts) == 5:
+        if values[0] - values[4] == 4:
+            straight = values[0]
+        elif values == [14, 5, 4, 3, 2]:
+            straight = 5
+    if straight and flush:
+        return HandRank.get_straight_flush, [straight]
+    if shape == [4, 1]:
+        return HandRank.get_four_of_a_kind, grouped
+    if shape == [3, 2]:
+        return HandRank.get_full_house, grouped
+    if flush:
+        return HandRank.get_flush, values
+    if straight:
+        return HandRank.get_straight, [straight]
+    if shape == [3, 1, 1]:
+        return HandRank.get_three_of_a_kind, grouped
+    if shape == [2, 2, 1]:
+        return HandRank.get_two_pairs, grouped
+    if shape == [2, 1, 1, 1]:
+        return HandRank.get_one_pairs, grouped
+    return HandRank.get_highest_card, values
+
+
+def reference(hand):
+    """the best five card hand of 5 to 7 cards, by trying every five"""
+    return max(reference_five(five) for five in itertools.combinations(hand, 5))
+
+
+def random_hands(n, count, seed):
+    rng = random.Random(seed)
+    return [rng.sample(CARDS, n) for _ in range(count)]
+
+
+def as_reference(strength):
+    return HandRank(strength >> STRENGTH_SHIFT), strength_cards(strength)
+
+
+@pytest.mark.parametrize('n', [5, 6, 7])
+def test_best_poker_hand_matches_reference(n):
+    for hand_cards in random_hands(n, 1500, seed=n):
+        hand = Hand()
+        for card in hand_cards[:2]:
+            hand.add_card(card)
+        best = hand.best_poker_hand(hand_cards[2:])
+        assert (best.rank, best.hand_cards) == reference(hand_cards), hand_cards
+        assert hand_strength(hand_cards) == best.strength
+
+
+@pytest.mark.parametrize('n', [5, 6, 7])
+def test_batch_strength_matches_reference(n):
+    np = pytest.importorskip('numpy')
+    hands = random_hands(n, 1500, seed=10 + n)
+    strengths, ranks = batch_strength(np.array([[card.code for card in hand] for hand in hands]))
+    for hand, strength, rank in zip(hands, strengths.tolist(), ranks.tolist()):
+        assert as_reference(strength) == reference(hand), hand
+        assert rank == reference(hand)[0]
+
+
+@pytest.mark.parametrize('n', [5, 6, 7])
+def test_strength_with_matches_reference(n):
+    for hand in random_hands(n, 1500, seed=20 + n):
+        evaluator = HandEvaluator(hand[2:])
+        assert as_reference(evaluator.strength_with(hand[:2])) == reference(hand), hand
+        assert as_reference(HandEvaluator(hand).strength) == reference(hand), hand
+
+
+def test_wheel():
+    best = PokerHand(cards('Ah 2c 3d 4s 5h Kd 9c'))
+    assert (best.rank, best.hand_cards) == (HandRank.get_straight, [5])
+    assert best < PokerHand(cards('2c 3d 4s 5h 6c Kd 9c'))  # a six high straight beats the wheel
+    assert best > PokerHand(cards('Ah Ac Kd Ks Qh 2c 3d'))
+
+
+def test_steel_wheel():
+    board = cards('2s 3s 4s Kd 9c')
+    evaluator = HandEvaluator(board)
+    steel_wheel = evaluator.strength_with(cards('As 5s'))
+    assert as_reference(steel_wheel) == (HandRank.get_straight_flush, [5])
+    assert steel_wheel < evaluator.strength_with(cards('5s 6s'))
+    assert steel_wheel > evaluator.strength_with(cards('Ks Qs'))  # the king high flush
+
+
+def test_kicker_ties():
+    board = cards('Ah Ad 9c 7s 5h')
+    # the board's kickers play for both, so the pot is split
+    assert hand_strength(board + cards('2c 3d')) == hand_strength(board + cards('2d 4c'))
+    # a kicker that plays decides
+    assert hand_strength(board + cards('Kc 2d')) > hand_strength(board + cards('Qc 2d'))
+    # two pair on the board and a pair each: the fifth card is the only kicker
+    board = cards('Kh Kd 8c 8s 2h')
+    assert hand_strength(board + cards('Ac 3d')) > hand_strength(board + cards('Qc Jd'))
+    assert hand_strength(board + cards('Qc 3d')) == hand_strength(board + cards('Qd 4c'))
+
+
+def relabel(hand, permutation):
+    """renames the suits of some cards, permutation[old suit bits] being the new ones"""
+    return [CARDS[(card.code & ~SUIT_MASK) | permutation[card.code & SUIT_MASK]] for card in hand]
+
+
+def test_canonical_forms_ignore_suit_permutations():
+    rng = random.Random(3)
+    for hand in random_hands(7, 300, seed=30):
+        hole, board = hand[:2], hand[2:]
+        permutation = rng.sample(range(4), 4)
+        other_hole, other_board = relabel(hole, permutation), relabel(board, permutation)
+        assert canonical_key(hole, board) == canonical_key(other_hole, other_board)
+        assert canonicalize(hole, board) == canonicalize(other_hole, other_board)
+        assert set_key(hand) == set_key(other_hole + other_board)
+        canonical_hole, canonical_board = canonicalize(hole, board)
+        assert canonical_key(canonical_hole, canonical_board) == canonical_key(hole, board)
+        assert hand_strength(canonical_hole + canonical_board) == hand_strength(hand)
+
+
+def test_canonical_key_keeps_the_hole_cards_apart():
+    # the same seven cards, a flush draw in the hand or on the board
+    assert canonical_key(cards('Ah Kh'), cards('Qh Js 2c')) != canonical_key(cards('Ah Js'), cards('Qh Kh 2c'))
+    assert set_key(cards('Ah Kh Qh Js 2c')) == set_key(cards('Ah Js Qh Kh 2c'))
+
+
+def test_strength_cache():
+    cache = StrengthCache(maxsize=2)
+    assert cache.strength(cards('Ah Kh Qh Jh Th')) == hand_strength(cards('Ah Kh Qh Jh Th'))
+    assert cache.strength(cards('As Ks Qs Js Ts')) == hand_strength(cards('Ah Kh Qh Jh Th'))  # the same up to suits
+    cache.strength(cards('2c 2d 7h 8s 9c'))
+    cache.strength(cards('3c 3d 7h 8s 9c'))  # evicts the royal flush
+    cache.strength(cards('Ac Kc Qc Jc Tc'))
+    assert cache.stats() == {'size': 2, 'hits': 1, 'misses': 4, 'evictions': 2, 'hit_rate': 0.2}
+    cache.clear()
+    assert cache.stats()['size'] == cache.hits == 0
+
+
+def test_strength_cache_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = StrengthCache(ttl=10)
+    hand = cards('Ah Ad 9c 7s 5h')
+    cache.strength(hand)
+    now[0] += 5
+    cache.strength(hand)
+    now[0] += 10
+    assert cache.strength(hand) == hand_strength(hand)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_poker_hand_through_the_cache(monkeypatch):
+    cache = StrengthCache()
+    monkeypatch.setattr(cardlib, 'strength_cache', cache)
+    for hand in random_hands(7, 200, seed=40):
+        assert PokerHand(hand).strength == hand_strength(hand)
+        assert PokerHand(relabel(hand, [1, 0, 3, 2])).strength == hand_strength(hand)
+    assert cache.hits >= 200
@@ -0,0 +1,55 @@
+import itertools
+import math
+
+import pytest
+
+from equity import equity, exact_equity, unrank_combination
+from ranges import parse_cards
+
+HANDS = [parse_cards('AhAs'), parse_cards('KdKc')]
+FLOP = parse_cards('2c7d9h')
+
+
+def counts(result):
+    return result.samples, result.wins, result.ties, result.losses
+
+
+@pytest.mark.parametrize('n, k', [(7, 3), (10, 2), (45, 2), (8, 5)])
+def test_unrank_combination_is_lexicographic(n, k):
+    for index, combo in enumerate(itertools.combinations(range(n), k)):
+        assert unrank_combination(index, n, k) == list(combo)
+    assert index == math.comb(n, k) - 1
+
+
+def test_exact_equity_on_the_flop():
+    result = exact_equity(HANDS, FLOP)
+    assert result.exact
+    assert result.samples == 990
+    assert result.wins[0] + result.ties[0] + result.losses[0] == 990
+    assert result.wins[0] == result.losses[1]
+
+
+def test_exact_equity_workers_agree():
+    assert counts(exact_equity(HANDS, FLOP, workers=1)) == counts(exact_equity(HANDS, FLOP, workers=2))
+
+
+def test_exact_equity_on_a_full_board():
+    result = exact_equity(HANDS, FLOP + parse_cards('KhAd'))
+    assert result.samples == 1
+    assert (result.wins, result.losses) == ([1, 0], [0, 1])  # three aces beat three kings
+
+
+def test_small_enumerations_run_in_process(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("a pool was started")
+    monkeypatch.setattr('equity.ProcessPoolExecutor', no_pool)
+    monkeypatch.setattr('os.cpu_count', lambda: 4)
+    assert equity(HANDS, FLOP).samples == 990
+
+
+def test_equity_switches_to_monte_carlo():
+    exact = equity(HANDS, FLOP, max_exact=990)
+    assert exact.exact and exact.samples == 990
+    sampled = equity(HANDS, FLOP, max_exact=989, samples=3000, workers=1, seed=1)
+    assert not sampled.exact and sampled.samples == 3000
+    assert sampled.equity(0) == pytest.approx(exact.equity(0), abs=0.05)
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from handhistory import *
+from pokerengine import *
+
+
+def record_hands(path, seats, hands, seed, max_actions=None):
+    """plays random hands with the blinds moving round and records them; returns the stacks after each hand"""
+    rng = random.Random(seed)
+    players = [PlayerState(str(i), 1000) for i in range(seats)]
+    engine = GameEngine(players, rng=seed)
+    writer = HandRecordWriter(path, seats, max_actions=max_actions)
+    writer.attach(engine)
+    finals = []
+    for hand in range(hands):
+        while engine.pot_money:
+            x = rng.random()
+            if x < 0.1:
+                engine.fold_bet()
+            elif x < 0.3:
+                engine.raise_bet(rng.choice([10, 50]))
+            else:
+                engine.call_bet()
+        finals.append([player.total_money for player in players])
+        if engine.players_with_money() < 2:
+            break
+        engine.first_seat = (engine.seats[0] + 1) % seats
+        engine.restart_game()
+    writer.close()
+    return finals
+
+
+@pytest.mark.parametrize('seats', [2, 6, 10])
+def test_record_and_replay(tmp_path, seats):
+    path = str(tmp_path / 'hands.bin')
+    finals = record_hands(path, seats, 100, seed=seats)
+    reader = HandRecordReader(path)
+    assert len(reader) == len(finals)
+    assert reader.max_actions == ACTIONS_PER_SEAT * seats
+    assert not any(record.flags & TRUNCATED for record in reader)
+    engine = GameEngine([PlayerState(str(i), 1000) for i in range(seats)], rng=0)
+    replay = HandReplay(reader, engine)
+    for n, stacks in enumerate(finals):
+        record = replay.play(n)
+        assert all(isinstance(stack, int) for stack in record.stacks) and isinstance(record.pot, int)
+        assert [player.total_money for player in engine.players] == stacks
+    reader.close()
+
+
+def test_truncated_hands_are_flagged(tmp_path):
+    path = str(tmp_path / 'hands.bin')
+    record_hands(path, 3, 30, seed=1, max_actions=4)
+    reader = HandRecordReader(path)
+    assert reader.max_actions == 4
+    truncated = [n for n, record in enumerate(reader) if record.flags & TRUNCATED]
+    assert truncated
+    assert all(len(record.actions) <= 4 for record in reader)
+    with pytest.raises(ValueError):
+        HandReplay(reader, GameEngine([PlayerState(str(i), 1000) for i in range(3)])).play(truncated[0])
+    reader.close()
+
+
+def test_appending_keeps_the_header(tmp_path):
+    path = str(tmp_path / 'hands.bin')
+    first = record_hands(path, 2, 10, seed=2, max_actions=20)
+    second = record_hands(path, 2, 10, seed=3)  # appends, with the file's 20 action slots
+    reader = HandRecordReader(path)
+    assert reader.max_actions == 20
+    assert len(reader) == len(first) + len(second)
+    engine = GameEngine([PlayerState('A', 1000), PlayerState('B', 1000)], rng=0)
+    HandReplay(reader, engine).play(len(first))
+    assert [player.total_money for player in engine.players] == second[0]
+    reader.close()
+    with pytest.raises(ValueError):  # a file of two seats takes no three seat hands
+        HandRecordWriter(path, 3)
+    with open(path, 'r+b') as f:
+        f.write(b'XXXX')
+    with pytest.raises(ValueError):
+        HandRecordReader(path)
@@ -0,0 +1,213 @@
+import random
+
+import pytest
+
+from cardlib import *
+from handhistory import StackedDeck
+from pokerengine import *
+
+SUITS = {'h': Suit.Hearts, 's': Suit.Spades, 'c': Suit.Clubs, 'd': Suit.Diamonds}
+VALUES = {'T': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14}
+
+
+def codes(text):
+    """turns 'Ah Ks 2c' into card codes"""
+    return [card_code(VALUES.get(word[0]) or int(word[0]), SUITS[word[1]]) for word in text.split()]
+
+
+def stacked_hand(stacks, cards, big_blind=10):
+    """returns an engine dealing the given hole cards (two per player, in seat order) and board"""
+    players = [PlayerState("P{}".format(i + 1), money) for i, money in enumerate(stacks)]
+    engine = GameEngine(players, rng=0, big_blind=big_blind)
+    for player, money in zip(players, stacks):
+        player.total_money = money
+    engine.deck = StackedDeck(codes(cards))
+    engine.restart_game()
+    return engine, players
+
+
+def test_chips_are_conserved():
+    rng = random.Random(1)
+    for seats in range(2, MAX_SEATS + 1):
+        players = [PlayerState(str(i), rng.choice([500, 2000, 10000])) for i in range(seats)]
+        engine = GameEngine(players, rng=seats)
+        total = sum(player.total_money + player.total_bet_money for player in players)
+        for _ in range(200):
+            while engine.pot_money:
+                x = rng.random()
+                if x < 0.15:
+                    engine.fold_bet()
+                elif x < 0.35:
+                    engine.raise_bet(rng.choice([10, 100, 1000, 5000]))
+                else:
+                    engine.call_bet()
+                assert sum(player.total_money for player in players) + engine.pot_money == total
+                assert all(player.total_money >= 0 for player in players)
+            if engine.players_with_money() < 2:
+                break
+            engine.restart_game()
+
+
+def test_three_way_all_in_with_side_pots():
+    engine, players = stacked_hand([100, 300, 500], "Ah As Kh Ks Qh Qs 2c 7d 9h 4s 3c")
+    pots = []
+    engine.listener = lambda event, *args: event == 'reveal_all_cards' and pots.append(engine.side_pots())
+    engine.raise_bet(1000)  # the third seat acts first and goes all-in
+    engine.call_bet()  # the small blind calls all-in for 100
+    engine.call_bet()  # the big blind calls all-in for 300, the board is run out
+    # the main pot and one side pot between the two larger stacks; the uncalled rest of the largest went back
+    assert pots == [[(300, [0, 1, 2]), (400, [1, 2])]]
+    assert engine.pot_money == 0
+    assert len(engine.board) == 5
+    assert [player.total_money for player in players] == [300, 400, 200]
+
+
+def test_uncalled_bet_is_returned_not_won():
+    engine, players = stacked_hand([100, 5000], "Ah As Kh Ks 2c 7d 9h 4s 3c")
+    results, texts, messages = [], [], []
+    listeners = {'hand_result': results, 'text_changed': texts, 'game_message': messages}
+    engine.listener = lambda event, *args: event in listeners and listeners[event].append(args)
+    engine.call_bet()  # the small blind completes
+    engine.raise_bet(1000)
+    engine.call_bet()  # the small blind calls all-in for 100
+    assert results == [((0,), HandRank.get_one_pairs)]
+    assert ("The uncalled $910 goes back to P2",) in texts
+    assert "side pot" not in messages[0][0]
+    assert [player.total_money for player in players] == [200, 4900]
+
+
+def test_odd_chip_goes_to_the_first_seat():
+    # the board is a royal flush, so the two players left split the pot
+    engine, players = stacked_hand([1000, 1000, 1000], "2h 3d 2d 3h 4c 5c As Ks Qs Js Ts")
+    engine.call_bet()  # the third seat calls the big blind
+    engine.fold_bet()  # the small blind folds its 5
+    engine.call_bet()  # the big blind checks
+    assert engine.pot_money == 25
+    while engine.pot_money:
+        engine.call_bet()
+    assert [player.total_money for player in players] == [995, 1003, 1002]
+
+
+def test_big_blind_option():
+    engine, players = stacked_hand([1000, 1000], "2h 3d 2d 3h 4c 5c 9s 8s Js")
+    engine.call_bet()  # heads-up the small blind acts first and completes
+    assert not engine.board
+    assert engine.active_player()[0] == 1  # the big blind still has the option
+    engine.call_bet()  # and checks
+    assert len(engine.board) == 3
+    assert engine.active_player()[0] == 1  # the big blind acts first after the flop
+
+
+def test_raise_reopens_the_betting():
+    engine, players = stacked_hand([1000, 1000], "2h 3d 2d 3h 4c 5c 9s 8s Js")
+    engine.call_bet()
+    engine.raise_bet(20)  # the big blind raises with its option
+    assert not engine.board
+    assert engine.active_player()[0] == 0  # the small blind acts again
+    engine.call_bet()
+    assert len(engine.board) == 3
+    assert engine.pot_money == 60
+
+
+def test_money_changed_follows_the_turn_to_a_new_street():
+    engine, players = stacked_hand([1000, 1000], "2h 3d 2d 3h 4c 5c 9s 8s Js")
+    turns = []
+    engine.listener = lambda event, *args: event == 'money_changed' and turns.append(engine.active_player()[0])
+    engine.call_bet()
+    engine.call_bet()  # the big blind checks and the flop is dealt
+    assert len(engine.board) == 3
+    assert turns[-1] == engine.active_player()[0] == 1
+
+
+def state_fields(state):
+    """the contents of a GameState with the cards as codes, since cards compare by value only"""
+    players = tuple((tuple(card.code for card in values[0]),) + values[1:] for values in state.players)
+    return (players, state.seats, state.first_seat, tuple(card.code for card in state.board), state.deck,
+            state.position, state.counter, state.pot_money, state.high_bet, state.big_blind, state.small_blind)
+
+
+def random_action(engine, rng):
+    x = rng.random()
+    if x < 0.1:
+        return 'fold', 0
+    if x < 0.3:
+        return 'raise', rng.choice([10, 50, 200])
+    return 'call', 0
+
+
+def play(engine, action, amount):
+    if action == 'raise':
+        engine.raise_bet(amount)
+    else:
+        getattr(engine, action + '_bet')()
+
+
+def test_snapshot_apply_matches_engine():
+    rng = random.Random(4)
+    for seats in (2, 3, 6):
+        players = [PlayerState(str(i), 1000) for i in range(seats)]
+        engine = GameEngine(players, rng=seats)
+        for _ in range(30):
+            root = state = engine.snapshot()
+            actions = []
+            while engine.pot_money:
+                action = random_action(engine, rng)
+                play(engine, action[0], action[1])
+                state = state.apply(*action)
+                actions.append(action)
+                assert state_fields(state) == state_fields(engine.snapshot())
+                assert state.to_act() == engine.active_player()[0] or state.hand_over
+            final = state
+            for action in reversed(actions):  # undo back to the root
+                assert state.action == action
+                state = state.undo()
+            assert state is root and root.undo() is None
+            other = GameEngine([PlayerState(str(i), 1000) for i in range(seats)], rng=0)
+            other.restore(root)
+            assert state_fields(other.snapshot()) == state_fields(root)
+            for action in actions:
+                play(other, *action)
+            assert state_fields(other.snapshot()) == state_fields(final)
+            if engine.players_with_money() < 2:
+                break
+            engine.restart_game()
+
+
+def test_snapshot_sharing_stays_within_one_hand():
+    ace_of_hearts, ace_of_spades = (card_from_code(code) for code in codes("Ah As"))
+    assert ace_of_hearts == ace_of_spades  # so the players shared by apply() are only safe while the cards are dealt
+    engine, players = stacked_hand([1000, 1000], "Ah Kd As Kc 2c 7d 9h 4s 3c")
+    state = engine.snapshot()
+    while not state.hand_over:
+        child = state.apply('call')
+        for old, new in zip(state.players, child.players):
+            assert old is new or old != new
+            assert [card.code for card in new[0]] == [card.code for card in old[0]]  # the same cards all hand
+        assert child.deck is state.deck
+        state = child
+    with pytest.raises(ValueError):  # a chain of snapshots never reaches the next hand
+        state.apply('call')
+
+
+def test_restore_into_game_model():
+    pokermodel = pytest.importorskip('pokermodel')
+    for batching in (False, True):
+        playermodels = [pokermodel.PlayerModel(name, 1000) for name in ("P1", "P2", "P3")]
+        game = pokermodel.GameModel(playermodels, pokermodel.TableModel(), rng=5, batching=batching)
+        diffs = []
+        game.state_changed.connect(diffs.append)
+        game.call_bet()
+        state = game.snapshot()
+        while game.pot_money:
+            game.call_bet()
+        assert game.revealed
+        game.restore(state)
+        assert state_fields(game.snapshot()) == state_fields(state)
+        assert not game.revealed
+        for player, values in zip(playermodels, state.players):
+            assert [card.code for card in player.hand.cards] == [card.code for card in values[0]]
+        assert game.tablemodel.hand.cards is game.engine.board
+        assert bool(diffs) == batching
+        while game.pot_money:  # the restored hand plays on to the same showdown
+            game.call_bet()
+        assert game.revealed
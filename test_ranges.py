@@ -0,0 +1,64 @@
+import pytest
+
+from equity import exact_equity
+from ranges import *
+
+
+@pytest.mark.parametrize('text, hands', [
+    ('QQ+', {'AA': 6, 'KK': 6, 'QQ': 6}),
+    ('ATs+', {'AKs': 4, 'AQs': 4, 'AJs': 4, 'ATs': 4}),
+    ('A5s-A2s', {'A5s': 4, 'A4s': 4, 'A3s': 4, 'A2s': 4}),
+    ('99-66', {'99': 6, '88': 6, '77': 6, '66': 6}),
+    ('T9s-76s', {'T9s': 4, '98s': 4, '87s': 4, '76s': 4}),
+    ('AhKh', {'AKs': 1}),
+    ('KQ', {'KQs': 4, 'KQo': 12}),
+    ('QQ+, AKs AhKd', {'AA': 6, 'KK': 6, 'QQ': 6, 'AKs': 4, 'AKo': 1}),
+])
+def test_parse_range(text, hands):
+    assert parse_range(text).hands() == hands
+
+
+def test_parse_range_combo():
+    assert parse_range('AhKh').combos() == [tuple(parse_cards('AhKh'))]
+
+
+@pytest.mark.parametrize('text', ['AKx', 'AAs', 'AKs-QQ', 'A5s-K2s', 'AKs-AJo', 'Ah', 'AhAh', 'Zz'])
+def test_parse_range_errors(text):
+    with pytest.raises(ValueError):
+        parse_range(text)
+
+
+def reference_equity(hero, villain, board):
+    """the equity of hero against villain played out combo against combo with exact_equity"""
+    share = boards = 0
+    for hero_cards in hero.without(board).combos():
+        for villain_cards in villain.without(board + list(hero_cards)).combos():
+            result = exact_equity([list(hero_cards), list(villain_cards)], board)
+            share += result.wins[0] + 0.5 * result.ties[0]
+            boards += result.samples
+    return share / boards
+
+
+def test_range_equity_matches_combo_by_combo():
+    # the ranges share AA, so a hero combo also sits in the villain range
+    hero, villain = parse_range('AA, AKs'), parse_range('T9s-87s, 99, 55, AA')
+    board = parse_cards('Ks9s5h')
+    result = range_equity(hero, villain, board)
+    assert result.exact
+    assert result.equity() == pytest.approx(reference_equity(hero, villain, board), abs=1e-12)
+    ace_king = parse_cards('AhKh')
+    assert result.combo_equity(*ace_king) == pytest.approx(
+        reference_equity(Range.from_combos([ace_king]), villain, board), abs=1e-12)
+
+
+def test_range_equity_spot():
+    # checked against exact_equity combo by combo
+    result = range_equity('QQ+,AKs', 'T9s-76s,22+', parse_cards('Ks9s5h'))
+    assert result.equity() == pytest.approx(0.78105, abs=1e-5)
+
+
+def test_range_equity_blocked_ranges():
+    result = range_equity('AhAs', 'AdAc', parse_cards('AhKs2d'))
+    assert result.boards == 0 and result.equity() == 0.0
+    with pytest.raises(ValueError):
+        range_equity('AA', 'KK', parse_cards('Ks9s5h'), dead=parse_cards('Ks'))
@@ -0,0 +1,39 @@
+import json
+
+from tableserver import FRAME, Table
+
+
+class FakeClient:
+    """stands in for a connection: keeps the decoded messages sent to it"""
+
+    def __init__(self, seat):
+        self.seat = seat
+        self.messages = []
+
+    def send(self, data):
+        self.messages.append(json.loads(data[FRAME.size:]))
+
+
+def test_showdown_and_restart_in_one_batch():
+    table = Table(0, seed=7)
+    seats = [FakeClient(0), FakeClient(1)]
+    watcher = FakeClient(None)
+    table.clients += seats + [watcher]
+
+    diffs = []
+    while table.engine.pot_money:  # everyone calls to the showdown
+        active = table.engine.active_player()[0]
+        diffs.append(table.apply(seats[active], {'t': 'act', 'a': 'call'}))
+    shown = {str(i): [card.code for card in player.cards] for i, player in enumerate(table.players)}
+    diffs.append(table.apply(seats[0], {'t': 'act', 'a': 'restart'}))
+    dealt = {str(i): [card.code for card in player.cards] for i, player in enumerate(table.players)}
+    assert shown != dealt
+    table.broadcast(diffs)
+
+    showdown, restart = watcher.messages[-1]['diffs'][-2:]
+    assert showdown['hands'] == shown
+    assert 'hands' not in restart  # a watcher never sees the new deal
+    for client in seats:
+        showdown, restart = client.messages[-1]['diffs'][-2:]
+        assert showdown['hands'] == shown
+        assert restart['hands'] == {str(client.seat): dealt[str(client.seat)]}
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pokerengine import *
+from pokerbots import BOTS, make_bots, play_hand
+
+
+class BlindSchedule:
+    """The blind levels of a tournament: the big blind of each level, each played for a number of hands; the last
+    level lasts until the end"""
+
+    def __init__(self, big_blinds, hands_per_level=10):
+        self.big_blinds = list(big_blinds)
+        self.hands_per_level = hands_per_level
+
+    @classmethod
+    def geometric(cls, stack, levels=20, start=50, growth=1.5, hands_per_level=10):
+        """returns a schedule starting at stack / start big blinds and growing by a factor per level"""
+        first = max(stack // start, 2)
+        return cls([int(first * growth ** level) for level in range(levels)], hands_per_level)
+
+    def big_blind(self, hand):
+        """returns the big blind of a hand, counted from 0"""
+        return self.big_blinds[min(hand // self.hands_per_level, len(self.big_blinds) - 1)]
+
+
+def tournament_seed(seed, number):
+    """returns the seed of one tournament of a run, the same for every worker count and order"""
+    return random.Random("{}:{}".format(seed, number)).getrandbits(64)
+
+
+def play_tournament(number, seed, policies, stack, schedule, max_hands=10000):
+    """
+    plays one sit-and-go to the end: the blinds move round the table and grow by the schedule, and players without
+    money are eliminated. Players eliminated in the same hand finish in the order of their stacks before it
+
+    :param number: the tournament's number in its run
+    :param seed: the run's seed, see tournament_seed
+    :param policies: bot policy name per seat
+    :param max_hands: hands after which the remaining players are ranked by their stacks
+    :return: dictionary with 'tournament', 'seed', 'places' (seat index per place, first place first),
+             'hands' and 'actions'
+    """
+    own_seed = tournament_seed(seed, number)
+    rng = random.Random(own_seed)
+    bots = make_bots(policies, rng.getrandbits(64))
+    players = [PlayerState("Seat {}".format(i + 1), stack) for i in range(len(policies))]
+    engine = GameEngine(players, rng=rng.getrandbits(64), big_blind=schedule.big_blind(0))
+    out = []  # seat indices in the order of elimination
+    hands = actions = 0
+    while True:
+        before = [player.total_money + player.total_bet_money for player in players]  # blinds included
+        actions += play_hand(engine, bots)
+        hands += 1
+        busted = [i for i, player in enumerate(players) if player.total_money <= 0 and before[i] > 0]
+        out += sorted(busted, key=lambda i: before[i])
+        alive = [i for i, player in enumerate(players) if player.total_money > 0]
+        if len(alive) < 2 or hands >= max_hands:
+            break
+        engine.big_blind = schedule.big_blind(hands)
+        engine.small_blind = engine.big_blind // 2
+        engine.first_seat = (engine.seats[0] + 1) % len(players)  # the small blind moves on
+        engine.restart_game()
+    places = sorted(alive, key=lambda i: -players[i].total_money) + out[::-1]
+    return {'tournament': number, 'seed': own_seed, 'places': places, 'hands': hands, 'actions': actions}
+
+
+def _play_batch(numbers, seed, policies, stack, schedule, max_hands):
+    """worker: plays some tournaments and returns their results"""
+    return [play_tournament(number, seed, policies, stack, schedule, max_hands) for number in numbers]
+
+
+def run_tournaments(count, policies, stack=10000, schedule=None, seed=0, workers=None, batch=16, max_hands=10000):
+    """
+    plays a number of tournaments over a process pool, yielding each result as its batch completes. Every
+    tournament has its own seed derived from the run's seed, so its result does not depend on the workers
+
+    :param policies: bot policy name per seat
+    :param schedule: a BlindSchedule, BlindSchedule.geometric(stack) by default
+    :param workers: number of processes, defaults to the number of cores. 1 plays in this process
+    :param batch: tournaments per task sent to a worker
+    """
+    schedule = schedule or BlindSchedule.geometric(stack)
+    workers = workers or os.cpu_count() or 1
+    batches = [range(start, min(start + batch, count)) for start in range(0, count, batch)]
+    if workers == 1:
+        for numbers in batches:
+            yield from _play_batch(numbers, seed, policies, stack, schedule, max_hands)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_play_batch, numbers, seed, policies, stack, schedule, max_hands)
+                   for numbers in batches]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+class TournamentStats:
+    """Finish position counts per seat and the throughput of a run"""
+
+    def __init__(self, seats):
+        self.positions = [[0] * seats for _ in range(seats)]  # positions[seat][place]
+        self.tournaments = 0
+        self.hands = 0
+        self.actions = 0
+        self.start = time.perf_counter()
+
+    def add(self, result):
+        for place, seat in enumerate(result['places']):
+            self.positions[seat][place] += 1
+        self.tournaments += 1
+        self.hands += result['hands']
+        self.actions += result['actions']
+
+    def distribution(self, seat):
+        """returns the share of the tournaments a seat finished in each place"""
+        return [count / self.tournaments if self.tournaments else 0.0 for count in self.positions[seat]]
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        return {'tournaments': self.tournaments, 'hands': self.hands, 'actions': self.actions, 'seconds': elapsed,
+                'hands_per_second': self.hands / elapsed if elapsed else 0.0,
+                'tournaments_per_second': self.tournaments / elapsed if elapsed else 0.0,
+                'positions': [self.distribution(seat) for seat in range(len(self.positions))]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate sit-and-go tournaments between bots")
+    parser.add_argument('policies', nargs='+', choices=sorted(BOTS), help="bot policy per seat, 2 to 10 seats")
+    parser.add_argument('-n', '--tournaments', type=int, default=1000)
+    parser.add_argument('--stack', type=int, default=10000)
+    parser.add_argument('--hands-per-level', type=int, default=10)
+    parser.add_argument('--growth', type=float, default=1.5, help="big blind growth per level")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="number of processes")
+    parser.add_argument('--results', metavar='FILE', help="stream each result as a JSON line ('-' for stdout)")
+    args = parser.parse_args(argv)
+    if not 2 <= len(args.policies) <= MAX_SEATS:
+        parser.error("a table has 2 to {} seats".format(MAX_SEATS))
+
+    schedule = BlindSchedule.geometric(args.stack, growth=args.growth, hands_per_level=args.hands_per_level)
+    stats = TournamentStats(len(args.policies))
+    out = None if args.results is None else sys.stdout if args.results == '-' else open(args.results, 'w')
+    try:
+        for result in run_tournaments(args.tournaments, args.policies, args.stack, schedule, args.seed, args.workers):
+            stats.add(result)
+            if out is not None:
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+    finally:
+        if out not in (None, sys.stdout):
+            out.close()
+    summary = stats.summary()
+    print("{} tournaments, {} hands in {:.1f} s: {:.0f} hands/s".format(
+        summary['tournaments'], summary['hands'], summary['seconds'], summary['hands_per_second']), file=sys.stderr)
+    for seat, policy in enumerate(args.policies):
+        print("seat {} {:10s} {}".format(seat + 1, policy, " ".join(
+            "{:.3f}".format(share) for share in summary['positions'][seat])), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())